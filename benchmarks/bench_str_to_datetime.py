@@ -0,0 +1,57 @@
+"""Compare str_to_datetime with the strptime only parser it replaced.
+
+Run from the repository root:
+python benchmarks/bench_str_to_datetime.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pywincc import helper  # noqa: E402
+
+ROWS = 100000
+FORMATS = {'date': '%Y-%m-%d',
+           'minutes': '%Y-%m-%d %H:%M',
+           'seconds': '%Y-%m-%d %H:%M:%S',
+           'milliseconds': '%Y-%m-%d %H:%M:%S.%f'}
+
+
+def column(fmt):
+    begin = datetime(2015, 8, 24)
+    # Distinct values, so the memo does not help
+    step = timedelta(days=1) if fmt == '%Y-%m-%d' else \
+        timedelta(minutes=1) if fmt == '%Y-%m-%d %H:%M' else \
+        timedelta(seconds=1, milliseconds=1)
+    strings = [(begin + i * step)
+               .strftime(fmt) for i in range(ROWS)]
+    if fmt.endswith('%f'):
+        strings = [s[:-3] for s in strings]
+    return strings
+
+
+def bench(name, func, strings):
+    helper._memo.clear()
+    seconds = min(timeit.repeat(lambda: func(strings), number=1, repeat=3))
+    print("{0:<28} {1:8.3f} s {2:8.2f} us/row".format(
+        name, seconds, seconds / len(strings) * 1e6))
+
+
+def main():
+    for label, fmt in sorted(FORMATS.items()):
+        strings = column(fmt)
+        print("{0} rows, {1}".format(len(strings), label))
+        bench('strptime_datetime', lambda column: [
+            helper.strptime_datetime(s) for s in column], strings)
+        bench('str_to_datetime', lambda column: [
+            helper.str_to_datetime(s) for s in column], strings)
+        bench('str_to_datetime (repeated)', lambda column: [
+            helper.str_to_datetime(s) for s in column[:100] * 1000], strings)
+        bench('DatetimeParser', lambda column: map(
+            helper.DatetimeParser(), column), strings)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,87 @@
-from collections import namedtuple
+from array import array
+from collections import namedtuple, defaultdict, Counter
+from datetime import datetime, timedelta
 from helper import local_time_to_utc, datetime_to_str_without_ms,\
-    str_to_datetime
+    str_to_datetime, datetime_to_str, DatetimeParser
 
 Alarm = namedtuple('Alarm',
                    'id state datetime classname priority location text')
 
 
+EPOCH = datetime(1970, 1, 1)
+
+
+def _new_positions():
+    return array('i')
+
+
 class AlarmRecord():
-    """Class to hold alarm records returned by a WinCC mssql query"""
+    """Class to hold alarm records returned by a WinCC mssql query
+
+    Counts by (state, priority) and positions by state, priority, location
+    and id are indexed as alarms are pushed, so counts and filters do not
+    rescan the alarms. Alarms appended to self.alarms directly are indexed
+    on the next count or filter.
+    """
 
     state_dict = {1: 'COME', 2: 'GO  ', 3: 'ACK ', 16: 'GACK'}
+    text_state_dict = dict((text, state) for state, text in state_dict.items())
 
     def __init__(self, alarms=None):
         if alarms:
             self.alarms = alarms
         else:
             self.alarms = []
+        self._reset_index()
+
+    def __setstate__(self, state):
+        # Records pickled before indexing existed are indexed when used
+        self.__dict__.update(state)
+        if '_indexed' not in state:
+            self._reset_index()
+
+    def _reset_index(self):
+        self._counts = Counter()
+        self._location_counts = Counter()
+        self._positions = {'state': defaultdict(_new_positions),
+                           'priority': defaultdict(_new_positions),
+                           'location': defaultdict(_new_positions),
+                           'id': defaultdict(_new_positions)}
+        self._indexed = 0
 
     def push(self, alarm):
         """Push a new Alarm to alarms list.
         Alarm must be of type alarm.Alarm.
         """
         if isinstance(alarm, Alarm):
+            self._update_index()
             self.alarms.append(alarm)
+            self._index(self._indexed, alarm)
+            self._indexed += 1
         else:
             raise TypeError("AlarmRecord: Expected type 'Alarm'. Got type "
                             "{type}.".format(type=type(alarm)))
 
+    def _index(self, position, alarm):
+        self._counts[(alarm.state, alarm.priority)] += 1
+        self._location_counts[(alarm.state, alarm.location)] += 1
+        positions = self._positions
+        positions['state'][alarm.state].append(position)
+        positions['priority'][alarm.priority].append(position)
+        positions['location'][alarm.location].append(position)
+        positions['id'][alarm.id].append(position)
+
+    def _update_index(self):
+        """Index alarms not added by push."""
+        for position in range(self._indexed, len(self.alarms)):
+            self._index(position, self.alarms[position])
+        self._indexed = len(self.alarms)
+
+    def _filter(self, column, key):
+        self._update_index()
+        positions = self._positions[column].get(key, [])
+        return [self.alarms[position] for position in positions]
+
     def __unicode__(self):
         output = ""
         for alarm in self.alarms:
@@ -56,15 +111,29 @@ class AlarmRecord():
 
     def count_come(self):
         """Return number of alarms with state 'COME' in record"""
-        return len([1 for a in self.alarms if a.state == 1])
+        self._update_index()
+        return len(self._positions['state'].get(1, []))
 
     def count_by_state_and_priority(self, state, priority):
         """Counts all alarms in record that fit given state and priority
         state = [1, 2, 3]
         priority = [u'WARNING', u'ERROR_DAY', u'ERROR_NOW', u'STOP_ALL']
         """
-        return len([1 for a in self.alarms
-                    if (a.priority == priority and a.state == state)])
+        self._update_index()
+        return self._counts[(state, priority)]
+
+    def count_by_location(self, state=1):
+        """Return dict of location: number of alarms with given state.
+
+        >>> record = AlarmRecord()
+        >>> for i, location in enumerate([u'PUMP', u'MILL', u'PUMP']):
+        ...     record.push(Alarm(i, 1, '', '', u'WARNING', location, u''))
+        >>> sorted(record.count_by_location().items())
+        [(u'MILL', 1), (u'PUMP', 2)]
+        """
+        self._update_index()
+        return dict((location, count) for (alarm_state, location), count
+                    in self._location_counts.items() if alarm_state == state)
 
     def count_come_warning(self):
         """Return number of alarms of state 'COME' and priority 'WARNING'."""
@@ -98,13 +167,14 @@ class AlarmRecord():
 
     def count_grouped_to_html(self):
         """Return a string that holds a HTML representation of grouped alarm priorities in record."""
+        count = self.get_count_grouped()
         html = u"<table>\n"
         html += u"<tr><th>Priority</th><th>Count</th></tr>"
-        html += u"<tr><td>WARNING</td><td>{count}</td></tr>".format(count=self.count_come_warning())
-        html += u"<tr><td>ERROR_DAY</td><td>{count}</td></tr>".format(count=self.count_come_error_day())
-        html += u"<tr><td>ERROR_NOW</td><td>{count}</td></tr>".format(count=self.count_come_error_now())
-        html += u"<tr><td>STOP_ALL</td><td>{count}</td></tr>".format(count=self.count_come_stop_all())
-        html += u"<tr><td>SUM</td><td>{count}</td></tr>".format(count=self.count_come())
+        html += u"<tr><td>WARNING</td><td>{count}</td></tr>".format(count=count['warning'])
+        html += u"<tr><td>ERROR_DAY</td><td>{count}</td></tr>".format(count=count['error_day'])
+        html += u"<tr><td>ERROR_NOW</td><td>{count}</td></tr>".format(count=count['error_now'])
+        html += u"<tr><td>STOP_ALL</td><td>{count}</td></tr>".format(count=count['stop_all'])
+        html += u"<tr><td>SUM</td><td>{count}</td></tr>".format(count=count['sum'])
         html += u"</table>\n"
         return html
 
@@ -118,22 +188,145 @@ class AlarmRecord():
 
     def filter_by_priority(self, priority):
         """Return a filtered list of alarms."""
-        return [alarm for alarm in self.alarms if alarm.priority == priority]
+        return self._filter('priority', priority)
 
     def filter_by_priorities(self, priorities):
         """Return a filters list of alarms. Expects a list of priorities."""
-        return [alarm for prio in priorities for alarm in self.alarms
-                if alarm.priority == prio]
+        return [alarm for prio in priorities
+                for alarm in self.filter_by_priority(prio)]
 
     def filter_by_state(self, state):
-        """Return a filtered list of alarms."""
-        return [alarm for alarm in self.alarms
-                if self.alarm_state_as_text(alarm) == state]
+        """Return a filtered list of alarms. Expects a state as text
+        e.g. 'COME' or the state number, also as text e.g. '5'."""
+        if state in self.text_state_dict:
+            state = self.text_state_dict[state]
+        else:
+            try:
+                state = int(state)
+            except (TypeError, ValueError):
+                return []
+        return self._filter('state', state)
 
     def filter_by_states(self, states):
         """Return a filtered list of alarms. Expects a list of states"""
-        return [alarm for state in states for alarm in self.alarms
-                if self.alarm_state_as_text(alarm) == state]
+        return [alarm for state in states
+                for alarm in self.filter_by_state(state)]
+
+    def filter_by_location(self, location):
+        """Return a filtered list of alarms."""
+        return self._filter('location', location)
+
+    def filter_by_id(self, msg_id):
+        """Return a filtered list of alarms with MsgNr msg_id."""
+        return self._filter('id', msg_id)
+
+
+class StringPool():
+    """Interns strings as integer codes: values[code] is the string."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class AlarmColumns():
+    """List like storage of Alarm tuples as columns.
+
+    Ids, states and local times (epoch ms of the wall clock time) are typed
+    arrays. classname, priority, location and text are codes into
+    StringPools, as a plant has only a few hundred distinct alarm texts.
+    Indexing and iteration rebuild Alarm tuples.
+
+    >>> columns = AlarmColumns()
+    >>> columns.append(Alarm(7, 1, '2015-08-24 10:48:10.483', u'Alarm',
+    ...                      u'WARNING', u'PUMP', u'Overload'))
+    >>> columns[0]
+    Alarm(id=7, state=1, datetime='2015-08-24 10:48:10.483', classname=u'Alarm', priority=u'WARNING', location=u'PUMP', text=u'Overload')
+    """
+
+    categories = ('classname', 'priority', 'location', 'text')
+
+    def __init__(self):
+        self.ids = array('l')
+        self.states = array('H')
+        self.times = array('d')
+        self.codes = dict((name, array('I')) for name in self.categories)
+        self.pools = dict((name, StringPool()) for name in self.categories)
+        # Times that are not datetime strings, by position
+        self.raw_times = {}
+        self._parse = DatetimeParser()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, alarm):
+        position = len(self.ids)
+        self.ids.append(alarm.id)
+        self.states.append(alarm.state)
+        time = None
+        if alarm.datetime:
+            try:
+                time = self._parse(alarm.datetime)
+            except (TypeError, ValueError):
+                pass
+        if time is None:
+            self.times.append(0.0)
+            self.raw_times[position] = alarm.datetime
+        else:
+            delta = time - EPOCH
+            self.times.append(delta.days * 86400000 + delta.seconds * 1000 +
+                              delta.microseconds // 1000)
+        for name in self.categories:
+            self.codes[name].append(self.pools[name].code(getattr(alarm,
+                                                                  name)))
+
+    def extend(self, alarms):
+        for alarm in alarms:
+            self.append(alarm)
+
+    def _alarm(self, position):
+        time = self.raw_times.get(position)
+        if time is None and position not in self.raw_times:
+            time = datetime_to_str(
+                EPOCH + timedelta(milliseconds=self.times[position]))
+        pools, codes = self.pools, self.codes
+        return Alarm(self.ids[position], self.states[position], time,
+                     *[pools[name].values[codes[name][position]]
+                       for name in self.categories])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._alarm(position)
+                    for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("AlarmColumns index out of range")
+        return self._alarm(index)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._alarm(position)
+
+
+class ColumnarAlarmRecord(AlarmRecord):
+    """AlarmRecord storing its alarms in AlarmColumns. Uses a fraction of
+    the memory for long time ranges; iteration still yields Alarm tuples.
+    """
+
+    def __init__(self, alarms=None):
+        AlarmRecord.__init__(self)
+        self.alarms = AlarmColumns()
+        for alarm in alarms or []:
+            self.push(alarm)
 
 
 def alarm_state_as_text(alarm_state):
@@ -0,0 +1,242 @@
+"""Local archive of WinCC alarms and operator messages.
+
+Rows of ALGVIEWDEU are copied into a SQLite file, one set of rows per
+host. A sync only queries rows newer than the newest stored DateTime (the
+high watermark). The query starts overlap seconds before the watermark so
+rows committed late or with equal timestamps are not missed; rows already
+stored are ignored.
+
+Reports can then be generated from the archive (alarm_record(),
+operator_messages_record()) instead of querying the server.
+
+Usage:
+archive = AlarmArchive()
+w = wincc(host, database)
+w.connect()
+archive.sync(w, host, begin=datetime(2015, 8, 1))
+alarms = archive.alarm_record(host, '2015-08-24', '2015-08-25')
+"""
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from .alarm import Alarm, AlarmRecord, ColumnarAlarmRecord, \
+    alarm_query_builder
+from .operator_messages import OperatorMessage, OperatorMessageRecord,\
+    om_query_builder
+from .helper import datetime_to_str, str_to_datetime, local_time_to_utc, \
+    DatetimeParser
+from .tzconvert import localize
+
+# MsgNr of operator messages, see alarm_query_builder and om_query_builder
+OPERATOR_MESSAGE_MSGNR = 12508141
+
+# Columns of ALGVIEWDEU needed for Alarm and OperatorMessage
+COLUMNS = ['MsgNr', 'State', 'DateTime', 'Classname', 'Typename', 'Username',
+           'Text1', 'Text2', 'PText1', 'PText2', 'PText3', 'PText4',
+           'PValue5', 'PValue6', 'PValue7']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (host TEXT, {columns},
+    UNIQUE (host, MsgNr, State, DateTime, PText1));
+CREATE INDEX IF NOT EXISTS messages_host_datetime ON messages (host, DateTime);
+CREATE TABLE IF NOT EXISTS sync_state (host TEXT, kind TEXT, begin TEXT,
+    watermark TEXT, synced TEXT, PRIMARY KEY (host, kind));
+""".format(columns=', '.join(COLUMNS))
+
+# kind: (query builder, SQL condition selecting the kind)
+KINDS = [('alarms', alarm_query_builder,
+          'MsgNr < {0}'.format(OPERATOR_MESSAGE_MSGNR)),
+         ('operator_messages', om_query_builder,
+          'MsgNr = {0}'.format(OPERATOR_MESSAGE_MSGNR))]
+
+
+class AlarmArchiveException(Exception):
+    def __init__(self, message=''):
+        super(AlarmArchiveException, self).__init__(message)
+
+
+class AlarmArchive():
+    """SQLite archive of alarms and operator messages of several hosts.
+    DateTime is stored in UTC as "2015-08-21 10:22:10.483".
+    """
+
+    filename = './alarm_archive.sqlite'
+    # Seconds to query before the high watermark
+    overlap = 300
+
+    def __init__(self, filename=None, overlap=None):
+        if filename is not None:
+            self.filename = filename
+        if overlap is not None:
+            self.overlap = overlap
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.filename, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _key(self, host):
+        return host.lower()
+
+    def get_state(self, host, kind):
+        """Return dict with begin and watermark (UTC datetimes) of kind
+        'alarms' or 'operator_messages', or None if never synced."""
+        conn = self._connect()
+        try:
+            rec = conn.execute("SELECT begin, watermark FROM sync_state "
+                               "WHERE host = ? AND kind = ?",
+                               (self._key(host), kind)).fetchone()
+        finally:
+            conn.close()
+        if rec is None:
+            return None
+        return {'begin': str_to_datetime(rec['begin']),
+                'watermark': str_to_datetime(rec['watermark'])}
+
+    def _set_state(self, conn, host, kind, begin, watermark, synced):
+        conn.execute("INSERT OR REPLACE INTO sync_state VALUES "
+                     "(?, ?, ?, ?, ?)",
+                     (self._key(host), kind, datetime_to_str(begin),
+                      datetime_to_str(watermark), datetime_to_str(synced)))
+
+    def _fetch(self, w, host, query):
+        """Execute query on w and insert the rows. Return number of rows
+        read and newest DateTime read (or None)."""
+        w.execute(query)
+        num_rows, newest = 0, None
+        key = self._key(host)
+        insert = ("INSERT OR IGNORE INTO messages VALUES ({0})"
+                  .format(', '.join('?' * (len(COLUMNS) + 1))))
+        for rows in w.iter_batches():
+            values = []
+            for rec in rows:
+                row = [key]
+                for name in COLUMNS:
+                    value = rec[name]
+                    if name == 'DateTime':
+                        newest = value if newest is None else max(newest,
+                                                                   value)
+                        value = datetime_to_str(value)
+                    elif name == 'PText1' and value is None:
+                        # NULLs are never equal in the UNIQUE constraint
+                        value = u''
+                    row.append(value)
+                values.append(row)
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany(insert, values)
+                finally:
+                    conn.close()
+            num_rows += len(rows)
+        return num_rows, newest
+
+    def sync(self, w, host, begin=None, now=None):
+        """Copy new rows from host into the archive using the connected
+        wincc object w. Returns number of rows read.
+
+        begin (naive UTC datetime) is where the first sync of a host starts.
+        If begin is before what is already archived, the missing time range
+        is fetched as well.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        overlap = timedelta(seconds=self.overlap)
+        total = 0
+        for kind, query_builder, _ in KINDS:
+            state = self.get_state(host, kind)
+            ranges = []
+            if state is None:
+                if begin is None:
+                    raise AlarmArchiveException(
+                        "First sync of {0} needs a begin time.".format(host))
+                state = {'begin': begin, 'watermark': begin}
+                ranges.append((begin, ''))
+            else:
+                if begin is not None and begin < state['begin']:
+                    ranges.append((begin, state['begin'] + overlap))
+                    state['begin'] = begin
+                ranges.append((state['watermark'] - overlap, ''))
+            for r_begin, r_end in ranges:
+                logging.info("Syncing %s of %s from %s.", kind, host,
+                             r_begin)
+                num_rows, newest = self._fetch(
+                    w, host, query_builder(r_begin, r_end, '', True))
+                total += num_rows
+                if newest is not None and r_end == '':
+                    state['watermark'] = max(state['watermark'], newest)
+            with self._lock:
+                conn = self._connect()
+                try:
+                    with conn:
+                        self._set_state(conn, host, kind, state['begin'],
+                                        state['watermark'], now)
+                finally:
+                    conn.close()
+        return total
+
+    def _select(self, host, kind, begin_time, end_time, utc):
+        """Return rows of kind from begin_time (inclusive) to end_time
+        (exclusive)."""
+        condition = dict((k, c) for k, _, c in KINDS)[kind]
+        begin = str_to_datetime(begin_time)
+        if not utc:
+            begin = local_time_to_utc(begin)
+        query = ("SELECT * FROM messages WHERE host = ? AND {0} AND "
+                 "DateTime >= ?".format(condition))
+        params = [self._key(host), datetime_to_str(begin)]
+        if end_time != '':
+            end = str_to_datetime(end_time)
+            if not utc:
+                end = local_time_to_utc(end)
+            query += " AND DateTime < ?"
+            params.append(datetime_to_str(end))
+        query += " ORDER BY DateTime"
+        state = self.get_state(host, kind)
+        if state is None or begin.replace(tzinfo=None) < state['begin']:
+            logging.warning("Archive of %s does not cover %s since %s.",
+                            host, kind, begin_time)
+        conn = self._connect()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    def alarm_record(self, host, begin_time, end_time='', utc=False,
+                     columnar=False):
+        """Return archived alarms of host as AlarmRecord. Times are
+        interpreted and returned like wincc.create_alarm_record does."""
+        alarms = ColumnarAlarmRecord() if columnar else AlarmRecord()
+        rows = self._select(host, 'alarms', begin_time, end_time, utc)
+        parse = DatetimeParser()
+        local_times = localize([parse(rec['DateTime']) for rec in rows])
+        for rec, local_time in zip(rows, local_times):
+            alarms.push(Alarm(rec['MsgNr'], rec['State'],
+                              datetime_to_str(local_time), rec['Classname'],
+                              rec['Typename'], rec['Text2'], rec['Text1']))
+        return alarms
+
+    def operator_messages_record(self, host, begin_time, end_time='',
+                                 utc=False):
+        """Return archived operator messages of host as
+        OperatorMessageRecord."""
+        operator_messages = OperatorMessageRecord()
+        rows = self._select(host, 'operator_messages', begin_time, end_time,
+                            utc)
+        parse = DatetimeParser()
+        local_times = localize([parse(rec['DateTime']) for rec in rows])
+        for rec, local_time in zip(rows, local_times):
+            operator_messages.push(
+                OperatorMessage(datetime_to_str(local_time), rec['PText1'],
+                                rec['PText4'], rec['PText2'], rec['PText3'],
+                                rec['Username'], rec['PValue6'],
+                                rec['PValue5'], rec['PValue7']))
+        return operator_messages
@@ -0,0 +1,103 @@
+"""Adaptive packing of tagids into multi-tag TAG:R queries.
+
+One query per tagid pays the query overhead for every tag, one query for
+all tagids serializes everything on one connection. A BatchPlanner packs
+tagids into batches (TAG:R,(a;b;c)) and learns per host which batch size
+gives the most rows per second: it starts at initial_size, tries the
+neighbouring sizes of the best size seen so far and then sticks with the
+best.
+
+Usage:
+planner = get_batch_planner(host)
+size = planner.batch_size()
+planner.observe(size, rows, duration)
+"""
+import logging
+import threading
+
+batch_config = {'workers': 4, 'initial_size': 8,
+                'sizes': (1, 2, 4, 8, 16, 32, 64)}
+
+_planners = {}
+_planners_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Set batching defaults e.g. configure(workers=8).
+    Planners of hosts already queried are not changed.
+    """
+    for key in kwargs:
+        if key not in batch_config:
+            raise KeyError("Unknown batching option {0}.".format(key))
+    batch_config.update(kwargs)
+
+
+class BatchPlanner():
+    """Chooses the number of tagids per query from observed rows/second.
+    Thread safe.
+    """
+
+    # Weight of a new observation in the smoothed rate
+    alpha = 0.3
+
+    def __init__(self, sizes=None, initial_size=None):
+        self.sizes = sorted(sizes or batch_config['sizes'])
+        initial_size = initial_size or batch_config['initial_size']
+        self.initial_size = min(self.sizes,
+                                key=lambda size: abs(size - initial_size))
+        self.rates = {}
+        self._lock = threading.Lock()
+
+    def batch_size(self):
+        """Return the batch size to use for the next query."""
+        with self._lock:
+            if not self.rates:
+                return self.initial_size
+            best = max(self.rates, key=self.rates.get)
+            i = self.sizes.index(best)
+            for j in (i + 1, i - 1):
+                if 0 <= j < len(self.sizes) and self.sizes[j] not in self.rates:
+                    return self.sizes[j]
+            return best
+
+    def observe(self, size, rows, duration):
+        """Record that a batch of size tagids returned rows in duration
+        seconds. Partial batches count for the nearest planned size."""
+        rate = rows / max(duration, 0.001)
+        size = min(self.sizes, key=lambda planned: abs(planned - size))
+        with self._lock:
+            if size in self.rates:
+                rate = (1 - self.alpha) * self.rates[size] + self.alpha * rate
+            self.rates[size] = rate
+        logging.debug("Batch of %s tags: %s rows in %.3f s", size, rows,
+                      duration)
+
+
+def get_batch_planner(host):
+    """Return the BatchPlanner of host. Create it if necessary."""
+    with _planners_lock:
+        planner = _planners.get(host.lower())
+        if planner is None:
+            planner = BatchPlanner()
+            _planners[host.lower()] = planner
+        return planner
+
+
+class TagidQueue():
+    """Hands out consecutive batches of tagids. Thread safe."""
+
+    def __init__(self, tagids):
+        self.tagids = list(tagids)
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def next_batch(self, size):
+        """Return list of up to size tagids, empty if all are handed out."""
+        with self._lock:
+            batch = self.tagids[self.position:self.position + size]
+            self.position += len(batch)
+            return batch
+
+    def stop(self):
+        with self._lock:
+            self.position = len(self.tagids)
@@ -0,0 +1,134 @@
+"""Split long TAG:R queries into time chunks fetched concurrently.
+
+A query over months of raw values is one long running query on one
+connection. Instead the time range is handed out in chunks to several
+worker threads, each fetching its chunk over its own (pooled) connection.
+The number of concurrent queries per host is bounded by a semaphore
+shared by all callers.
+
+Chunk spans adapt to the observed fetch speed: each finished chunk moves
+the span towards what would have taken target_duration seconds.
+
+Usage:
+planner = ChunkPlanner(begin, end, timestep=3600)
+chunk = planner.next_chunk()  # (index, begin, end) or None
+planner.observe(chunk, rows, duration)
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from .tag import normalize_timestep
+
+# min_range: shorter ranges are fetched with a single query
+chunk_config = {'connections': 4, 'min_range': 7 * 86400,
+                'initial_span': 86400, 'min_span': 600,
+                'max_span': 31 * 86400, 'target_duration': 5.0}
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Set chunking defaults e.g. configure(connections=8).
+    Semaphores of hosts already queried are not changed.
+    """
+    for key in kwargs:
+        if key not in chunk_config:
+            raise KeyError("Unknown chunking option {0}.".format(key))
+    chunk_config.update(kwargs)
+
+
+def host_semaphore(host):
+    """Return the semaphore bounding concurrent chunk queries to host."""
+    with _semaphores_lock:
+        semaphore = _semaphores.get(host.lower())
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                chunk_config['connections'])
+            _semaphores[host.lower()] = semaphore
+        return semaphore
+
+
+class ChunkPlanner():
+    """Hands out consecutive (index, begin, end) chunks of [begin, end).
+    Thread safe. Chunk boundaries are multiples of timestep after begin,
+    so TIMESTEP intervals are the same as for one query over the range.
+    """
+
+    def __init__(self, begin, end, timestep=0, span=None, min_span=None,
+                 max_span=None, target_duration=None):
+        self.begin = begin
+        self.end = end
+        self.step = normalize_timestep(timestep)
+        self.min_span = self._align(min_span or chunk_config['min_span'])
+        self.max_span = self._align(max_span or chunk_config['max_span'])
+        self.span = self._clamp(span or chunk_config['initial_span'])
+        self.target_duration = (target_duration or
+                                chunk_config['target_duration'])
+        self.position = begin
+        self.index = 0
+        self._lock = threading.Lock()
+
+    def _align(self, seconds):
+        """Round seconds down to a multiple of timestep (at least one)."""
+        if not self.step:
+            return int(seconds)
+        return max(self.step, int(seconds) // self.step * self.step)
+
+    def _clamp(self, seconds):
+        return min(self.max_span, max(self.min_span, self._align(seconds)))
+
+    def next_chunk(self):
+        """Return next (index, begin, end) or None if the range is done."""
+        with self._lock:
+            if self.position >= self.end:
+                return None
+            begin = self.position
+            end = min(self.end, begin + timedelta(seconds=self.span))
+            chunk = (self.index, begin, end)
+            self.position = end
+            self.index += 1
+            return chunk
+
+    def stop(self):
+        """Hand out no more chunks."""
+        with self._lock:
+            self.position = self.end
+
+    def observe(self, chunk, rows, duration):
+        """Adapt the span to how long fetching rows of chunk took."""
+        index, begin, end = chunk
+        seconds = (end - begin).total_seconds()
+        with self._lock:
+            if not rows:
+                span = self.span * 2
+            else:
+                # Span that would have taken target_duration at this speed
+                span = seconds * self.target_duration / max(duration, 0.001)
+                span = (self.span + span) / 2
+            self.span = self._clamp(span)
+        logging.debug("Chunk %s: %s rows in %.3f s, next span %s s", index,
+                      rows, duration, self.span)
+
+
+def merge_chunks(chunks):
+    """Merge per chunk results in chunk order.
+
+    chunks is a list of dicts tagid -> list of (time, value), ordered by
+    chunk. Chunks do not overlap, so all values are kept, also several
+    values with the same time.
+
+    >>> merge_chunks([{1: [(1, 1.0), (2, 2.0)]}, {1: [(3, 3.0), (3, 4.0)]}])
+    {1: [(1, 1.0), (2, 2.0), (3, 3.0), (3, 4.0)]}
+    """
+    merged = {}
+    for chunk in chunks:
+        for tagid, rows in chunk.items():
+            merged.setdefault(tagid, []).extend(rows)
+    return merged
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
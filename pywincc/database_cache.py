@@ -0,0 +1,97 @@
+"""Persistent cache for resolved WinCC database names.
+
+Resolving the runtime or config database name means an extra SQLOLEDB.1
+connection and an 'EXEC sp_databases'. Resolved names are stored per host
+in a small JSON file and reused until they expire or a connect with the
+cached name fails.
+"""
+import json
+import logging
+import os
+import threading
+from time import time
+
+from .helper import atomic_write, user_cache_path
+
+
+class DatabaseNameCache():
+    """Host keyed store of resolved database names.
+
+    kind is 'runtime' or 'config'. Entries older than ttl seconds are
+    ignored, so a WinCC database rollover is picked up eventually.
+    The file defaults to database_names.json in the per user cache
+    directory (see helper.user_cache_path).
+    """
+
+    filename = None
+    ttl = 24 * 3600
+
+    def __init__(self, filename=None, ttl=None):
+        if filename is not None:
+            self.filename = filename
+        if ttl is not None:
+            self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def path(self):
+        """Return the cache file name. The default is resolved on first
+        use, so importing wincc creates no directories."""
+        if self.filename is None:
+            self.filename = user_cache_path('database_names.json')
+        return self.filename
+
+    def _key(self, host):
+        return host.lower()
+
+    def load(self):
+        """Return cache content as dict. Missing or broken file is empty."""
+        try:
+            with open(self.path(), 'rb') as fh:
+                return json.loads(fh.read().decode('utf-8'))
+        except (IOError, OSError, ValueError) as e:
+            if self.filename and os.path.exists(self.filename):
+                logging.warning("Could not read database name cache %s: %s",
+                                self.filename, e)
+            return {}
+
+    def save(self, entries):
+        try:
+            atomic_write(self.path(),
+                         json.dumps(entries, indent=2).encode('utf-8'))
+        except (IOError, OSError) as e:
+            logging.warning("Could not write database name cache %s: %s",
+                            self.filename, e)
+
+    def get(self, host, kind='runtime'):
+        """Return cached database name or None if missing or expired."""
+        entry = self.load().get(self._key(host), {}).get(kind)
+        if not entry:
+            return None
+        if time() - entry['resolved'] > self.ttl:
+            logging.debug("Cached %s database name for %s expired.", kind,
+                          host)
+            return None
+        logging.debug("Using cached %s database name %s for %s.", kind,
+                      entry['name'], host)
+        return entry['name']
+
+    def set(self, host, kind, name):
+        with self._lock:
+            entries = self.load()
+            entries.setdefault(self._key(host), {})[kind] = {
+                'name': name, 'resolved': time()}
+            self.save(entries)
+
+    def invalidate(self, host, kind=None):
+        """Forget cached name(s) for host. All kinds if kind is None."""
+        with self._lock:
+            entries = self.load()
+            key = self._key(host)
+            if key not in entries:
+                return
+            if kind is None:
+                del entries[key]
+            else:
+                entries[key].pop(kind, None)
+            logging.info("Invalidated cached database name(s) for %s.", host)
+            self.save(entries)
@@ -0,0 +1,256 @@
+"""Database driver backends for mssql and wincc.
+
+A driver opens DB-API connections whose rows can be read by index and by
+column name (rec[0] and rec['DateTime']), like adodbapi rows.
+
+Available drivers:
+adodbapi  -- ADO via COM. Required for WinCCOLEDBProvider (TAG/ALARMVIEW).
+odbc      -- pyodbc, or pymssql if pyodbc is missing. Plain SQL only
+             (config database, sp_databases).
+simulator -- in-process SQLite backed WinCC simulator (see simulator.py).
+
+Usage:
+driver = get_driver('odbc')
+conn = driver.connect(conn_str, provider, host, database)
+"""
+import logging
+import os
+from contextlib import contextmanager
+
+from .pool import close_thread_connections
+
+
+class DriverException(Exception):
+    def __init__(self, message=''):
+        super(DriverException, self).__init__(message)
+
+
+class Row():
+    """Result row readable by index and by column name.
+    Names are case insensitive like with adodbapi. index maps lower case
+    column names to positions.
+    """
+
+    __slots__ = ('values', 'index')
+
+    def __init__(self, values, index):
+        self.values = values
+        self.index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self.values[self.index[key.lower()]]
+        return self.values[key]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self):
+        return repr(tuple(self.values))
+
+
+class RowCursor():
+    """Wrap a DB-API cursor so fetched rows are Row objects."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.index = {}
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def execute(self, query):
+        self.cursor.execute(query)
+        if self.cursor.description:
+            self.index = dict((col[0].lower(), i) for i, col
+                              in enumerate(self.cursor.description))
+        else:
+            self.index = {}
+
+    def _wrap(self, rec):
+        if rec is None:
+            return None
+        return Row(tuple(rec), self.index)
+
+    def fetchone(self):
+        return self._wrap(self.cursor.fetchone())
+
+    def fetchmany(self, size):
+        return [Row(tuple(rec), self.index)
+                for rec in self.cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [Row(tuple(rec), self.index) for rec in self.cursor.fetchall()]
+
+    def close(self):
+        self.cursor.close()
+
+
+class RowConnection():
+    """Wrap a DB-API connection so its cursors return Row objects."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        return RowCursor(self.conn.cursor())
+
+    def close(self):
+        self.conn.close()
+
+
+class Driver():
+    """Base class. Subclasses implement connect() and set errors."""
+
+    name = ''
+    # Exceptions raised by connect() and cursor.execute() on failure
+    errors = ()
+    # Driver used for side connections with plain SQL (e.g. sp_databases)
+    # opened on behalf of this driver. None means the mssql default.
+    plain_sql_driver = None
+
+    def connect(self, conn_str, provider, host, database):
+        raise NotImplementedError
+
+
+class AdodbapiDriver(Driver):
+    """ADO via adodbapi and COM. Windows only."""
+
+    name = 'adodbapi'
+
+    def __init__(self):
+        self._adodbapi = None
+
+    def _load(self):
+        if self._adodbapi is None:
+            import adodbapi
+            # Fixes for WinCCOLEDBProvider, see monkey_patch.py
+            from . import monkey_patch
+            self._adodbapi = adodbapi
+        return self._adodbapi
+
+    @property
+    def errors(self):
+        adodbapi = self._load()
+        return (adodbapi.DatabaseError, adodbapi.InterfaceError)
+
+    def connect(self, conn_str, provider, host, database):
+        adodbapi = self._load()
+        # Python looses it's current working dir in the next instruction
+        # Reset after connect
+        curr_dir = os.getcwd()
+        conn = adodbapi.connect(conn_str, provider=provider, host=host,
+                                database=database)
+        os.chdir(curr_dir)
+        return conn
+
+
+class OdbcDriver(Driver):
+    """Plain SQL via pyodbc or pymssql. Cannot talk to WinCCOLEDBProvider."""
+
+    name = 'odbc'
+    odbc_driver = '{SQL Server}'
+    conn_str = ("DRIVER=%(driver)s;SERVER=%(host)s;DATABASE=%(database)s;"
+                "Trusted_Connection=yes")
+
+    def __init__(self):
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            try:
+                import pyodbc
+                self._module = pyodbc
+            except ImportError:
+                try:
+                    import pymssql
+                    self._module = pymssql
+                except ImportError:
+                    raise DriverException("Driver 'odbc' needs pyodbc or "
+                                          "pymssql.")
+        return self._module
+
+    @property
+    def errors(self):
+        module = self._load()
+        return (module.Error,)
+
+    def connect(self, conn_str, provider, host, database):
+        if provider.startswith('WinCCOLEDBProvider'):
+            raise DriverException("Driver 'odbc' does not support {0}. Use "
+                                  "'adodbapi'.".format(provider))
+        module = self._load()
+        logging.debug("Connecting with %s", module.__name__)
+        if module.__name__ == 'pyodbc':
+            conn = module.connect(self.conn_str % {'driver': self.odbc_driver,
+                                                   'host': host,
+                                                   'database': database})
+        else:
+            conn = module.connect(server=host, database=database)
+        return RowConnection(conn)
+
+
+class SimulatorDriver(Driver):
+    """In-process WinCC simulator. See simulator.py."""
+
+    name = 'simulator'
+    plain_sql_driver = 'simulator'
+
+    @property
+    def errors(self):
+        from .simulator import SimulatorError
+        return (SimulatorError,)
+
+    def connect(self, conn_str, provider, host, database):
+        from . import simulator
+        return simulator.connect(host, database, provider)
+
+
+@contextmanager
+def com_thread():
+    """Initialize COM for the enclosed block of a worker thread, as ADO
+    (adodbapi) needs. The thread's pooled connections are closed before
+    COM is uninitialized. Does nothing where pythoncom is missing.
+    """
+    try:
+        import pythoncom
+    except ImportError:
+        pythoncom = None
+    if pythoncom is not None:
+        pythoncom.CoInitialize()
+    try:
+        yield
+    finally:
+        close_thread_connections()
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+
+
+drivers = {}
+
+
+def register_driver(driver):
+    """Make driver available to get_driver() under driver.name."""
+    drivers[driver.name] = driver
+
+
+def get_driver(name):
+    """Return registered driver by name."""
+    try:
+        return drivers[name]
+    except KeyError:
+        raise DriverException("Unknown driver '{0}'. Available: {1}."
+                              .format(name, ', '.join(sorted(drivers))))
+
+
+register_driver(AdodbapiDriver())
+register_driver(OdbcDriver())
+register_driver(SimulatorDriver())
@@ -0,0 +1,167 @@
+"""Pair alarm state transitions into episodes.
+
+An alarm (MsgNr) comes (state 1), goes (2) and is acknowledged (3, or 16
+when acknowledged after it went). An Episode holds the come, go and ack
+times of one occurrence, so durations and times to acknowledge can be
+computed.
+
+EpisodeBuilder consumes alarms sorted by time in a single pass. It holds
+one unfinished episode per MsgNr, which is finished by the next COME of
+the same MsgNr or at the end of the stream. Transitions of episodes
+crossing the window boundaries are kept: an episode that came before the
+window has come None, one still active at the end has go None.
+
+Episode times are naive UTC datetimes, so durations are right across DST
+changes; Episode.localize() converts them for display. Alarm times are
+local wall clock times unless utc=True (see wincc.create_alarm_record).
+Local times of the hour repeated at DST end are told apart by the order
+of the alarms, which therefore must be in archive order (presorted) or
+UTC.
+
+Usage:
+for episode in iter_episodes(alarm_record):
+    print(episode.id, episode.come, episode.duration())
+"""
+from collections import namedtuple
+from operator import attrgetter
+
+from dateutil import tz
+
+from .helper import DatetimeParser, get_tz
+from .tzconvert import localize
+
+COME = 1
+GO = 2
+ACK_STATES = (3, 16)
+
+EpisodeStats = namedtuple('EpisodeStats',
+                          'count active_seconds longest acked ack_seconds')
+
+
+class Episode(namedtuple('Episode',
+                         'id come go ack priority location text')):
+    """One occurrence of an alarm. come, go and ack are naive UTC
+    datetimes or None if not in the window."""
+
+    __slots__ = ()
+
+    def duration(self, end=None):
+        """Return seconds from come to go (or to end, UTC, if the alarm
+        did not go), None if not known."""
+        go = self.go or end
+        if self.come is None or go is None:
+            return None
+        return (go - self.come).total_seconds()
+
+    def ack_delay(self):
+        """Return seconds from come to acknowledge or None."""
+        if self.come is None or self.ack is None:
+            return None
+        return (self.ack - self.come).total_seconds()
+
+    def localize(self, zone_name='local'):
+        """Return the Episode with come, go and ack as aware datetimes in
+        zone_name, for display."""
+        times = [time for time in (self.come, self.go, self.ack) if time]
+        local = iter(localize(times, zone_name))
+        return self._replace(**dict(
+            (field, next(local)) for field in ('come', 'go', 'ack')
+            if getattr(self, field)))
+
+
+class EpisodeBuilder():
+    """Builds Episodes from alarms pushed in order of time. Alarm times
+    are wall clock times in zone_name unless utc is True."""
+
+    def __init__(self, utc=False, zone_name='local'):
+        # MsgNr -> [come, go, ack, priority, location, text]
+        self.unfinished = {}
+        self.parse = DatetimeParser()
+        self.zone = None if utc else get_tz(zone_name)
+        self.last_time = None
+
+    def to_utc(self, time):
+        """Return naive UTC datetime of the wall clock time. A time of the
+        hour repeated at DST end is taken as the second occurrence if the
+        first one lies before the previous alarm."""
+        local = time.replace(tzinfo=self.zone)
+        utc = local.astimezone(get_tz('UTC')).replace(tzinfo=None)
+        if tz.datetime_ambiguous(local) and self.last_time is not None and \
+                utc < self.last_time:
+            local = tz.enfold(local, fold=1)
+            utc = local.astimezone(get_tz('UTC')).replace(tzinfo=None)
+        return utc
+
+    def push(self, alarm):
+        """Consume alarm and return the Episode it finished or None."""
+        if alarm.state != COME and alarm.state != GO and \
+                alarm.state not in ACK_STATES:
+            return None
+        time = self.parse(alarm.datetime)
+        if self.zone is not None:
+            time = self.to_utc(time)
+        if self.last_time is None or time > self.last_time:
+            self.last_time = time
+        episode = self.unfinished.get(alarm.id)
+        finished = None
+        if alarm.state == COME or episode is None or \
+                (alarm.state == GO and episode[1] is not None):
+            if episode is not None:
+                finished = Episode(alarm.id, *episode)
+            episode = [None, None, None,
+                       alarm.priority, alarm.location, alarm.text]
+            self.unfinished[alarm.id] = episode
+        if alarm.state == COME:
+            episode[0] = time
+        elif alarm.state == GO:
+            episode[1] = time
+        elif alarm.state in ACK_STATES and episode[2] is None:
+            episode[2] = time
+        return finished
+
+    def finish(self):
+        """Return the unfinished episodes sorted by their first time and
+        forget them."""
+        episodes = [Episode(msg_id, *episode)
+                    for msg_id, episode in self.unfinished.items()]
+        self.unfinished = {}
+        return sorted(episodes, key=lambda episode: (
+            episode.come or episode.go or episode.ack, episode.id))
+
+
+def iter_episodes(alarms, presorted=False, utc=False, zone_name='local'):
+    """Yield Episodes of alarms (an AlarmRecord or Alarms). Alarms are
+    sorted by time first unless presorted is True. Alarm times are wall
+    clock times in zone_name unless utc is True."""
+    if not presorted:
+        # Times are fixed width strings, so they sort like datetimes. The
+        # sort is stable, equal local times keep their archive order.
+        alarms = sorted(alarms, key=attrgetter('datetime'))
+    builder = EpisodeBuilder(utc, zone_name)
+    push = builder.push
+    for alarm in alarms:
+        episode = push(alarm)
+        if episode is not None:
+            yield episode
+    for episode in builder.finish():
+        yield episode
+
+
+def episode_statistics(episodes, end=None):
+    """Return dict of MsgNr: EpisodeStats(count, active_seconds, longest,
+    acked, ack_seconds). Episodes still active count until end (UTC)."""
+    stats = {}
+    for episode in episodes:
+        count, active, longest, acked, ack_seconds = stats.get(
+            episode.id, (0, 0.0, 0.0, 0, 0.0))
+        duration = episode.duration(end)
+        if duration is not None:
+            active += duration
+            longest = max(longest, duration)
+        ack_delay = episode.ack_delay()
+        if ack_delay is not None:
+            acked += 1
+            ack_seconds += ack_delay
+        stats[episode.id] = EpisodeStats(count + 1, active, longest, acked,
+                                         ack_seconds)
+    return stats
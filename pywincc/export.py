@@ -0,0 +1,136 @@
+"""Write tag records (TagRecord, CompactTagRecord or TagArrayRecord) to
+files, one record at a time, without building the whole output in memory.
+
+The format follows the file name extension:
+.csv and unknown   CSV lines as TagRecord.to_csv() returns them
+.parquet, .pq      Parquet, one row group per record
+.arrow, .feather   Arrow IPC file (Feather V2), one record batch per record
+
+Parquet and Arrow files have the typed columns tagid (int64), time
+(timestamp ms, UTC) and value (float64). They need pyarrow, which is only
+imported when writing them.
+
+Usage:
+export_tag_records(records, 'flow_2015.parquet')
+"""
+import logging
+import os
+
+from .tag import EPOCH
+
+formats = {'.csv': 'csv', '.parquet': 'parquet', '.pq': 'parquet',
+           '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
+
+class ExportException(Exception):
+    def __init__(self, message=''):
+        super(ExportException, self).__init__(message)
+
+
+def export_format(filename):
+    """Return 'csv', 'parquet' or 'arrow' for filename.
+
+    >>> export_format('tags.parquet'), export_format('tags.txt')
+    ('parquet', 'csv')
+    """
+    return formats.get(os.path.splitext(filename)[1].lower(), 'csv')
+
+
+def write_csv(records, fh, delimiter=',', name='', tz=''):
+    """Write the CSV lines of records UTF-8 encoded to file object fh."""
+    for record in records:
+        fh.writelines(line.encode('utf-8') for line in
+                      record.iter_csv(delimiter, name, tz))
+
+
+def tag_columns(record):
+    """Return (UTC epoch ms, values) of record as arrays or lists."""
+    if hasattr(record, 'times'):
+        return record.times, record.values
+    epoch_ms, values = [], []
+    for tag in record:
+        time = tag.time
+        offset = time.utcoffset()
+        if offset is not None:
+            time = time.replace(tzinfo=None) - offset
+        delta = time - EPOCH
+        epoch_ms.append(delta.days * 86400000 + delta.seconds * 1000 +
+                        delta.microseconds // 1000)
+        values.append(tag.value)
+    return epoch_ms, values
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ExportException("Writing Parquet or Arrow files needs pyarrow "
+                              "(pip install pyarrow).")
+    return pyarrow
+
+
+def _schema(pa, name=''):
+    return pa.schema([pa.field('tagid', pa.int64()),
+                      pa.field('time', pa.timestamp('ms', tz='UTC')),
+                      pa.field(name or 'value', pa.float64())])
+
+
+def _record_batch(pa, schema, record):
+    import numpy as np
+    epoch_ms, values = tag_columns(record)
+    times = np.asarray(epoch_ms, dtype=np.int64)
+    tagids = np.empty(len(times), dtype=np.int64)
+    tagids.fill(int(record.tagid or 0))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(tagids),
+         pa.array(times).cast(schema.field('time').type),
+         pa.array(np.asarray(values, dtype=np.float64))], schema=schema)
+
+
+def write_parquet(records, filename, name=''):
+    """Write records to Parquet file filename."""
+    pa = _import_pyarrow()
+    import pyarrow.parquet as pq
+    schema = _schema(pa, name)
+    writer = pq.ParquetWriter(filename, schema, compression='snappy')
+    try:
+        for record in records:
+            writer.write_table(pa.Table.from_batches(
+                [_record_batch(pa, schema, record)], schema=schema))
+    finally:
+        writer.close()
+
+
+def write_arrow(records, filename, name=''):
+    """Write records to Arrow IPC file filename."""
+    pa = _import_pyarrow()
+    schema = _schema(pa, name)
+    sink = pa.OSFile(filename, 'wb')
+    try:
+        writer = pa.RecordBatchFileWriter(sink, schema)
+        try:
+            for record in records:
+                writer.write_batch(_record_batch(pa, schema, record))
+        finally:
+            writer.close()
+    finally:
+        sink.close()
+
+
+def export_tag_records(records, filename, name='', tz=''):
+    """Write records to filename in the format of its extension (see
+    export_format). name is the CSV header or the value column name, tz
+    (e.g. '+1') the CSV time zone. Returns the format."""
+    file_format = export_format(filename)
+    if file_format == 'csv':
+        with open(filename, 'wb') as fh:
+            write_csv(records, fh, name=name, tz=tz)
+        return file_format
+    if tz:
+        logging.warning("Time zone %s is ignored, %s files store UTC "
+                        "timestamps.", tz, file_format)
+    if file_format == 'parquet':
+        write_parquet(records, filename, name)
+    else:
+        write_arrow(records, filename, name)
+    return file_format
@@ -0,0 +1,158 @@
+"""Run the same query against many WinCC hosts concurrently.
+
+fan_out() calls a function for every host in its own thread and yields a
+FleetResult per host as soon as that host is done. A host taking longer
+than timeout seconds is reported with a FleetTimeout error and does not
+hold back the other hosts.
+
+Usage:
+for res in fan_out(select_hosts(WinCCHosts(), pattern='AGRO*'),
+                   query_alarms, args=('2015-08-24', '2015-08-25')):
+    print(res.host.hostname, res.error or res.result.count_all())
+"""
+import fnmatch
+import logging
+import threading
+import Queue
+from collections import namedtuple
+from time import time
+
+from .driver import com_thread
+from .wincc import wincc, get_multiple_tag_records
+from .alarm import alarm_query_builder
+from .operator_messages import om_query_builder
+
+FleetResult = namedtuple('FleetResult', 'host result error duration')
+
+fleet_config = {'workers': 16, 'timeout': 300}
+
+
+class FleetTimeout(Exception):
+    def __init__(self, message=''):
+        super(FleetTimeout, self).__init__(message)
+
+
+def select_hosts(hosts, names=None, pattern=None):
+    """Return hosts whose hostname is in names and whose hostname or
+    descriptive name matches the shell style pattern (case insensitive).
+    """
+    if names:
+        names = [name.lower() for name in names]
+    selected = []
+    for host in hosts:
+        if names and host.hostname.lower() not in names:
+            continue
+        if pattern and not any(
+                fnmatch.fnmatch((name or '').lower(), pattern.lower())
+                for name in (host.hostname, host.descriptive_name)):
+            continue
+        selected.append(host)
+    return selected
+
+
+def fan_out(hosts, func, args=(), kwargs=None, timeout=None, workers=None):
+    """Call func(host, *args, **kwargs) for every host concurrently and
+    yield FleetResult(host, result, error, duration) in order of
+    completion. At most workers hosts are queried at the same time.
+
+    The timeout (seconds) counts from when a host is started. Threads of
+    timed out hosts can not be stopped; they are left running as daemons
+    and their results are dropped.
+    """
+    kwargs = kwargs or {}
+    timeout = timeout if timeout is not None else fleet_config['timeout']
+    workers = workers or fleet_config['workers']
+    hosts = list(hosts)
+    pending = list(range(len(hosts)))
+    started = {}
+    done = set()
+    results = Queue.Queue()
+    lock = threading.Lock()
+
+    def worker():
+        # ADO connections need COM initialized in this thread
+        with com_thread():
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    index = pending.pop(0)
+                    started[index] = time()
+                try:
+                    result, error = func(hosts[index], *args, **kwargs), None
+                except Exception as e:
+                    logging.warning("Fleet query of %s failed: %s",
+                                    hosts[index].hostname, e)
+                    result, error = None, e
+                results.put((index, result, error, time() - started[index]))
+
+    def start_worker():
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    for _ in range(min(workers, len(hosts))):
+        start_worker()
+
+    while len(done) < len(hosts):
+        with lock:
+            deadlines = [started[index] + timeout for index in started
+                         if index not in done]
+        wait = max(0, min(deadlines) - time()) if deadlines else timeout
+        try:
+            index, result, error, duration = results.get(timeout=wait)
+        except Queue.Empty:
+            now = time()
+            with lock:
+                expired = [index for index in started if index not in done
+                           and now - started[index] >= timeout]
+            for index in expired:
+                done.add(index)
+                # The stuck thread keeps its slot, so add another worker
+                start_worker()
+                yield FleetResult(hosts[index], None, FleetTimeout(
+                    "No result from {0} after {1} s."
+                    .format(hosts[index].hostname, timeout)),
+                    now - started[index])
+            continue
+        if index in done:
+            continue
+        done.add(index)
+        yield FleetResult(hosts[index], result, error, duration)
+
+
+def query_alarms(host, begin_time, end_time, utc=False):
+    """Return AlarmRecord of host (a WinCCHost) for the time range."""
+    w = wincc(host.host_address, host.database, pooled=True)
+    try:
+        w.connect()
+        w.execute(alarm_query_builder(begin_time, end_time, '', utc, ''))
+        record = w.create_alarm_record()
+    except Exception:
+        # A broken connection must not go back to the pool
+        w.close(discard=True)
+        raise
+    w.close()
+    return record
+
+
+def query_operator_messages(host, begin_time, end_time, utc=False):
+    """Return OperatorMessageRecord of host for the time range."""
+    w = wincc(host.host_address, host.database, pooled=True)
+    try:
+        w.connect()
+        w.execute(om_query_builder(begin_time, end_time, '', utc))
+        record = w.create_operator_messages_record()
+    except Exception:
+        # A broken connection must not go back to the pool
+        w.close(discard=True)
+        raise
+    w.close()
+    return record
+
+
+def query_tags(host, begin_time, end_time, tagids, timestep, mode,
+               utc=False):
+    """Return list of tag records of host for the time range."""
+    return get_multiple_tag_records(host, begin_time, end_time, tagids,
+                                    timestep, mode, utc)
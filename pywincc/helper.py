@@ -2,6 +2,8 @@ from datetime import datetime, timedelta, date
 from dateutil import tz
 from time import time
 import logging
+import os
+import tempfile
 
 
 def str_to_date(date_str):
@@ -63,6 +65,10 @@ def str_to_datetime(dt_str):
     Allowed string types are "2015-08-21", "2015-08-21 10:23:25", \
     "2015-08-26 07:47" and "2015-08-21 10:23:48.672"
 
+    The format is sniffed from the string length and parsed by slicing.
+    Recently parsed strings are memoized. Strings not matching one of the
+    formats exactly (e.g. "2015-8-21") are parsed with strptime.
+
     Examples:
 
     >>> str_to_datetime("2015-08-21")
@@ -80,6 +86,25 @@ def str_to_datetime(dt_str):
     """
     if isinstance(dt_str, datetime) or isinstance(dt_str, date):
         return dt_str
+    t = _memo.get(dt_str)
+    if t is not None:
+        return t
+    parse = _parsers.get(len(dt_str))
+    if parse is None:
+        return strptime_datetime(dt_str)
+    try:
+        t = parse(dt_str)
+    except ValueError:
+        return strptime_datetime(dt_str)
+    if len(_memo) >= _memo_size:
+        _memo.clear()
+    _memo[dt_str] = t
+    return t
+
+
+def strptime_datetime(dt_str):
+    """str_to_datetime() using strptime only. Slow, but lenient e.g.
+    about missing leading zeros."""
     try:
         t = datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S.%f')
     except ValueError:
@@ -97,6 +122,95 @@ def str_to_datetime(dt_str):
     return t
 
 
+def _parse_date(s):
+    if len(s) != 10 or s[4] != '-' or s[7] != '-' or \
+            not (s[0:4] + s[5:7] + s[8:10]).isdigit():
+        raise ValueError(s)
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+
+
+def _parse_minutes(s):
+    if len(s) != 16 or s[4] != '-' or s[7] != '-' or s[10] != ' ' or \
+            s[13] != ':' or not (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16]).isdigit():
+        raise ValueError(s)
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16]))
+
+
+def _parse_seconds(s):
+    if len(s) != 19 or s[4] != '-' or s[7] != '-' or s[10] != ' ' or \
+            s[13] != ':' or s[16] != ':' or not (s[0:4] + s[5:7] + s[8:10] + s[11:13] +
+                                 s[14:16] + s[17:19]).isdigit():
+        raise ValueError(s)
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16]), int(s[17:19]))
+
+
+def _parse_fraction(s):
+    if not 20 < len(s) < 27 or s[4] != '-' or s[7] != '-' or \
+            s[10] != ' ' or s[13] != ':' or s[16] != ':' or s[19] != '.' or \
+            not (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] +
+                 s[17:19] + s[20:]).isdigit():
+        raise ValueError(s)
+    return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                    int(s[11:13]), int(s[14:16]), int(s[17:19]),
+                    int(s[20:].ljust(6, '0')))
+
+
+# Parser of each allowed format by string length
+_parsers = {10: _parse_date, 16: _parse_minutes, 19: _parse_seconds}
+_parsers.update((length, _parse_fraction) for length in range(21, 27))
+
+_memo = {}
+_memo_size = 1024
+
+
+class DatetimeParser():
+    """Parses a column or stream of datetime strings.
+
+    The format is sniffed from the first string and its parser reused as
+    long as the strings have that format. Nothing is memoized, as values
+    of a column rarely repeat.
+
+    >>> parse = DatetimeParser()
+    >>> [parse(s) for s in ("2015-08-21 10:23:25", "2015-08-21")]
+    [datetime.datetime(2015, 8, 21, 10, 23, 25), datetime.datetime(2015, 8, 21, 0, 0)]
+    """
+
+    def __init__(self):
+        self.parse = None
+
+    def __call__(self, dt_str):
+        if self.parse is not None:
+            try:
+                return self.parse(dt_str)
+            except (TypeError, ValueError, IndexError):
+                pass
+        if isinstance(dt_str, datetime) or isinstance(dt_str, date):
+            return dt_str
+        self.parse = _parsers.get(len(dt_str))
+        if self.parse is not None:
+            try:
+                return self.parse(dt_str)
+            except ValueError:
+                self.parse = None
+        return strptime_datetime(dt_str)
+
+
+_zones = {}
+
+
+def get_tz(name='local'):
+    """Return tzinfo for name: 'local', 'UTC' or anything tz.gettz()
+    understands. Zones are resolved once and cached.
+    """
+    zone = _zones.get(name)
+    if zone is None:
+        zone = tz.tzlocal() if name == 'local' else tz.gettz(name)
+        _zones[name] = zone
+    return zone
+
+
 def local_time_to_utc(dt_in):
     """Transform given datetime object from local timezone to UTC."""
     if isinstance(dt_in, datetime):
@@ -107,28 +221,22 @@ def local_time_to_utc(dt_in):
         raise TypeError("Wrong type. Expected: datetime or str. Got {type}."
                         .format(type=type(dt_in)))
 
-    from_zone = tz.tzlocal()
-    to_zone = tz.gettz('UTC')
-
-    local_time = dt.replace(tzinfo=from_zone)
-    return local_time.astimezone(to_zone)
+    local_time = dt.replace(tzinfo=get_tz('local'))
+    return local_time.astimezone(get_tz('UTC'))
 
 
 def utc_to_local(t):
-    """Transform given datetime object from UTC to local timezone."""
-    from_zone = tz.gettz('UTC')
-    to_zone = tz.tzlocal()
-    # utc = datetime.strptime(t, '%Y-%m-%d %H:%M:%S')
-    utc = t.replace(tzinfo=from_zone)
-    return utc.astimezone(to_zone)
+    """Transform given datetime object from UTC to local timezone.
+    See tzconvert.localize() for converting many datetimes at once.
+    """
+    utc = t.replace(tzinfo=get_tz('UTC'))
+    return utc.astimezone(get_tz('local'))
 
 
 def utc_to_utcx(t, x):
     """Transform given datetime object from UTC to UTC+x"""
-    from_zone = tz.gettz('UTC')
-    to_zone = tz.gettz('UTC+{}'.format(x))
-    utc = t.replace(tzinfo=from_zone)
-    return utc.astimezone(to_zone)
+    utc = t.replace(tzinfo=get_tz('UTC'))
+    return utc.astimezone(get_tz('UTC+{}'.format(x)))
 
 
 def daterange(start_date, end_date):
@@ -219,6 +327,49 @@ def datetime_to_syslog_timestamp(time):
     return time.strftime('%b %d %H:%M:%S')
 
 
+def atomic_write(filename, data):
+    """Write data (bytes) to filename so readers never see a partial file.
+
+    Data is written to a temporary file in the same directory and renamed.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        try:
+            os.rename(tmp_name, filename)
+        except OSError:
+            # Windows does not allow renaming onto an existing file
+            os.remove(filename)
+            os.rename(tmp_name, filename)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def user_cache_path(filename):
+    """Return filename in the per user cache directory of pywincc:
+    %LOCALAPPDATA%\\pywincc on Windows, $XDG_CACHE_HOME/pywincc or
+    ~/.cache/pywincc elsewhere. The directory is created if missing.
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+    directory = os.path.join(base, 'pywincc')
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by a concurrent process
+            if not os.path.isdir(directory):
+                raise
+    return os.path.join(directory, filename)
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
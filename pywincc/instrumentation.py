@@ -0,0 +1,158 @@
+"""Per-phase instrumentation of queries and reports.
+
+Durations are recorded for the phases connect, execute, fetch, convert
+(row conversion), timezone (timezone conversion), render and write,
+together with row counts and a hash of the query text.
+
+Every event is passed to registered callbacks. Aggregates per phase and
+per query are available as summary() and as JSON (to_json()). Per query
+aggregates are kept for the first max_queries distinct queries with their
+text shortened to max_query_length, so long runs use bounded memory;
+later queries only count in the phase aggregates and queries_dropped.
+
+Usage:
+with phase('execute', query=query):
+    cursor.execute(query)
+
+instrumentation.add_callback(lambda event: print(event))
+"""
+from __future__ import print_function
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from time import time
+
+PHASES = ('connect', 'execute', 'fetch', 'convert', 'timezone', 'render',
+          'write')
+
+
+def query_hash(query):
+    """Return a short stable hash of query text.
+
+    >>> query_hash(u"TAG:R,1,'2015-08-24 08:48:10.000'")
+    'a99e0a2965eb'
+    """
+    if query is None:
+        return None
+    if isinstance(query, unicode):
+        query = query.encode('utf-8')
+    return hashlib.sha1(query).hexdigest()[:12]
+
+
+class Instrumentation():
+    """Collects phase durations. Thread safe."""
+
+    max_queries = 1000
+    max_query_length = 200
+
+    def __init__(self):
+        self.callbacks = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time()
+            self.phases = {}
+            self.queries = {}
+            self.queries_dropped = 0
+
+    def add_callback(self, callback):
+        """callback(event) is called for every recorded event. event is a
+        dict with keys phase, duration, rows and query_hash.
+        """
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def record(self, phase, duration, rows=None, query=None):
+        """Record a single measurement."""
+        qhash = query_hash(query)
+        event = {'phase': phase, 'duration': duration, 'rows': rows,
+                 'query_hash': qhash}
+        with self._lock:
+            stats = self.phases.setdefault(phase, {'count': 0, 'total': 0.0,
+                                                   'max': 0.0, 'rows': 0})
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            if rows:
+                stats['rows'] += rows
+            qstats = self.queries.get(qhash)
+            if qstats is None and qhash is not None:
+                if len(self.queries) < self.max_queries:
+                    if len(query) > self.max_query_length:
+                        query = query[:self.max_query_length] + '...'
+                    qstats = {'query': query, 'phases': {}, 'rows': 0}
+                    self.queries[qhash] = qstats
+                elif phase == 'execute':
+                    self.queries_dropped += 1
+            if qstats is not None:
+                qstats['phases'][phase] = (qstats['phases'].get(phase, 0.0) +
+                                           duration)
+                if rows:
+                    qstats['rows'] += rows
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.warning("Instrumentation callback failed: %s", e)
+
+    @contextmanager
+    def phase(self, phase, query=None, rows=None):
+        """Time the enclosed block. Yields a dict, set 'rows' in it if the
+        row count is only known inside the block.
+        """
+        info = {'rows': rows}
+        start = time()
+        try:
+            yield info
+        finally:
+            self.record(phase, time() - start, info['rows'], query)
+
+    def summary(self):
+        """Return aggregated measurements as dict."""
+        with self._lock:
+            phases = dict((name, dict(stats)) for name, stats
+                          in self.phases.items())
+            queries = [dict(qstats, hash=qhash, phases=dict(qstats['phases']))
+                       for qhash, qstats in self.queries.items()]
+            return {'wall_time': time() - self.started,
+                    'phases': phases,
+                    'queries': queries,
+                    'queries_dropped': self.queries_dropped}
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2, sort_keys=True)
+
+    def format_summary(self):
+        """Return a human readable table of phase durations."""
+        summary = self.summary()
+        lines = ["{0:10} {1:>6} {2:>10} {3:>10} {4:>10}"
+                 .format('phase', 'count', 'total [s]', 'max [s]', 'rows')]
+        ordered = [name for name in PHASES if name in summary['phases']]
+        ordered += sorted(set(summary['phases']) - set(PHASES))
+        for name in ordered:
+            stats = summary['phases'][name]
+            lines.append("{0:10} {1:6} {2:10.3f} {3:10.3f} {4:10}"
+                         .format(name, stats['count'], stats['total'],
+                                 stats['max'], stats['rows']))
+        lines.append("wall time: {0:.3f} s".format(summary['wall_time']))
+        return "\n".join(lines)
+
+
+# Process wide default collector
+instrumentation = Instrumentation()
+
+
+def phase(name, query=None, rows=None):
+    """Shortcut for instrumentation.phase()."""
+    return instrumentation.phase(name, query, rows)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
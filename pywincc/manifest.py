@@ -0,0 +1,161 @@
+"""Manifest of generated reports for incremental batch runs.
+
+For every report file the manifest stores a fingerprint of the data it
+was rendered from (row counts, latest DateTime and a hash of all rows)
+and the version of the template. A batch run skips a report whose file
+exists and whose data and template did not change.
+
+The manifest is a JSON file next to the reports. Saving holds a lock file
+(manifest.json.lock) while it merges with the file on disk and replaces
+it atomically, so concurrent batch runs neither corrupt it nor lose each
+other's entries.
+
+Usage:
+manifest = open_report_manifest()
+fingerprint = data_fingerprint(alarms, operator_messages)
+if not manifest.is_current(filename, fingerprint, version):
+    ...render...
+    manifest.record(filename, fingerprint, version)
+manifest.save()
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from time import sleep, time
+
+from .helper import atomic_write
+from .report import report_config, resolve_dir
+
+
+def data_fingerprint(alarms, operator_messages=()):
+    """Return dict of row counts, latest DateTime and a sha1 of all rows
+    of alarms and operator messages (sequences of namedtuples with a
+    datetime field).
+    """
+    sha1 = hashlib.sha1()
+    fingerprint = {}
+    for kind, rows in (('alarms', alarms),
+                       ('operator_messages', operator_messages)):
+        count = 0
+        max_datetime = None
+        for row in rows:
+            count += 1
+            if max_datetime is None or row.datetime > max_datetime:
+                max_datetime = row.datetime
+            sha1.update(repr(tuple(row)))
+        sha1.update('\n')
+        fingerprint[kind] = count
+        fingerprint['{0}_max_datetime'.format(kind)] = max_datetime
+    fingerprint['sha1'] = sha1.hexdigest()
+    return fingerprint
+
+
+def open_report_manifest():
+    """Return the ReportManifest of the report output directory."""
+    return ReportManifest(os.path.join(resolve_dir(report_config['out_dir']),
+                                       'manifest.json'))
+
+
+class ReportManifest():
+    """Fingerprints and template versions of generated report files.
+    Thread and process safe."""
+
+    # Seconds save() waits for the lock file of another process
+    lock_timeout = 30
+    # A lock file older than this many seconds is left from a crashed run
+    stale_lock_age = 300
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        self._lock = threading.Lock()
+        self._changed = {}
+        self.entries = self.load()
+
+    def load(self):
+        """Return manifest entries. Missing or broken file is empty."""
+        try:
+            with open(self.filename, 'rb') as fh:
+                return json.loads(fh.read().decode('utf-8'))['reports']
+        except (IOError, ValueError, KeyError) as e:
+            if os.path.exists(self.filename):
+                logging.warning("Could not read report manifest %s: %s",
+                                self.filename, e)
+            return {}
+
+    def is_current(self, report_file, fingerprint, version, virtual=False):
+        """Return True if report_file exists and was rendered from data
+        with fingerprint and template version. With virtual its data
+        directory (<report>_data) has to exist as well."""
+        name = os.path.basename(report_file)
+        with self._lock:
+            entry = self.entries.get(name)
+        if virtual:
+            data_dir = os.path.splitext(name)[0] + '_data'
+            if not os.path.isdir(os.path.join(self.directory, data_dir)):
+                return False
+        return (entry is not None and entry['fingerprint'] == fingerprint
+                and entry['template'] == version and
+                os.path.exists(os.path.join(self.directory, name)))
+
+    def record(self, report_file, fingerprint, version):
+        """Remember that report_file was rendered. Call save() to write."""
+        entry = {'fingerprint': fingerprint, 'template': version}
+        name = os.path.basename(report_file)
+        with self._lock:
+            self.entries[name] = entry
+            self._changed[name] = entry
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the lock file of the manifest. Raises IOError if it is not
+        released within lock_timeout seconds."""
+        lock_name = self.filename + '.lock'
+        deadline = time() + self.lock_timeout
+        while True:
+            try:
+                fd = os.open(lock_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                if time() - os.path.getmtime(lock_name) > self.stale_lock_age:
+                    logging.warning("Removing stale lock file %s.", lock_name)
+                    os.remove(lock_name)
+                    continue
+            except OSError:
+                # Released in the meantime
+                continue
+            if time() > deadline:
+                raise IOError("Timed out waiting for lock file {0}."
+                              .format(lock_name))
+            sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_name)
+
+    def save(self):
+        """Merge recorded entries into the manifest file."""
+        with self._lock:
+            if not self._changed:
+                return
+            try:
+                with self._file_lock():
+                    entries = self.load()
+                    entries.update(self._changed)
+                    atomic_write(self.filename, json.dumps(
+                        {'version': 1, 'reports': entries}, indent=1,
+                        sort_keys=True).encode('utf-8'))
+            except (IOError, OSError) as e:
+                logging.warning("Could not write report manifest %s: %s",
+                                self.filename, e)
+                return
+            self.entries = entries
+            self._changed = {}
@@ -1,10 +1,10 @@
-import adodbapi
 import logging
-import os
 
 from alarm_config import AlarmConfig, AlarmConfigRecord
 from parameter import Parameter, ParameterRecord
-import monkey_patch
+from pool import get_pool
+from driver import get_driver
+from instrumentation import phase
 
 
 class MsSQLException(Exception):
@@ -17,42 +17,70 @@ class mssql():
     Persist Security Info=False; Initial Catalog=%(database)s;\
     Data Source=%(host)s"
     provider = 'SQLOLEDB.1'
-
-    def __init__(self, host, database=None):
+    # Default driver, see driver.py
+    driver_name = 'adodbapi'
+    # Rows per fetchmany() call in iter_rows()
+    fetch_batch_size = 1000
+
+    def __init__(self, host, database=None, pooled=False, driver=None):
+        """If pooled is True connections are checked out of a per host
+        connection pool (see pool.py) and returned to it on close().
+        driver is a driver name (see driver.py). Default is driver_name.
+        """
+        self.driver = get_driver(driver or self.driver_name)
         self.host = host
         self.database = database
+        self.pooled = pooled
+        self.pool = None
         self.conn = None
         self.cursor = None
+        self.last_query = None
 
     def connect(self):
         """Connect to mssql server using SQLOLEDB.1"""
+        with phase('connect'):
+            if self.pooled:
+                self.pool = get_pool(self.pool_key(), self.open_connection,
+                                     self.check_connection)
+                self.conn = self.pool.acquire()
+            else:
+                self.conn = self.open_connection()
+            self.cursor = self.conn.cursor()
 
+    def open_connection(self):
+        """Open and return a new connection with the configured driver."""
         try:
             logging.info("Trying to connect to %s database %s", self.host,
                          self.database)
-            # Python looses it's current working dir in the next instruction
-            # Reset after connect
-            curr_dir = os.getcwd()
-            self.conn = adodbapi.connect(self.conn_str,
-                                         provider=self.provider,
-                                         host=self.host,
-                                         database=self.database)
-            os.chdir(curr_dir)
-            self.cursor = self.conn.cursor()
-
-        except (adodbapi.DatabaseError, adodbapi.InterfaceError) as e:
+            return self.driver.connect(self.conn_str, self.provider,
+                                       self.host, self.database)
+        except self.driver.errors as e:
             logging.error(str(e))
             raise MsSQLException(message='Connection to host {host} failed.'
                                  .format(host=self.host))
 
+    def pool_key(self):
+        return (self.driver.name, self.provider, self.host, self.database)
+
+    def check_connection(self, conn):
+        """Health check for pooled connections."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            return True
+        finally:
+            cursor.close()
+
     def execute(self, query):
         """Execute (T)SQL query.
         Connection to server must be established in advance.
         """
         try:
             logging.debug("Executing query {query}.".format(query=query))
-            self.cursor.execute(query)
-        except (adodbapi.DatabaseError, adodbapi.InterfaceError) as e:
+            self.last_query = query
+            with phase('execute', query):
+                self.cursor.execute(query)
+        except self.driver.errors as e:
             logging.error(str(e))
             raise MsSQLException("query: '{query}' failed. Reason {reason}."
                                  .format(query=query, reason=str(e)))
@@ -63,6 +91,32 @@ class mssql():
     def fetchone(self):
         return self.cursor.fetchone()
 
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.fetch_batch_size
+        return self.cursor.fetchmany(size)
+
+    def iter_batches(self, batch_size=None):
+        """Yield lists of rows of the last query, read with fetchmany()."""
+        if not self.rowcount():
+            return
+        while True:
+            with phase('fetch', self.last_query) as info:
+                rows = self.fetchmany(batch_size)
+                info['rows'] = len(rows)
+            if not rows:
+                break
+            yield rows
+
+    def iter_rows(self, batch_size=None):
+        """Yield rows of the last query.
+        Rows are read with fetchmany() in batches of batch_size, so only one
+        batch is held in memory at a time.
+        """
+        for rows in self.iter_batches(batch_size):
+            for rec in rows:
+                yield rec
+
     def rowcount(self):
         return self.cursor.rowcount
 
@@ -159,11 +213,19 @@ class mssql():
         else:
             return None
 
-    def close(self):
+    def close(self, discard=False):
+        """Close cursor and connection. Pooled connections are returned to
+        the pool instead. Set discard=True to drop a broken connection.
+        """
         if self.cursor:
             self.cursor.close()
+            self.cursor = None
         if self.conn:
-            self.conn.close()
+            if self.pool:
+                self.pool.release(self.conn, discard)
+            else:
+                self.conn.close()
+            self.conn = None
 
 
 if __name__ == "__main__":
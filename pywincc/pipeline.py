@@ -0,0 +1,269 @@
+"""Batch alarm reports as a two stage pipeline.
+
+Fetching alarms is I/O bound, rendering reports is CPU bound. The fetch
+stage runs fetch_workers threads, each fetching a bucket of days
+(bucket_days) and splitting it into one report per window, skipping
+reports that are current in the report manifest. Concurrent queries per
+host are bounded by the chunking host semaphore. Reports pass through a
+bounded queue (queue_size) to the render stage, a process pool of
+render_workers processes. A full queue blocks the fetchers, so memory
+stays bounded when rendering is slower than fetching.
+
+Usage:
+metrics = run_batch_report(host, database, 'AGRO ENERGIE', windows)
+print(metrics.summary())
+"""
+import logging
+import multiprocessing
+import threading
+import Queue
+from datetime import timedelta
+from time import time
+
+from .alarm import AlarmRecord
+from .chunking import host_semaphore
+from .driver import com_thread
+from .helper import str_to_datetime
+from .operator_messages import OperatorMessageRecord
+from .manifest import data_fingerprint, open_report_manifest
+from .report import generate_alarms_report, alarms_report_filename, \
+    alarms_template_name, report_config, template_version, resolve_dir, \
+    configure as configure_report
+
+pipeline_config = {'fetch_workers': 4,
+                   'render_workers': multiprocessing.cpu_count(),
+                   'queue_size': 8, 'bucket_days': 7}
+
+_DONE = object()
+
+
+class PipelineException(Exception):
+    def __init__(self, message=''):
+        super(PipelineException, self).__init__(message)
+
+
+def configure(**kwargs):
+    """Set pipeline defaults e.g. configure(render_workers=2)."""
+    for key in kwargs:
+        if key not in pipeline_config:
+            raise KeyError("Unknown pipeline option {0}.".format(key))
+    pipeline_config.update(kwargs)
+
+
+class PipelineMetrics():
+    """Counts and durations of both stages. Thread safe."""
+
+    def __init__(self):
+        self.started = time()
+        self.finished = None
+        self.counts = {'buckets': 0, 'alarms': 0, 'operator_messages': 0,
+                       'reports': 0, 'skipped': 0}
+        # Summed over workers; queue_wait is time fetchers were blocked
+        self.seconds = {'fetch': 0.0, 'render': 0.0, 'queue_wait': 0.0}
+        self._lock = threading.Lock()
+
+    def add(self, counts=None, **seconds):
+        with self._lock:
+            for key, value in (counts or {}).items():
+                self.counts[key] += value
+            for key, value in seconds.items():
+                self.seconds[key] += value
+
+    def summary(self):
+        """Return dict of counts, durations and throughput."""
+        with self._lock:
+            wall = (self.finished or time()) - self.started
+            summary = dict(self.counts)
+            summary.update(('{0}_seconds'.format(key), round(value, 3))
+                           for key, value in self.seconds.items())
+            rows = self.counts['alarms'] + self.counts['operator_messages']
+            summary['wall_seconds'] = round(wall, 3)
+            summary['rows_per_second'] = round(rows / max(wall, 0.001), 1)
+            summary['reports_per_second'] = round(
+                self.counts['reports'] / max(wall, 0.001), 2)
+            return summary
+
+
+def make_buckets(windows, bucket_days):
+    """Group consecutive (begin, end) windows into lists spanning at most
+    bucket_days days (at least one window each).
+
+    >>> make_buckets([('2015-08-24', '2015-08-25'), ('2015-08-25', '2015-08-26'),
+    ...               ('2015-08-26', '2015-08-27')], 2)
+    [[('2015-08-24', '2015-08-25'), ('2015-08-25', '2015-08-26')], [('2015-08-26', '2015-08-27')]]
+    """
+    buckets = []
+    for window in windows:
+        if buckets:
+            first_begin = str_to_datetime(buckets[-1][0][0])
+            if str_to_datetime(window[1]) - first_begin <= \
+                    timedelta(bucket_days):
+                buckets[-1].append(window)
+                continue
+        buckets.append([window])
+    return buckets
+
+
+def render_report(alarms, begin, end, host_desc, operator_messages,
+                  virtual=None):
+    """Render one alarm report. Return (filename, seconds)."""
+    started = time()
+    filename = generate_alarms_report(alarms, begin, end, host_desc, '',
+                                      operator_messages=operator_messages,
+                                      virtual=virtual)
+    return filename, time() - started
+
+
+def render_config():
+    """Return report_config with absolute directories, for render processes
+    that do not inherit report.configure() (spawned on Windows)."""
+    config = dict(report_config)
+    for key in ('out_dir', 'template_dir'):
+        config[key] = resolve_dir(config[key])
+    return config
+
+
+def _init_render_process(config):
+    # Pool initializer, module level so it can be pickled
+    configure_report(**config)
+
+
+def _render_report(args):
+    # Pool entry point, module level so it can be pickled. Python 2 pools
+    # have no error callback, so errors are returned.
+    try:
+        return render_report(*args) + (None,)
+    except Exception as e:
+        logging.exception("Rendering report for %s - %s failed.", args[1],
+                          args[2])
+        return None, 0.0, "{0}: {1}".format(type(e).__name__, e)
+
+
+def run_batch_report(host, database, host_desc, windows, archive=None,
+                     fetch_workers=None, render_workers=None,
+                     queue_size=None, bucket_days=None, force=False,
+                     result_cache=None):
+    """Render an alarm report for each (begin, end) window (local time
+    strings, sorted). Reports that are current in the report manifest are
+    skipped unless force is True. The fetch threads share result_cache (a
+    ResultCache) if given. Returns PipelineMetrics.
+    render_workers=1 renders in this process. Raises PipelineException if
+    fetching a bucket or rendering a report failed; all other reports are
+    still written.
+    """
+    from .wincc import fetch_alarms_and_operator_messages, split_by_time, \
+        sync_alarm_archive
+    fetch_workers = fetch_workers or pipeline_config['fetch_workers']
+    render_workers = render_workers or pipeline_config['render_workers']
+    queue_size = queue_size or pipeline_config['queue_size']
+    bucket_days = bucket_days or pipeline_config['bucket_days']
+    metrics = PipelineMetrics()
+    manifest = open_report_manifest()
+    # Passed to the render processes, which may not share report_config
+    virtual = report_config['virtual']
+    version = template_version(alarms_template_name(virtual))
+    if archive is not None:
+        sync_alarm_archive(host, database, archive, windows[0][0])
+
+    buckets = Queue.Queue()
+    for bucket in make_buckets(windows, bucket_days):
+        buckets.put(bucket)
+    reports = Queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def fetch_worker():
+        # Pooled ADO connections need COM initialized in this thread
+        with com_thread():
+            while True:
+                try:
+                    bucket = buckets.get_nowait()
+                except Queue.Empty:
+                    break
+                begin, end = bucket[0][0], max(window[1] for window in bucket)
+                try:
+                    started = time()
+                    with host_semaphore(host):
+                        alarms, operator_messages = \
+                            fetch_alarms_and_operator_messages(
+                                host, database, begin, end, archive=archive,
+                                sync=False, result_cache=result_cache)
+                    metrics.add({'buckets': 1, 'alarms': len(alarms),
+                                 'operator_messages': len(operator_messages)},
+                                fetch=time() - started)
+                    for window, day_alarms, day_oms in zip(
+                            bucket, split_by_time(alarms, bucket),
+                            split_by_time(operator_messages, bucket)):
+                        filename = alarms_report_filename(window[0], window[1],
+                                                          host_desc)
+                        fingerprint = data_fingerprint(day_alarms, day_oms)
+                        if not force and manifest.is_current(
+                                filename, fingerprint, version, virtual):
+                            metrics.add({'skipped': 1})
+                            continue
+                        day_operator_messages = OperatorMessageRecord()
+                        for om in day_oms:
+                            day_operator_messages.push(om)
+                        started = time()
+                        reports.put(((AlarmRecord(day_alarms), window[0],
+                                      window[1], host_desc,
+                                      day_operator_messages, virtual),
+                                     fingerprint))
+                        metrics.add(queue_wait=time() - started)
+                except Exception as e:
+                    logging.exception("Fetching %s - %s failed.", begin, end)
+                    errors.append(e)
+        reports.put(_DONE)
+
+    def rendered(result, fingerprint):
+        filename, seconds, error = result
+        if error is not None:
+            errors.append(error)
+            return
+        manifest.record(filename, fingerprint, version)
+        metrics.add({'reports': 1}, render=seconds)
+        logging.info("Wrote %s in %.3f s.", filename, seconds)
+
+    threads = [threading.Thread(target=fetch_worker)
+               for _ in range(fetch_workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    pool = multiprocessing.Pool(render_workers, _init_render_process,
+                                (render_config(),)) \
+        if render_workers > 1 else None
+    # Bounds reports handed to the pool but not rendered yet
+    in_flight = threading.BoundedSemaphore(render_workers * 2)
+    pending = []
+    try:
+        running = len(threads)
+        while running:
+            item = reports.get()
+            if item is _DONE:
+                running -= 1
+                continue
+            args, fingerprint = item
+            if pool is None:
+                rendered(_render_report(args), fingerprint)
+                continue
+            in_flight.acquire()
+
+            def callback(result, fingerprint=fingerprint):
+                in_flight.release()
+                rendered(result, fingerprint)
+            pending.append(pool.apply_async(_render_report, (args,),
+                                            callback=callback))
+        for result in pending:
+            result.wait()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        manifest.save()
+    metrics.finished = time()
+    logging.info("Batch report pipeline: %s", metrics.summary())
+    if errors:
+        raise PipelineException("{0} of the batch report stages failed. "
+                                "First error: {1}".format(len(errors),
+                                                          errors[0]))
+    return metrics
@@ -0,0 +1,287 @@
+"""Connection pooling for WinCC and MsSQL connections.
+
+Opening a connection with the WinCC OLE-DB provider is a full ADO handshake
+and often takes longer than the query itself. A ConnectionPool keeps warm
+connections per host and hands them out again on the next connect().
+
+The pool only needs a factory returning DB-API connections, so it can be
+tested with any fake driver.
+
+ADO connections are COM objects that belong to the apartment of the thread
+that opened them. So idle connections are kept per thread and only handed
+out again to the thread that opened them. Worker threads initialize COM
+with driver.com_thread(), which closes their connections when done.
+
+Usage:
+pool = get_pool(('SQLOLEDB.1', host, database), factory)
+with pool.connection() as conn:
+    cursor = conn.cursor()
+"""
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolException(Exception):
+    def __init__(self, message=''):
+        super(PoolException, self).__init__(message)
+
+
+class ConnectionPool():
+    """Bounded pool of DB-API connections to a single host/database.
+
+    size: maximum number of connections (idle + checked out).
+    idle_timeout: idle connections older than this (seconds) are closed.
+    health_check: callable(conn) -> bool. Called on checkout for
+    connections that were idle longer than check_interval seconds.
+    timeout: seconds acquire() waits for a free slot. None waits forever.
+    Idle connections are only reused by the thread that opened them.
+    """
+
+    def __init__(self, factory, size=4, idle_timeout=300, health_check=None,
+                 check_interval=30, timeout=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1. Got {0}."
+                             .format(size))
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.check_interval = check_interval
+        self.timeout = timeout
+        # Thread -> list of (conn, last_used) opened by that thread
+        self._idle = {}
+        # id(conn) -> thread that opened conn
+        self._owners = {}
+        self._checked_out = 0
+        self._closed = False
+        # Reentrant, _close_connection is also called with the lock held
+        self._cond = threading.Condition(threading.RLock())
+
+    def __len__(self):
+        """Return number of open connections (idle and checked out)."""
+        with self._cond:
+            return self._idle_count() + self._checked_out
+
+    def idle_count(self):
+        with self._cond:
+            return self._idle_count()
+
+    def _idle_count(self):
+        return sum(len(idle) for idle in self._idle.values())
+
+    def acquire(self):
+        """Check out a connection. Reuse an idle one or open a new one."""
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        thread = threading.current_thread()
+        evicted = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolException("Pool is closed.")
+                self._close_expired()
+                if self._idle.get(thread):
+                    break
+                if self._idle_count() + self._checked_out < self.size:
+                    break
+                if self._idle_count():
+                    # Make room by dropping the oldest idle connection of
+                    # another thread
+                    evicted = self._pop_oldest_idle()
+                    break
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolException("Timeout: no free connection "
+                                            "after {0} seconds."
+                                            .format(self.timeout))
+                    self._cond.wait(remaining)
+            self._checked_out += 1
+            if self._idle.get(thread):
+                # Last in, first out. The most recently used one is warmest.
+                conn, last_used = self._idle[thread].pop()
+            else:
+                conn, last_used = None, None
+
+        if evicted is not None:
+            self._close_connection(evicted)
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                logging.info("Pooled connection failed health check. "
+                             "Opening a new one.")
+                self._close_connection(conn)
+                conn = None
+            if conn is None:
+                conn = self.factory()
+                with self._cond:
+                    self._owners[id(conn)] = thread
+        except Exception:
+            with self._cond:
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool.
+        Set discard=True for connections that are known to be broken.
+        """
+        with self._cond:
+            self._checked_out -= 1
+            owner = self._owners.get(id(conn), threading.current_thread())
+            if discard or self._closed:
+                close_it = True
+            else:
+                self._idle.setdefault(owner, []).append((conn, time.time()))
+                close_it = False
+            self._cond.notify()
+        if close_it:
+            self._close_connection(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in.
+        The connection is discarded if the block raises.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle connections. Checked out connections are closed
+        on release.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [conn for thread_idle in self._idle.values()
+                    for conn, _ in thread_idle]
+            self._idle = {}
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_connection(conn)
+
+    def close_thread(self, thread=None):
+        """Close the idle connections opened by thread (default: the
+        current thread). Call before the thread uninitializes COM."""
+        if thread is None:
+            thread = threading.current_thread()
+        with self._cond:
+            idle = self._idle.pop(thread, [])
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_connection(conn)
+
+    def _pop_oldest_idle(self):
+        """Remove and return the least recently used idle connection of
+        any thread. Hold the lock."""
+        thread = min(self._idle, key=lambda t: self._idle[t][0][1])
+        conn, _ = self._idle[thread].pop(0)
+        if not self._idle[thread]:
+            del self._idle[thread]
+        return conn
+
+    def _close_expired(self):
+        """Drop idle connections older than idle_timeout and those of
+        finished threads. Hold the lock."""
+        now = time.time()
+        expired = []
+        for thread in list(self._idle):
+            if not thread.is_alive():
+                expired.extend(conn for conn, _ in self._idle.pop(thread))
+                continue
+            if self.idle_timeout is None:
+                continue
+            idle = self._idle[thread]
+            expired.extend(conn for conn, last_used in idle
+                           if now - last_used > self.idle_timeout)
+            idle[:] = [(conn, last_used) for conn, last_used in idle
+                       if now - last_used <= self.idle_timeout]
+            if not idle:
+                del self._idle[thread]
+        if expired:
+            logging.debug("Closing %s expired pooled connection(s).",
+                          len(expired))
+            for conn in expired:
+                self._close_connection(conn)
+
+    def _is_healthy(self, conn, last_used):
+        if self.health_check is None:
+            return True
+        if time.time() - last_used < self.check_interval:
+            return True
+        try:
+            return bool(self.health_check(conn))
+        except Exception as e:
+            logging.debug("Health check raised %s", e)
+            return False
+
+    def _close_connection(self, conn):
+        with self._cond:
+            self._owners.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception as e:
+            logging.debug("Closing pooled connection failed: %s", e)
+
+
+# Defaults for pools created by get_pool(). Change with configure().
+pool_config = {'size': 4, 'idle_timeout': 300, 'check_interval': 30,
+               'timeout': None}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Set defaults for new pools e.g. configure(size=8, idle_timeout=60).
+    Existing pools are not changed.
+    """
+    for key in kwargs:
+        if key not in pool_config:
+            raise KeyError("Unknown pool option {0}.".format(key))
+    pool_config.update(kwargs)
+
+
+def get_pool(key, factory, health_check=None):
+    """Return the pool registered for key. Create it if necessary.
+    key is usually (provider, host, database).
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            logging.debug("Creating connection pool for %s", key)
+            pool = ConnectionPool(factory, health_check=health_check,
+                                  **pool_config)
+            _pools[key] = pool
+        return pool
+
+
+def close_thread_connections():
+    """Close the idle connections of the current thread in all pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_thread()
+
+
+def close_all():
+    """Close and forget all registered pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all)
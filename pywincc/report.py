@@ -1,10 +1,77 @@
 from jinja2 import Environment, FileSystemLoader
 from .helper import str_to_datetime, datetime_to_str_without_ms, datetime_to_str_underscores,\
-    date_to_str, datetime_is_date, date_to_str_underscores
+    date_to_str, datetime_is_date, date_to_str_underscores, DatetimeParser, \
+    atomic_write
+from .alarm import StringPool, EPOCH
+from .instrumentation import phase
+import hashlib
+import json
 import logging
-from datetime import timedelta
+import threading
+from datetime import datetime, timedelta
 import os
 
+# Relative directories are resolved against the current directory, then
+# against the directory holding the pywincc package
+# virtual: write alarms as chunked data files for a virtual scrolling table
+# instead of one big HTML table
+report_config = {'template_dir': './reports/templates/',
+                 'out_dir': './reports/_out/',
+                 'virtual': False, 'chunk_size': 2000}
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Set report defaults e.g. configure(out_dir='/srv/reports')."""
+    for key in kwargs:
+        if key not in report_config:
+            raise KeyError("Unknown report option {0}.".format(key))
+    report_config.update(kwargs)
+
+
+def resolve_dir(path):
+    """Return absolute path of a report directory."""
+    if os.path.isabs(path) or os.path.isdir(path):
+        return os.path.abspath(path)
+    package_parent = os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))
+    return os.path.join(package_parent, path)
+
+
+def get_template(name):
+    """Return compiled template name. The Environment of the template
+    directory is created once per process and caches compiled templates.
+    """
+    template_dir = resolve_dir(report_config['template_dir'])
+    with _environments_lock:
+        env = _environments.get(template_dir)
+        if env is None:
+            env = Environment(loader=FileSystemLoader(template_dir))
+            _environments[template_dir] = env
+    return env.get_template(name)
+
+
+def template_version(name):
+    """Return a short hash of the source of template name."""
+    template = get_template(name)
+    with open(template.filename, 'rb') as fh:
+        return hashlib.sha1(fh.read()).hexdigest()[:12]
+
+
+def render_to_file(template, template_vars, filename):
+    """Render template and stream the output to filename (in out_dir
+    unless absolute) without holding the whole document in memory."""
+    filename = os.path.join(resolve_dir(report_config['out_dir']), filename)
+    logging.debug("Opening file %s for printing the report.", filename)
+    with phase('render'):
+        stream = template.stream(template_vars)
+        stream.enable_buffering(64)
+        with open(filename, "wb") as fh:
+            stream.dump(fh, encoding='utf-8')
+    return filename
+
 
 def make_date_str(dt_begin_time, dt_end_time):
     """Return string of pattern '2015_09_02_2015_09_03' """
@@ -13,15 +80,9 @@ def make_date_str(dt_begin_time, dt_end_time):
     return date_str
 
 
-def generate_alarms_report(alarms, begin_time, end_time,
-                           host_description='', filter_text='',
-                           operator_messages=None):
-    script_dir = os.path.realpath(__name__).split(__name__)[0]
-    logging.debug("Changing to script dir %s", script_dir)
-    os.chdir(script_dir)
-    env = Environment(loader=FileSystemLoader('./reports/templates/'))
-    template = env.get_template("alarms.html")
-
+def alarms_report_dates(begin_time, end_time):
+    """Return (title date, file date, previous file date, next file date)
+    of an alarm report."""
     dt_begin_time = str_to_datetime(begin_time)
     dt_end_time = str_to_datetime(end_time)
 
@@ -35,6 +96,118 @@ def generate_alarms_report(alarms, begin_time, end_time,
         date_str_file = make_date_str(dt_begin_time, dt_end_time)
         date_str_prev = make_date_str(dt_begin_time - timedelta(1), dt_begin_time)
         date_str_next = make_date_str(dt_end_time, dt_end_time + timedelta(1))
+    return date_str, date_str_file, date_str_prev, date_str_next
+
+
+def alarms_report_filename(begin_time, end_time, host_description=''):
+    """Return the file name generate_alarms_report writes (without
+    out_dir).
+
+    >>> alarms_report_filename('2015-08-24', '2015-08-25', 'AGRO ENERGIE')
+    'alarms_AGRO_ENERGIE_2015_08_24.html'
+    """
+    date_str_file = alarms_report_dates(begin_time, end_time)[1]
+    return "alarms_{0}_{1}.html".format(host_description.replace(' ', '_'), date_str_file)
+
+
+def alarms_template_name(virtual=None):
+    """Return the template of alarm reports, virtual defaults to the
+    report_config option."""
+    if virtual is None:
+        virtual = report_config['virtual']
+    return "alarms_virtual.html" if virtual else "alarms.html"
+
+
+def _js_call(function, *args):
+    return "{0}({1});\n".format(function, ",".join(
+        json.dumps(arg, ensure_ascii=True, separators=(',', ':'))
+        for arg in args))
+
+
+def write_alarm_data(alarms, directory, chunk_size=None):
+    """Write alarms as script files loadable over file:// into directory
+    (in out_dir unless absolute) and return the index dict.
+
+    index.js calls alarm_index(index), chunk_NNNN.js calls
+    alarm_chunk(number, rows). Priorities, locations and texts are
+    dictionary encoded in the index; a row is [id, ms since the chunk base
+    time (or the raw time string), state, priority, location, text]. Per
+    chunk the index counts rows by 'priority,state', so the browser knows
+    the filtered row count without loading the chunks.
+    """
+    chunk_size = chunk_size or report_config['chunk_size']
+    directory = os.path.join(resolve_dir(report_config['out_dir']),
+                             directory)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in os.listdir(directory):
+        if name.startswith('chunk_') and name.endswith('.js'):
+            os.remove(os.path.join(directory, name))
+
+    pools = dict((name, StringPool())
+                 for name in ('priorities', 'locations', 'texts'))
+    parse = DatetimeParser()
+    chunks = []
+    rows = []
+
+    def flush():
+        number = len(chunks)
+        chunk = {'file': 'chunk_{0:04d}.js'.format(number), 'base': base,
+                 'counts': counts}
+        with open(os.path.join(directory, chunk['file']), 'wb') as fh:
+            fh.write(_js_call('alarm_chunk', number, rows))
+        chunks.append(chunk)
+
+    for alarm in alarms:
+        if not rows:
+            base, counts = None, {}
+        time = alarm.datetime
+        try:
+            time = parse(alarm.datetime)
+        except (TypeError, ValueError):
+            pass
+        if isinstance(time, datetime):
+            delta = time - EPOCH
+            time = delta.days * 86400000 + delta.seconds * 1000 + \
+                delta.microseconds // 1000
+            if base is None:
+                base = time
+            time -= base
+        priority = pools['priorities'].code(alarm.priority)
+        key = "{0},{1}".format(priority, alarm.state)
+        counts[key] = counts.get(key, 0) + 1
+        rows.append([alarm.id, time, alarm.state, priority,
+                     pools['locations'].code(alarm.location),
+                     pools['texts'].code(alarm.text)])
+        if len(rows) == chunk_size:
+            flush()
+            rows = []
+    if rows:
+        flush()
+
+    index = dict((name, pool.values) for name, pool in pools.items())
+    index.update({'directory': os.path.basename(directory),
+                  'count': sum(sum(chunk['counts'].values())
+                               for chunk in chunks),
+                  'chunks': chunks})
+    atomic_write(os.path.join(directory, 'index.js'),
+                 _js_call('alarm_index', index))
+    return index
+
+
+def generate_alarms_report(alarms, begin_time, end_time,
+                           host_description='', filter_text='',
+                           operator_messages=None, virtual=None):
+    """Render the alarm report and return its file name. With virtual
+    (default report_config['virtual']) the alarms are written as chunked
+    data files (see write_alarm_data) into a directory named like the
+    report and shown in a virtual scrolling table."""
+    if virtual is None:
+        virtual = report_config['virtual']
+    template = get_template(alarms_template_name(virtual))
+
+    date_str, date_str_file, date_str_prev, date_str_next = \
+        alarms_report_dates(begin_time, end_time)
 
     if filter_text != '':
         filter_text_out = u"This is NOT a full list of alarms."
@@ -43,7 +216,6 @@ def generate_alarms_report(alarms, begin_time, end_time,
     else:
         filter_text_out = filter_text
 
-    filename = "./reports/_out/alarms_{0}_{1}.html".format(host_description.replace(' ', '_'), date_str_file)
     link_prev = "alarms_{0}_{1}.html".format(host_description.replace(' ', '_'), date_str_prev)
     link_next = "alarms_{0}_{1}.html".format(host_description.replace(' ', '_'), date_str_next)
 
@@ -57,20 +229,17 @@ def generate_alarms_report(alarms, begin_time, end_time,
                      "link_next_doc": link_next,
                      "operator_messages": operator_messages}
 
-    html_out = template.render(template_vars)
-
-    filename = "./reports/_out/alarms_{0}_{1}.html".format(host_description.replace(' ', '_'), date_str_file)
-    logging.debug("Opering file %s for printing the report.", filename)
-    with open(filename, "wb") as fh:
-        fh.write(html_out.encode('utf-8'))
+    filename = alarms_report_filename(begin_time, end_time, host_description)
+    if virtual:
+        data_dir = os.path.splitext(filename)[0] + '_data'
+        with phase('render'):
+            template_vars['alarm_index'] = write_alarm_data(alarms, data_dir)
+        template_vars['alarms'] = None
+    return render_to_file(template, template_vars, filename)
 
 
 def generate_alarms_report2(alarms, begin_day, end_day, host_desc='', timestep=1):
-    script_dir = os.path.realpath(__name__).split(__name__)[0]
-    logging.debug("Changing to script dir %s", script_dir)
-    os.chdir(script_dir)
-    env = Environment(loader=FileSystemLoader('./reports/templates/'))
-    template = env.get_template("alarms2.html")
+    template = get_template("alarms2.html")
 
     template_vars = {"title": "Alarms Report", "alarms": alarms,
                  "state_dict": alarms.state_dict,
@@ -79,18 +248,12 @@ def generate_alarms_report2(alarms, begin_day, end_day, host_desc='', timestep=1
                  "begin_day": begin_day,
                  "end_day": end_day}
 
-    html_out = template.render(template_vars)
-
     date_str_file = make_date_str(begin_day, end_day)
-    filename = "./reports/_out/alarms2_{0}_{1}.html".format(host_desc.replace(' ', '_'), date_str_file)
-    logging.debug("Opering file %s for printing the report.", filename)
-    with open(filename, "wb") as fh:
-        fh.write(html_out.encode('utf-8'))
+    filename = "alarms2_{0}_{1}.html".format(host_desc.replace(' ', '_'), date_str_file)
+    return render_to_file(template, template_vars, filename)
 
 def operator_messages_report(operator_messages, begin_time, end_time, host_description=''):
-
-    env = Environment(loader=FileSystemLoader('./reports/templates/'))
-    template = env.get_template("operator_messages.html")
+    template = get_template("operator_messages.html")
 
     dt_begin_time = str_to_datetime(begin_time)
     dt_end_time = str_to_datetime(end_time)
@@ -102,8 +265,5 @@ def operator_messages_report(operator_messages, begin_time, end_time, host_descr
                      "begin_time": datetime_to_str_without_ms(dt_begin_time),
                      "end_time": datetime_to_str_without_ms(dt_end_time)}
 
-    html_out = template.render(template_vars)
-    # print html_out
-
-    with open("./reports/_out/operator_messages_{0}_{1}.html".format(datetime_to_str_underscores(dt_begin_time), datetime_to_str_underscores(dt_end_time)), "wb") as fh:
-        fh.write(html_out.encode('utf-8'))
+    filename = "operator_messages_{0}_{1}.html".format(datetime_to_str_underscores(dt_begin_time), datetime_to_str_underscores(dt_end_time))
+    return render_to_file(template, template_vars, filename)
@@ -0,0 +1,205 @@
+"""Local cache of alarm and operator message query results.
+
+Every result is one file in the cache directory, named by a hash of its
+key: kind ('alarms' or 'operator_messages'), host, database, the
+normalized query and the time range. The rows are stored column wise,
+marshalled and zlib compressed. Loading does not unpickle and so cannot
+run code.
+
+A range ending more than settle_time seconds ago is historical. Its rows
+do not change any more, so the entry never expires. Other entries expire
+after ttl seconds. When the cache grows beyond max_bytes, the least
+recently used entries are removed (a hit updates the modification time).
+
+Entries are written atomically (write to a temporary file and rename), so
+concurrent batch workers, threads or processes, can share a cache
+directory without locks. A reader sees either a whole entry or none.
+
+Usage:
+cache = ResultCache()
+key = cache.key('alarms', host, database, query, begin_time, end_time)
+rows = cache.get(key)
+if rows is None:
+    rows = ...  # query server
+    cache.put(key, rows)
+"""
+import hashlib
+import logging
+import marshal
+import os
+import re
+import zlib
+from datetime import datetime, timedelta
+from time import time
+
+from .alarm import Alarm
+from .helper import atomic_write, datetime_to_str, str_to_datetime
+from .operator_messages import OperatorMessage
+
+MAGIC = b'PWRC1\n'
+
+ROW_TYPES = {'alarms': Alarm, 'operator_messages': OperatorMessage}
+
+_quoted = re.compile(r"('(?:[^']|'')*')")
+_whitespace = re.compile(r"\s+")
+
+
+class ResultCacheException(Exception):
+    def __init__(self, message=''):
+        super(ResultCacheException, self).__init__(message)
+
+
+def normalize_query(query):
+    """Return query with runs of whitespace outside quotes collapsed.
+
+    >>> normalize_query(u"SELECT *  FROM ALGVIEWDEU\\n WHERE Text1 LIKE '%a  b%' ")
+    u"SELECT * FROM ALGVIEWDEU WHERE Text1 LIKE '%a  b%'"
+    """
+    parts = _quoted.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = _whitespace.sub(u' ', parts[i])
+    return u''.join(parts).strip()
+
+
+class ResultCache():
+    """Directory of query results keyed by (kind, host, database, query,
+    time range). Thread and process safe."""
+
+    directory = './result_cache'
+    max_bytes = 512 * 1024 * 1024
+    # Seconds a result of a range that is not historical yet is used
+    ttl = 300
+    # Ranges ending more than settle_time seconds ago never expire
+    settle_time = 3600
+
+    def __init__(self, directory=None, max_bytes=None, ttl=None,
+                 settle_time=None):
+        if directory is not None:
+            self.directory = directory
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if ttl is not None:
+            self.ttl = ttl
+        if settle_time is not None:
+            self.settle_time = settle_time
+
+    def key(self, kind, host, database, query, begin_time, end_time):
+        """Return the key of a result as tuple of strings."""
+        if kind not in ROW_TYPES:
+            raise ResultCacheException("Unknown result kind {0}.".format(kind))
+        times = []
+        for time_str in (begin_time, end_time):
+            dt = str_to_datetime(time_str) if time_str else None
+            times.append(datetime_to_str(dt) if dt else time_str or '')
+        return (kind, host.lower(), database.lower(),
+                normalize_query(query)) + tuple(times)
+
+    def _filename(self, key):
+        digest = hashlib.sha1(u'\x00'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.rc')
+
+    def is_historical(self, end_time):
+        """Return True if the range ending at end_time (local time) does
+        not change any more."""
+        end = str_to_datetime(end_time) if end_time else None
+        return end is not None and \
+            end < datetime.now() - timedelta(seconds=self.settle_time)
+
+    def get(self, key):
+        """Return list of rows (Alarm or OperatorMessage tuples) of key or
+        None if not cached or expired."""
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as fh:
+                data = fh.read()
+        except IOError:
+            return None
+        try:
+            if not data.startswith(MAGIC):
+                raise ValueError("not a result cache file")
+            entry = marshal.loads(zlib.decompress(data[len(MAGIC):]))
+        except (ValueError, EOFError, TypeError, zlib.error) as e:
+            logging.warning("Could not read result cache entry %s: %s",
+                            filename, e)
+            return None
+        if tuple(entry['key']) != key:
+            return None
+        if not entry['historical'] and entry['created'] + self.ttl < time():
+            return None
+        try:
+            # Mark as recently used for eviction
+            os.utime(filename, None)
+        except OSError:
+            pass
+        row_type = ROW_TYPES[key[0]]
+        return [row_type(*row) for row in zip(*entry['columns'])]
+
+    def put(self, key, rows):
+        """Store rows of the result of key. Returns the filename or None if
+        the rows could not be stored."""
+        rows = list(rows)
+        entry = {'key': key, 'created': time(), 'rows': len(rows),
+                 'historical': self.is_historical(key[5]),
+                 'columns': [list(column) for column in zip(*rows)]}
+        filename = self._filename(key)
+        try:
+            data = MAGIC + zlib.compress(marshal.dumps(entry), 6)
+            if not os.path.isdir(self.directory):
+                try:
+                    os.makedirs(self.directory)
+                except OSError:
+                    # Created by a concurrent worker
+                    if not os.path.isdir(self.directory):
+                        raise
+            atomic_write(filename, data)
+        except (ValueError, IOError, OSError) as e:
+            logging.warning("Could not write result cache entry %s: %s",
+                            filename, e)
+            return None
+        self.evict()
+        return filename
+
+    def entries(self):
+        """Return list of (mtime, size, filename) of all entries."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith('.rc'):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                # Evicted by a concurrent worker
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache is at most
+        max_bytes. Returns the number of removed entries."""
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for mtime, entry_size, filename in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+                removed += 1
+            except OSError:
+                # Removed concurrently or still open (Windows)
+                pass
+            size -= entry_size
+        return removed
+
+    def clear(self):
+        """Remove all entries."""
+        for mtime, size, filename in self.entries():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
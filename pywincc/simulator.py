@@ -0,0 +1,546 @@
+"""In-process simulator of the MsSQL server underlying WinCC.
+
+Each simulated database is a SQLite file below data_dir/<host>/. Plain SQL
+is passed to SQLite. The MsSQL specific statements pywincc relies on
+('EXEC sp_databases', 'SELECT name FROM sys.databases', 'SELECT DB_NAME()')
+are answered by the simulator itself.
+
+Runtime databases (see create_runtime_database) additionally understand
+the WinCC OLE-DB provider syntax as produced by tag_query_builder,
+alarm_query_builder and om_query_builder:
+
+TAG:R,<id>|(<id1>;<id2>),'<begin>'[,'<end>'][,'TIMESTEP=<sec>,<mode>']
+ALARMVIEW:SELECT * FROM ALGVIEWDEU WHERE ...
+
+Archives of any size can be filled with synthetic data by
+generate_tag_archive() and generate_alarm_archive().
+
+Use it through the 'simulator' driver:
+simulator.create_runtime_database(r'plant\\WINCC', 'CC_OS_1__15_01_08_16_40_41R')
+w = wincc(r'plant\\WINCC', 'CC_OS_1__15_01_08_16_40_41R', driver='simulator')
+"""
+from __future__ import division
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+
+from .driver import Row
+from .helper import str_to_datetime
+
+# Directory holding the simulated databases. A temporary directory is
+# created on first use if not set.
+data_dir = None
+_lock = threading.Lock()
+
+TAG_COLUMNS = ['valueid', 'timestamp', 'realvalue', 'quality', 'flags']
+TAG_INDEX = dict((name, i) for i, name in enumerate(TAG_COLUMNS))
+
+ALARM_COLUMNS = (['MsgNr', 'State', 'DateTime', 'Classname', 'Typename',
+                  'Username'] +
+                 ['Text{0}'.format(i) for i in range(1, 11)] +
+                 ['PText{0}'.format(i) for i in range(1, 11)] +
+                 ['PValue{0}'.format(i) for i in range(1, 11)])
+
+OPERATOR_MESSAGE_MSGNR = 12508141
+
+PRIORITIES = [u'WARNING', u'ERROR_DAY', u'ERROR_NOW', u'STOP_ALL']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS TagLogging (valueid INTEGER, timestamp TIMESTAMP,
+    realvalue REAL, quality INTEGER DEFAULT 0, flags INTEGER DEFAULT 0);
+CREATE INDEX IF NOT EXISTS TagLogging_valueid_timestamp
+    ON TagLogging (valueid, timestamp);
+CREATE TABLE IF NOT EXISTS ALGVIEWDEU ({alarm_columns});
+CREATE INDEX IF NOT EXISTS ALGVIEWDEU_DateTime ON ALGVIEWDEU (DateTime);
+""".format(alarm_columns=', '.join(
+    '{0} {1}'.format(name, 'TIMESTAMP' if name == 'DateTime' else
+                     'INTEGER' if name in ('MsgNr', 'State') else
+                     'REAL' if name.startswith('PValue') else 'TEXT')
+    for name in ALARM_COLUMNS))
+
+TAG_QUERY = re.compile(r"^TAG:R,(?P<tagids>\d+|\([\d;]+\)),'(?P<begin>[^']*)'"
+                       r"(?:,'(?P<end>[^']*)')?"
+                       r"(?:,'TIMESTEP=(?P<timestep>\d+),(?P<mode>\d+)')?$",
+                       re.I)
+ALARM_QUERY = re.compile(r"^ALARMVIEW:\s*(?P<sql>SELECT\s.*)$", re.I | re.S)
+DATETIME_LITERAL = re.compile(
+    r"'(\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2}(?:\.\d+)?)?)'")
+
+
+class SimulatorError(Exception):
+    def __init__(self, message=''):
+        super(SimulatorError, self).__init__(message)
+
+
+def get_data_dir():
+    global data_dir
+    with _lock:
+        if data_dir is None:
+            data_dir = tempfile.mkdtemp(prefix='pywincc_simulator_')
+            logging.debug("Simulator data dir is %s", data_dir)
+        return data_dir
+
+
+def reset():
+    """Delete all simulated databases."""
+    global data_dir
+    with _lock:
+        if data_dir is not None and os.path.isdir(data_dir):
+            shutil.rmtree(data_dir)
+        data_dir = None
+
+
+def _host_dir(host):
+    return os.path.join(get_data_dir(),
+                        re.sub(r'[^\w.-]', '_', host.lower()))
+
+
+def database_path(host, database):
+    return os.path.join(_host_dir(host), database + '.sqlite')
+
+
+def create_database(host, database):
+    """Create an empty simulated database. Return its file name."""
+    path = database_path(host, database)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    sqlite3.connect(path).close()
+    return path
+
+
+def create_runtime_database(host, database):
+    """Create a simulated runtime database with empty TagLogging and
+    ALGVIEWDEU archives. Return its file name.
+    """
+    path = create_database(host, database)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.close()
+    return path
+
+
+def list_databases(host):
+    host_dir = _host_dir(host)
+    if not os.path.isdir(host_dir):
+        return []
+    return sorted(name[:-len('.sqlite')] for name in os.listdir(host_dir)
+                  if name.endswith('.sqlite'))
+
+
+def connect(host, database, provider=''):
+    """Return a DB-API connection to a simulated database.
+    An empty database name connects to an empty in-memory 'master'.
+    """
+    if database and database not in list_databases(host):
+        raise SimulatorError("Database {0} does not exist at host {1}."
+                             .format(database, host))
+    return SimulatorConnection(host, database, provider)
+
+
+def format_timestamp(dt):
+    """Fixed width text representation used for stored timestamps.
+    Keeps string comparison in SQL equal to time comparison.
+
+    >>> format_timestamp(datetime(2015, 8, 24, 8, 7, 48))
+    '2015-08-24 08:07:48.000000'
+    """
+    return dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def normalize_datetime_literals(sql):
+    """Rewrite datetime literals of sql in the format of stored timestamps,
+    so string comparison in SQL equals time comparison.
+
+    >>> normalize_datetime_literals("DateTime > '2015-08-24 08:07:48'")
+    "DateTime > '2015-08-24 08:07:48.000000'"
+    """
+    return DATETIME_LITERAL.sub(
+        lambda match: "'{0}'".format(
+            format_timestamp(str_to_datetime(match.group(1)))), sql)
+
+
+def parse_relative_time(time_str):
+    """Return timedelta for a WinCC relative time e.g. '0000-00-01 12:00:00'.
+    Years and months count as 365 and 30 days.
+
+    >>> parse_relative_time('0000-00-01 12:00:00.000')
+    datetime.timedelta(1, 43200)
+    """
+    match = re.match(r"^(\d{4})-(\d{2})-(\d{2})"
+                     r"(?: (\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,3}))?)?)?$",
+                     time_str.strip())
+    if not match:
+        raise SimulatorError("Invalid relative time '{0}'.".format(time_str))
+    years, months, days, hours, minutes, seconds, ms = [
+        int(part) if part else 0 for part in match.groups()]
+    return timedelta(days=years * 365 + months * 30 + days, hours=hours,
+                     minutes=minutes, seconds=seconds, milliseconds=ms)
+
+
+def _is_relative(time_str):
+    return time_str[0:4] == '0000'
+
+
+def resolve_time_range(begin, end, now=None):
+    """Return absolute (begin, end) datetimes for TAG:R time arguments."""
+    if now is None:
+        now = datetime.utcnow()
+    if end is None or end == '':
+        dt_end = now
+        end_relative = False
+    elif _is_relative(end):
+        dt_end = None
+        end_relative = True
+    else:
+        dt_end = str_to_datetime(end)
+        end_relative = False
+
+    if _is_relative(begin):
+        if end_relative:
+            raise SimulatorError("Begin and end time must not both be "
+                                 "relative.")
+        dt_begin = dt_end - parse_relative_time(begin)
+    else:
+        dt_begin = str_to_datetime(begin)
+        if end_relative:
+            dt_end = dt_begin + parse_relative_time(end)
+    if dt_begin is None or dt_end is None:
+        raise SimulatorError("Invalid time range '{0}' - '{1}'."
+                             .format(begin, end))
+    return dt_begin, dt_end
+
+
+def _aggregate(values, mode):
+    """Aggregate the values of one interval with TIMESTEP mode 1-7."""
+    if mode == 1:
+        return values[0]
+    elif mode == 2:
+        return values[-1]
+    elif mode == 3:
+        return min(values)
+    elif mode == 4:
+        return max(values)
+    elif mode == 5:
+        return sum(values) / len(values)
+    elif mode == 6:
+        return sum(values)
+    elif mode == 7:
+        return len(values)
+    raise SimulatorError("Unknown TIMESTEP mode {0}.".format(mode))
+
+
+def _interpolate(buckets):
+    """Fill None values in a list of bucket values linearly. Leading and
+    trailing gaps take the nearest known value.
+
+    >>> _interpolate([None, 1.0, None, 3.0, None])
+    [1.0, 1.0, 2.0, 3.0, 3.0]
+    """
+    known = [i for i, value in enumerate(buckets) if value is not None]
+    if not known:
+        return buckets
+    result = list(buckets)
+    for i in range(0, known[0]):
+        result[i] = buckets[known[0]]
+    for i in range(known[-1] + 1, len(buckets)):
+        result[i] = buckets[known[-1]]
+    for left, right in zip(known, known[1:]):
+        for i in range(left + 1, right):
+            weight = (i - left) / (right - left)
+            result[i] = buckets[left] + weight * (buckets[right] -
+                                                  buckets[left])
+    return result
+
+
+class SimulatorConnection():
+
+    def __init__(self, host, database, provider=''):
+        self.host = host
+        self.database = database
+        self.provider = provider
+        path = database_path(host, database) if database else ':memory:'
+        self.sqlite = sqlite3.connect(path,
+                                      detect_types=sqlite3.PARSE_DECLTYPES,
+                                      check_same_thread=False,
+                                      isolation_level=None)
+        self.sqlite.row_factory = sqlite3.Row
+
+    def cursor(self):
+        return SimulatorCursor(self)
+
+    def commit(self):
+        self.sqlite.commit()
+
+    def close(self):
+        self.sqlite.close()
+
+
+class SimulatorCursor():
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+        self.description = None
+        self._rows = iter([])
+
+    def _set_rows(self, columns, rows):
+        """Serve a result computed by the simulator."""
+        index = dict((name.lower(), i) for i, name in enumerate(columns))
+        rows = [Row(tuple(rec), index) for rec in rows]
+        self._rows = iter(rows)
+        self.rowcount = len(rows)
+        self.description = [(name, None, None, None, None, None, None)
+                            for name in columns]
+
+    def execute(self, query):
+        statement = query.strip().rstrip(';').strip()
+        if re.match(r'EXEC\s+sp_databases$', statement, re.I):
+            self._set_rows(['DATABASE_NAME', 'DATABASE_SIZE', 'REMARKS'],
+                           [(name, 0, None) for name
+                            in list_databases(self.conn.host)])
+        elif re.match(r'SELECT\s+name\s+FROM\s+sys\.databases$', statement,
+                      re.I):
+            self._set_rows(['name'], [(name,) for name
+                                      in list_databases(self.conn.host)])
+        elif re.match(r'SELECT\s+DB_NAME\(\)$', statement, re.I):
+            self._set_rows([''], [(self.conn.database,)])
+        elif statement[0:4].upper() == 'TAG:':
+            self.execute_tag_query(statement)
+        elif statement[0:10].upper() == 'ALARMVIEW:':
+            self.execute_alarm_query(statement)
+        else:
+            self.execute_sql(statement)
+
+    def execute_sql(self, statement):
+        """Pass statement to SQLite."""
+        # MsSQL allows '#' in identifiers (e.g. PDE#TAGs), SQLite needs quotes
+        statement = re.sub(r'(?<![\w"\'])(\w+#\w+)', r'"\1"', statement)
+        try:
+            cursor = self.conn.sqlite.execute(statement)
+        except sqlite3.Error as e:
+            raise SimulatorError(str(e))
+        self._rows = iter(cursor)
+        self.rowcount = -1
+        self.description = cursor.description
+
+    def execute_alarm_query(self, statement):
+        """ALARMVIEW:SELECT ... FROM ALGVIEW<lang> WHERE ..."""
+        match = ALARM_QUERY.match(statement)
+        if not match:
+            raise SimulatorError("Invalid ALARMVIEW query {0}."
+                                 .format(statement))
+        sql = re.sub(r'\bFROM\s+ALGVIEW\w+', 'FROM ALGVIEWDEU',
+                     match.group('sql'), flags=re.I)
+        if not re.search(r'\bORDER\s+BY\b', sql, re.I):
+            sql += ' ORDER BY DateTime'
+        self.execute_sql(normalize_datetime_literals(sql))
+        # ALARMVIEW results are counted by the provider
+        rows = list(self._rows)
+        self._rows = iter(rows)
+        self.rowcount = len(rows)
+
+    def execute_tag_query(self, statement):
+        match = TAG_QUERY.match(statement)
+        if not match:
+            raise SimulatorError("Invalid or unsupported TAG query {0}."
+                                 .format(statement))
+        tagids = [int(tagid) for tagid
+                  in match.group('tagids').strip('()').split(';')]
+        begin, end = resolve_time_range(match.group('begin'),
+                                        match.group('end'))
+        self.description = [(name, None, None, None, None, None, None)
+                            for name in TAG_COLUMNS]
+        self.rowcount = -1
+        if match.group('timestep'):
+            self._rows = self._iter_aggregated(tagids, begin, end,
+                                               int(match.group('timestep')),
+                                               int(match.group('mode')))
+        else:
+            self._rows = self._iter_raw(tagids, begin, end)
+
+    def _select_tag(self, tagid, begin, end):
+        return self.conn.sqlite.execute(
+            "SELECT valueid, timestamp, realvalue, quality, flags "
+            "FROM TagLogging WHERE valueid = ? AND timestamp >= ? "
+            "AND timestamp <= ? ORDER BY timestamp",
+            (tagid, format_timestamp(begin), format_timestamp(end)))
+
+    def _iter_raw(self, tagids, begin, end):
+        # One tag after the other, in the order given in the query
+        for tagid in tagids:
+            for rec in self._select_tag(tagid, begin, end):
+                yield rec
+
+    def _iter_aggregated(self, tagids, begin, end, timestep, mode):
+        """Yield one row per tag and TIMESTEP interval. Intervals start at
+        begin and are stamped with their start time. Modes > 256 are the
+        interpolated variants and fill empty intervals.
+        """
+        if timestep < 1:
+            raise SimulatorError("TIMESTEP must be positive.")
+        interpolated = mode > 256
+        base_mode = mode - 256 if interpolated else mode
+        step = timedelta(seconds=timestep)
+        num_buckets = int(math.ceil((end - begin).total_seconds() / timestep))
+        for tagid in tagids:
+            buckets = [None] * num_buckets
+            current, values = None, []
+            for rec in self._select_tag(tagid, begin, end):
+                i = int((rec['timestamp'] - begin).total_seconds() //
+                        timestep)
+                i = min(i, num_buckets - 1)
+                if i != current and values:
+                    buckets[current] = _aggregate(values, base_mode)
+                    values = []
+                current = i
+                values.append(rec['realvalue'])
+            if values:
+                buckets[current] = _aggregate(values, base_mode)
+            if interpolated:
+                buckets = _interpolate(buckets)
+            for i, value in enumerate(buckets):
+                if value is not None:
+                    yield Row((tagid, begin + i * step, float(value), 0, 0),
+                              TAG_INDEX)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size):
+        return list(islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter([])
+
+
+def _bulk_insert(host, database, sql, rows):
+    """Insert rows (any iterable) in a single transaction."""
+    conn = sqlite3.connect(database_path(host, database),
+                           isolation_level=None)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        conn.executemany(sql, rows)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def generate_tag_archive(host, database, tagids, begin, end, interval=1,
+                         seed=0):
+    """Fill TagLogging with one synthetic value per tag every interval
+    seconds between begin and end (UTC). Values follow a daily sine wave
+    with noise. Rows are generated lazily, so millions of rows are fine.
+    Return number of inserted rows.
+    """
+    begin = str_to_datetime(begin)
+    end = str_to_datetime(end)
+    rnd = random.Random(seed)
+    num_steps = int((end - begin).total_seconds() // interval)
+
+    def rows():
+        for tagid in tagids:
+            offset = rnd.uniform(10, 100)
+            amplitude = rnd.uniform(1, 10)
+            for n in range(num_steps):
+                t = begin + timedelta(seconds=n * interval)
+                seconds_of_day = t.hour * 3600 + t.minute * 60 + t.second
+                value = (offset + amplitude *
+                         math.sin(2 * math.pi * seconds_of_day / 86400) +
+                         rnd.gauss(0, amplitude / 10))
+                yield (tagid, format_timestamp(t), value)
+
+    _bulk_insert(host, database, "INSERT INTO TagLogging (valueid, "
+                 "timestamp, realvalue) VALUES (?, ?, ?)", rows())
+    return num_steps * len(tagids)
+
+
+def _alarm_row(msgnr, state, dt, typename, location=u'', text=u'',
+               ptexts=(), pvalues=(), username=u''):
+    values = dict(MsgNr=msgnr, State=state, DateTime=format_timestamp(dt),
+                  Classname=u'Alarm', Typename=typename, Username=username,
+                  Text1=text, Text2=location)
+    for i, ptext in enumerate(ptexts):
+        values['PText{0}'.format(i + 1)] = ptext
+    for i, pvalue in enumerate(pvalues):
+        values['PValue{0}'.format(i + 1)] = pvalue
+    return tuple(values.get(name) for name in ALARM_COLUMNS)
+
+
+def insert_alarms(host, database, rows):
+    """Insert rows built by _alarm_row() into ALGVIEWDEU."""
+    _bulk_insert(host, database, "INSERT INTO ALGVIEWDEU ({0}) VALUES ({1})"
+                 .format(', '.join(ALARM_COLUMNS),
+                         ', '.join('?' * len(ALARM_COLUMNS))), rows)
+
+
+def insert_alarm(host, database, msgnr, state, dt, typename=u'WARNING',
+                 location=u'', text=u''):
+    """Insert a single alarm transition. dt is UTC."""
+    insert_alarms(host, database, [_alarm_row(msgnr, state,
+                                              str_to_datetime(dt), typename,
+                                              location, text)])
+
+
+def generate_alarm_archive(host, database, begin, end, alarms_per_hour=10,
+                           num_messages=200, operator_messages_per_hour=1,
+                           seed=0):
+    """Fill ALGVIEWDEU with synthetic alarms (COME, GO, ACK transitions)
+    and operator messages between begin and end (UTC).
+    Return number of inserted rows.
+    """
+    begin = str_to_datetime(begin)
+    end = str_to_datetime(end)
+    rnd = random.Random(seed)
+    messages = [(1000 + i, rnd.choice(PRIORITIES),
+                 u'Location {0}'.format(i % 25),
+                 u'Alarm text {0}'.format(i)) for i in range(num_messages)]
+    duration = (end - begin).total_seconds()
+    num_alarms = int(duration / 3600 * alarms_per_hour)
+    num_operator_messages = int(duration / 3600 * operator_messages_per_hour)
+    counter = [0]
+
+    def rows():
+        for _ in range(num_alarms):
+            msgnr, priority, location, text = rnd.choice(messages)
+            come = begin + timedelta(seconds=rnd.uniform(0, duration))
+            transitions = [(1, come),
+                           (2, come + timedelta(
+                               seconds=rnd.expovariate(1 / 600.0))),
+                           (3, come + timedelta(
+                               seconds=rnd.expovariate(1 / 300.0)))]
+            for state, dt in transitions:
+                if dt < end:
+                    counter[0] += 1
+                    yield _alarm_row(msgnr, state, dt, priority, location,
+                                     text)
+        for _ in range(num_operator_messages):
+            dt = begin + timedelta(seconds=rnd.uniform(0, duration))
+            pid = rnd.randint(1, 500)
+            counter[0] += 1
+            yield _alarm_row(OPERATOR_MESSAGE_MSGNR, 1, dt, u'Operation',
+                             ptexts=(u'P{0}'.format(pid),
+                                     unicode(rnd.randint(0, 100)),
+                                     unicode(rnd.randint(0, 100)),
+                                     u'Parameter {0}'.format(pid)),
+                             pvalues=(0, 0, 0, 0, 1, pid, 1),
+                             username=u'operator')
+
+    insert_alarms(host, database, rows())
+    return counter[0]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,10 +1,13 @@
 """ Helper Functions to handle WinCC Tag queries"""
 from .helper import datetime_to_str, str_to_datetime, local_time_to_utc,\
-    utc_to_local, utc_to_utcx, remove_timezone
+    utc_to_local, utc_to_utcx, remove_timezone, DatetimeParser
 from collections import namedtuple
+from datetime import datetime
 
 Tag = namedtuple('Tag', 'time value')
 
+EPOCH = datetime(1970, 1, 1)
+
 
 class TagRecord():
     """Allows for storage and manipulation of a tags record"""
@@ -39,20 +42,19 @@ class TagRecord():
     def __str__(self):
         return unicode(self).encode('utf-8')
 
-    def to_csv(self, delimiter=',', name='', tz=''):
-        output = ""
+    def iter_csv(self, delimiter=',', name='', tz=''):
+        """Yield the lines of to_csv()."""
         if name != '':
-            output = u"DateTime{}{}\n".format(delimiter, name)
+            yield u"DateTime{}{}\n".format(delimiter, name)
         for tag in self:
             if not tz:
-                output += u"{time}{delimiter}{value}\n".format(time=tag.time,
-                                                               delimiter=delimiter,
-                                                               value=tag.value)
+                yield u"{0}{1}{2}\n".format(tag.time, delimiter, tag.value)
             else:
-                output += u"{time}{delimiter}{value}\n".format(time=utc_to_utcx(tag.time, tz),
-                                                               delimiter=delimiter,
-                                                               value=tag.value)
-        return output
+                yield u"{0}{1}{2}\n".format(utc_to_utcx(tag.time, tz),
+                                            delimiter, tag.value)
+
+    def to_csv(self, delimiter=',', name='', tz=''):
+        return u"".join(self.iter_csv(delimiter, name, tz))
 
     def plot(self):
         from matplotlib import pyplot
@@ -94,7 +96,7 @@ def plot_tag_records(tag_records, show=True, save=False):
 
 
 def plot_tag_records2(tag_records, plot_config=None, show=True, save=False):
-    """Plot given tag_records."""
+    """Plot given tag_records (TagRecord or TagArrayRecord objects)."""
     from matplotlib import pyplot
     from numpy import mean
     num_figures = len(plot_config["figures"])
@@ -132,7 +134,7 @@ def plot_tag_records2(tag_records, plot_config=None, show=True, save=False):
 
     for i, records in enumerate(tag_records):
         xs, ys = records.get_xs_ys()
-        ys_mean = [mean(ys) for _ in xs]
+        ys_mean = [mean(ys)] * len(xs)
         tagid = str(records.tagid)
         figure_num = plot_config["tags"][tagid]["figure_num"]
         axis_num = plot_config["tags"][tagid]["axis_num"]
@@ -157,6 +159,37 @@ def plot_tag_records2(tag_records, plot_config=None, show=True, save=False):
             figure.show()
 
 
+mode_dict = {'first': 1, 'last': 2, 'min': 3, 'max': 4, 'avg': 5, 'sum': 6,
+             'count': 7, 'first_interpolated': 257,
+             'last_interpolated': 258, 'min_interpolated': 259,
+             'max_interpolated': 260, 'avg_interpolated': 261,
+             'sum_interpolated': 262,
+             'count_interpolated': 263}
+
+timestep_dict = {'m': 60, 'min': 60, 'minute': 60,
+                 '1m': 60, '1min': 60, '1minute': 60,
+                 '10m': 600, '10min': 600, '10minutes': 600,
+                 '30m': 1800, '30min': 1800, '30minutes': 1800,
+                 'half_hour': 1800, 'h': 3600, 'hour': 3600,
+                 '1h': 3600, '1hour': 3600,
+                 'd': 86400, 'day': 86400, '1d': 86400, '1day': 86400}
+
+
+def normalize_timestep(timestep):
+    """Return timestep in seconds. 0 means raw values.
+
+    >>> normalize_timestep('1h')
+    3600
+    >>> normalize_timestep('')
+    0
+    """
+    if not timestep:
+        return 0
+    if timestep in timestep_dict:
+        return timestep_dict[timestep]
+    return int(timestep)
+
+
 def tag_query_builder(tagids, begin_time, end_time, timestep, mode, utc):
     """Build the WinCC query string for reading tags
 
@@ -164,26 +197,7 @@ def tag_query_builder(tagids, begin_time, end_time, timestep, mode, utc):
     "TAG:R,132,'2015-08-24 08:48:10.000','2015-08-24 08:49:24.000','TIMESTEP=3600,6'"
     """
 
-    mode_dict = {'first': 1, 'last': 2, 'min': 3, 'max': 4, 'avg': 5, 'sum': 6,
-                 'count': 7, 'first_interpolated': 257,
-                 'last_interpolated': 258, 'min_interpolated': 259,
-                 'max_interpolated': 260, 'avg_interpolated': 261,
-                 'sum_interpolated': 262,
-                 'count_interpolated': 263}
-
-    timestep_dict = {'m': 60, 'min': 60, 'minute': 60,
-                     '1m': 60, '1min': 60, '1minute': 60,
-                     '10m': 600, '10min': 600, '10minutes': 600,
-                     '30m': 1800, '30min': 1800, '30minutes': 1800,
-                     'half_hour': 1800, 'h': 3600, 'hour': 3600,
-                     '1h': 3600, '1hour': 3600,
-                     'd': 86400, 'day': 86400, '1d': 86400, '1day': 86400}
-
-    if timestep:
-        if timestep in timestep_dict:
-            timestep = timestep_dict[timestep]
-        else:
-            timestep = int(timestep)
+    timestep = normalize_timestep(timestep)
 
     if mode not in mode_dict:
         print("Error: {mode} is not a valid mode. Allowed modes are first, \
@@ -231,8 +245,9 @@ def print_tag_logging(records):
     >>> print_tag_logging([(u'1776', u'2015-08-23 12:47:54', u'29.654', u'147', u'8425473')])
     '2015-08-23 14:47:54.000': 29.654.
     """
+    parse = DatetimeParser()
     for rec in records:
-        print("{tagid}, {datetime}: {value}.".format(tagid=rec[0], datetime=datetime_to_str(utc_to_local(str_to_datetime(rec[1]))), value=rec[2]))
+        print("{tagid}, {datetime}: {value}.".format(tagid=rec[0], datetime=datetime_to_str(utc_to_local(parse(rec[1]))), value=rec[2]))
         # print rec
 
 
@@ -0,0 +1,219 @@
+"""Columnar TagLogging results backed by NumPy arrays.
+
+A TagArrayRecord holds one tag as two arrays: int64 UTC epoch
+milliseconds and float64 values. Compared to a TagRecord (one Tag
+namedtuple with a timezone aware datetime per row) it needs a fraction of
+the memory and no per row conversion while fetching.
+
+Times are converted to local time only when presenting (iteration,
+get_xs_ys, to_csv), a whole column at a time (see tzconvert).
+
+A CompactTagRecord is a TagArrayRecord that can be filled tag by tag.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+
+from .helper import utc_to_utcx
+from .tzconvert import localize, utc_ms_to_local_ms, epoch_ms_to_datetimes
+from .tag import Tag
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TagArrayRecord():
+    """Tag record stored as times (int64 epoch ms, UTC) and values."""
+
+    def __init__(self, tagid='', times=None, values=None, name='', utc=False):
+        """utc=True presents times in UTC instead of local time."""
+        self.tagid = tagid
+        self.name = name
+        self.utc = utc
+        if times is None:
+            times = np.empty(0, dtype=np.int64)
+        if values is None:
+            values = np.empty(0, dtype=np.float64)
+        self.times = np.asarray(times, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.times)
+
+    def _to_datetimes(self):
+        """Return list of presented times (UTC naive or local aware)."""
+        datetimes = epoch_ms_to_datetimes(self.times)
+        if self.utc:
+            return datetimes
+        return localize(datetimes)
+
+    def __iter__(self):
+        """Yield Tag tuples like TagRecord does."""
+        for time, value in zip(self._to_datetimes(), self.values.tolist()):
+            yield Tag(time, value)
+
+    def get_xs_ys(self):
+        if self.utc:
+            xs = epoch_ms_to_datetimes(self.times)
+        else:
+            xs = epoch_ms_to_datetimes(utc_ms_to_local_ms(self.times))
+        return xs, self.values
+
+    def __unicode__(self):
+        xs = self.get_xs_ys()[0]
+        lines = [u"{0}: {1}\n".format(self.tagid, self.name)]
+        lines.extend(u"{time}: {value}\n".format(time=time, value=value)
+                     for time, value in zip(xs, self.values.tolist()))
+        return u"".join(lines)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+    def iter_csv(self, delimiter=',', name='', tz=''):
+        """Yield the lines of to_csv()."""
+        if name != '':
+            yield u"DateTime{}{}\n".format(delimiter, name)
+        if not tz:
+            times = self._to_datetimes()
+        else:
+            times = [utc_to_utcx(dt, tz)
+                     for dt in epoch_ms_to_datetimes(self.times)]
+        for time, value in zip(times, self.values):
+            yield u"{0}{1}{2}\n".format(time, delimiter, value)
+
+    def to_csv(self, delimiter=',', name='', tz=''):
+        """Same output as TagRecord.to_csv(). With tz the stored UTC times
+        are shifted to UTC+tz, also if utc is False (TagRecord.to_csv()
+        takes the times of a local record as UTC then)."""
+        return u"".join(self.iter_csv(delimiter, name, tz))
+
+
+class CompactTagRecord(TagArrayRecord):
+    """TagArrayRecord that is filled tag by tag like a TagRecord, with an
+    optional quality column (uint8).
+
+    push and extend append to buffers that double in size when full.
+    Times pushed with a timezone are converted to UTC, naive times are
+    taken as UTC. Whether times are presented in UTC or local time is set
+    by utc at construction. Indexing returns a Tag, slicing a
+    CompactTagRecord.
+
+    >>> record = CompactTagRecord(1776, utc=True, quality=True)
+    >>> record.push(Tag(datetime(2015, 8, 24, 8, 48, 10, 483000), 29.5), 0x80)
+    >>> len(record), record[0], record.qualities[0]
+    (1, Tag(time=datetime.datetime(2015, 8, 24, 8, 48, 10, 483000), value=29.5), 128)
+    """
+
+    def __init__(self, tagid='', name='', utc=False, quality=False):
+        """Initialize empty record. quality=True adds a quality column."""
+        TagArrayRecord.__init__(self, tagid, name=name, utc=utc)
+        self.qualities = np.empty(0, dtype=np.uint8) if quality else None
+        self._buffers = None
+        self._size = 0
+
+    def _reserve(self, count):
+        """Make room for count more tags and update the column views."""
+        size = self._size + count
+        if self._buffers is None or size > len(self._buffers[0]):
+            capacity = max(64, size, 2 * len(self.times))
+            columns = [self.times, self.values]
+            if self.qualities is not None:
+                columns.append(self.qualities)
+            self._buffers = []
+            for column in columns:
+                buffer = np.empty(capacity, dtype=column.dtype)
+                buffer[:self._size] = column
+                self._buffers.append(buffer)
+        self._size = size
+        self.times = self._buffers[0][:size]
+        self.values = self._buffers[1][:size]
+        if self.qualities is not None:
+            self.qualities = self._buffers[2][:size]
+
+    def push(self, tag, quality=0):
+        time = tag.time
+        offset = time.utcoffset()
+        if offset is not None:
+            time = time.replace(tzinfo=None) - offset
+        delta = time - EPOCH
+        self._reserve(1)
+        self.times[-1] = (delta.days * 86400000 + delta.seconds * 1000 +
+                          delta.microseconds // 1000)
+        self.values[-1] = tag.value
+        if self.qualities is not None:
+            self.qualities[-1] = quality
+
+    def extend(self, epoch_ms, values, qualities=None):
+        """Append columns of UTC epoch ms, values and qualities at once."""
+        count = len(values)
+        self._reserve(count)
+        self.times[len(self.times) - count:] = epoch_ms
+        self.values[len(self.values) - count:] = values
+        if self.qualities is not None:
+            self.qualities[len(self.qualities) - count:] = \
+                qualities if qualities is not None else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            record = CompactTagRecord(self.tagid, self.name, self.utc)
+            record.times = self.times[index].copy()
+            record.values = self.values[index].copy()
+            if self.qualities is not None:
+                record.qualities = self.qualities[index].copy()
+            record._size = len(record.times)
+            return record
+        time = EPOCH + timedelta(milliseconds=int(self.times[index]))
+        if not self.utc:
+            time = localize([time])[0]
+        return Tag(time, self.values[index].item())
+
+    def get_xs_ys(self):
+        """Like TagRecord.get_xs_ys(), values as list."""
+        xs, ys = TagArrayRecord.get_xs_ys(self)
+        return xs, ys.tolist()
+
+    def plot(self):
+        from matplotlib import pyplot
+        xs, ys = self.get_xs_ys()
+        pyplot.plot(xs, ys)
+        pyplot.xlim(min(xs), max(xs))
+        pyplot.ylim(min(ys), max(ys))
+        pyplot.show()
+
+
+def datetimes_to_epoch_ms(datetimes):
+    """Convert a sequence of naive UTC datetimes to int64 epoch ms in bulk.
+
+    >>> datetimes_to_epoch_ms([datetime(2015, 8, 24, 8, 48, 10, 483000)])
+    array([1440406090483])
+    """
+    return np.array(datetimes, dtype='datetime64[ms]').astype(np.int64)
+
+
+def split_by_tagid(valueids, times, values, utc=False):
+    """Split flat columns into a list of TagArrayRecords, one per valueid.
+    Records are ordered by first appearance. Row order within a tag is kept.
+
+    >>> records = split_by_tagid([7, 3, 7], [1, 2, 3], [0.5, 1.0, 1.5])
+    >>> [(r.tagid, list(r.times)) for r in records]
+    [(7, [1, 3]), (3, [2])]
+    """
+    valueids = np.asarray(valueids)
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(valueids):
+        return []
+    tagids, first_index = np.unique(valueids, return_index=True)
+    order = np.argsort(valueids, kind='mergesort')
+    bounds = np.searchsorted(valueids[order], tagids)
+    bounds = list(bounds) + [len(order)]
+    records = []
+    for i in np.argsort(first_index):
+        rows = order[bounds[i]:bounds[i + 1]]
+        tagid = tagids[i].item() if hasattr(tagids[i], 'item') else tagids[i]
+        records.append(TagArrayRecord(tagid, times[rows], values[rows],
+                                      utc=utc))
+    return records
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,272 @@
+"""Local archive of TagLogging query results.
+
+Values are stored in a SQLite file keyed by host, tagid, timestep and mode,
+together with the UTC time intervals that are completely held locally.
+Only the gaps between those intervals have to be queried from the server
+(see wincc.get_cached_tag_records).
+
+Archived data older than settle_time seconds does not change any more, so
+only that part of a result is stored. Newer values are always fetched.
+
+Timestamps are stored as UTC epoch milliseconds. Several values may have
+the same time; they are kept in the order fetched. Intervals are half
+open [begin, end). For TIMESTEP queries begin and end have to be multiples of
+the timestep (counted from the epoch), otherwise the intervals computed by
+the server would differ between a full and a partial query.
+
+Usage:
+cache = TagCache()
+for begin, end in cache.missing_ranges(host, tagid, 3600, 'avg', b, e):
+    rows = ...  # query server for [begin, end)
+    cache.store(host, tagid, 3600, 'avg', begin, end, rows)
+rows = cache.load(host, tagid, 3600, 'avg', b, e)
+"""
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from .helper import user_cache_path
+from .tag import normalize_timestep
+
+EPOCH = datetime(1970, 1, 1)
+
+# Files with an older schema are emptied and recreated
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host TEXT, tagid INTEGER, timestep INTEGER, mode TEXT, time INTEGER,
+    value REAL);
+CREATE INDEX IF NOT EXISTS samples_key
+    ON samples (host, tagid, timestep, mode, time);
+CREATE TABLE IF NOT EXISTS intervals (
+    host TEXT, tagid INTEGER, timestep INTEGER, mode TEXT, begin INTEGER,
+    end INTEGER);
+CREATE INDEX IF NOT EXISTS intervals_key
+    ON intervals (host, tagid, timestep, mode);
+"""
+
+
+def datetime_to_epoch_ms(dt):
+    """Return naive UTC datetime as epoch milliseconds.
+
+    >>> datetime_to_epoch_ms(datetime(2015, 8, 24, 0, 0, 0, 1000))
+    1440374400001
+    """
+    delta = dt - EPOCH
+    return ((delta.days * 86400 + delta.seconds) * 1000 +
+            delta.microseconds // 1000)
+
+
+def epoch_ms_to_datetime(epoch_ms):
+    """Return naive UTC datetime of epoch milliseconds.
+
+    >>> epoch_ms_to_datetime(1440374400001)
+    datetime.datetime(2015, 8, 24, 0, 0, 0, 1000)
+    """
+    return EPOCH + timedelta(milliseconds=epoch_ms)
+
+
+def merge_intervals(intervals):
+    """Return sorted list of intervals with overlapping and adjacent
+    intervals merged.
+
+    >>> merge_intervals([(5, 8), (0, 2), (2, 4), (7, 9)])
+    [(0, 4), (5, 9)]
+    """
+    merged = []
+    for begin, end in sorted(intervals):
+        if merged and begin <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((begin, end))
+    return merged
+
+
+def subtract_intervals(begin, end, intervals):
+    """Return the parts of [begin, end) not covered by sorted intervals.
+
+    >>> subtract_intervals(0, 10, [(2, 4), (6, 12)])
+    [(0, 2), (4, 6)]
+    """
+    missing = []
+    current = begin
+    for i_begin, i_end in intervals:
+        if i_end <= current:
+            continue
+        if i_begin >= end:
+            break
+        if i_begin > current:
+            missing.append((current, i_begin))
+        current = max(current, i_end)
+    if current < end:
+        missing.append((current, end))
+    return missing
+
+
+class TagCache():
+    """SQLite store of tag values and the intervals held for them.
+
+    All datetimes passed in and returned are naive UTC datetimes. Safe to
+    share between threads; several processes may use the same file. The
+    default file is tag_cache.sqlite in the per user cache directory
+    (see helper.user_cache_path).
+    """
+
+    filename = None
+    # Values younger than this many seconds may still change on the server
+    settle_time = 3600
+
+    def __init__(self, filename=None, settle_time=None):
+        if filename is not None:
+            self.filename = filename
+        if self.filename is None:
+            self.filename = user_cache_path('tag_cache.sqlite')
+        if settle_time is not None:
+            self.settle_time = settle_time
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.filename, timeout=30)
+        if not self._initialized:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                with conn:
+                    conn.execute("DROP TABLE IF EXISTS samples")
+                    conn.execute("DROP TABLE IF EXISTS intervals")
+            conn.executescript(SCHEMA)
+            conn.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+            self._initialized = True
+        return conn
+
+    def key(self, host, tagid, timestep, mode):
+        """Return normalized (host, tagid, timestep, mode) key. The mode is
+        irrelevant for raw values (timestep 0)."""
+        timestep = normalize_timestep(timestep)
+        return (host.lower(), int(tagid), timestep,
+                mode if timestep else 'raw')
+
+    def horizon(self, now=None):
+        """Return the UTC time up to which archived values are final."""
+        if now is None:
+            now = datetime.utcnow()
+        return now - timedelta(seconds=self.settle_time)
+
+    def is_cacheable(self, timestep, begin, end):
+        """Return True if [begin, end) can be split at interval boundaries
+        without changing TIMESTEP intervals computed by the server."""
+        step_ms = normalize_timestep(timestep) * 1000
+        if not step_ms:
+            return True
+        return (datetime_to_epoch_ms(begin) % step_ms == 0 and
+                datetime_to_epoch_ms(end) % step_ms == 0)
+
+    def intervals(self, host, tagid, timestep, mode):
+        """Return sorted list of (begin, end) epoch ms intervals held."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT begin, end FROM intervals WHERE host = ? AND "
+                "tagid = ? AND timestep = ? AND mode = ? ORDER BY begin",
+                self.key(host, tagid, timestep, mode)).fetchall()
+        finally:
+            conn.close()
+        return [(begin, end) for begin, end in rows]
+
+    def missing_ranges(self, host, tagid, timestep, mode, begin, end):
+        """Return list of (begin, end) datetimes within [begin, end) not
+        held locally."""
+        missing = subtract_intervals(datetime_to_epoch_ms(begin),
+                                     datetime_to_epoch_ms(end),
+                                     self.intervals(host, tagid, timestep,
+                                                    mode))
+        return [(epoch_ms_to_datetime(m_begin), epoch_ms_to_datetime(m_end))
+                for m_begin, m_end in missing]
+
+    def store(self, host, tagid, timestep, mode, begin, end, rows,
+              horizon=None):
+        """Store rows ((time, value) tuples) fetched for [begin, end).
+        Only the part before horizon (default: self.horizon()) is stored
+        and marked as held. Returns the end of the stored part or None.
+        """
+        if horizon is None:
+            horizon = self.horizon()
+        key = self.key(host, tagid, timestep, mode)
+        begin_ms = datetime_to_epoch_ms(begin)
+        end_ms = datetime_to_epoch_ms(min(end, horizon))
+        # A TIMESTEP interval reaching beyond horizon is not final yet
+        step_ms = key[2] * 1000
+        if step_ms:
+            end_ms -= (end_ms - begin_ms) % step_ms
+        if end_ms <= begin_ms:
+            return None
+        end = epoch_ms_to_datetime(end_ms)
+        samples = [key + (datetime_to_epoch_ms(time), value)
+                   for time, value in rows]
+        samples = [sample for sample in samples
+                   if begin_ms <= sample[4] < end_ms]
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    # Replace values stored for the range by a concurrent
+                    # fetch, keep values with equal times
+                    conn.execute(
+                        "DELETE FROM samples WHERE host = ? AND tagid = ? AND "
+                        "timestep = ? AND mode = ? AND time >= ? AND "
+                        "time < ?", key + (begin_ms, end_ms))
+                    conn.executemany(
+                        "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?)",
+                        samples)
+                    held = conn.execute(
+                        "SELECT begin, end FROM intervals WHERE host = ? AND "
+                        "tagid = ? AND timestep = ? AND mode = ?",
+                        key).fetchall()
+                    conn.execute(
+                        "DELETE FROM intervals WHERE host = ? AND tagid = ? "
+                        "AND timestep = ? AND mode = ?", key)
+                    conn.executemany(
+                        "INSERT INTO intervals VALUES (?, ?, ?, ?, ?, ?)",
+                        [key + interval for interval
+                         in merge_intervals(held + [(begin_ms, end_ms)])])
+            finally:
+                conn.close()
+        logging.debug("Stored %s values of tag %s (%s, %s) for %s - %s.",
+                      len(samples), tagid, timestep, mode, begin, end)
+        return end
+
+    def load(self, host, tagid, timestep, mode, begin, end):
+        """Return list of (time, value) tuples held for [begin, end)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT time, value FROM samples WHERE host = ? AND "
+                "tagid = ? AND timestep = ? AND mode = ? AND time >= ? AND "
+                "time < ? ORDER BY time, rowid",
+                self.key(host, tagid, timestep, mode) +
+                (datetime_to_epoch_ms(begin), datetime_to_epoch_ms(end))
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(epoch_ms_to_datetime(time), value) for time, value in rows]
+
+    def clear(self, host=None):
+        """Remove everything stored, or only what is stored for host."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for table in ('samples', 'intervals'):
+                        if host is None:
+                            conn.execute("DELETE FROM {0}".format(table))
+                        else:
+                            conn.execute("DELETE FROM {0} WHERE host = ?"
+                                         .format(table), (host.lower(),))
+            finally:
+                conn.close()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,172 @@
+"""Conversion of whole UTC timestamp columns to local time.
+
+Converting row by row with datetime.astimezone() asks the zone for its
+UTC offset on every row (for tz.tzlocal() that is a time.localtime()
+call). Offsets only change at DST transitions, so a TransitionTable
+computes them once per zone and range of years. Converting a column is
+then a lookup of the offset segment each timestamp falls into: bisect per
+row for datetimes (localize), numpy.searchsorted for epoch ms arrays
+(utc_ms_to_local_ms).
+
+Set use_tables = False to fall back to astimezone() per row.
+
+Usage:
+local_datetimes = localize(utc_datetimes)
+local_ms = utc_ms_to_local_ms(times)
+"""
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from dateutil import tz
+
+from .helper import get_tz
+
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400
+
+# False: convert row by row with astimezone() like helper.utc_to_local()
+use_tables = True
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _epoch_seconds(dt):
+    delta = dt - EPOCH
+    return delta.days * DAY + delta.seconds
+
+
+def _offset(zone, epoch_s):
+    """Return UTC offset of zone in seconds at epoch second epoch_s."""
+    utc = (EPOCH + timedelta(seconds=epoch_s)).replace(tzinfo=get_tz('UTC'))
+    offset = utc.astimezone(zone).utcoffset()
+    return offset.days * DAY + offset.seconds
+
+
+class TransitionTable():
+    """UTC offsets of zone from Jan 1st of first_year to the end of
+    last_year (UTC).
+
+    Offset offsets[i] (seconds) applies from epoch second starts[i] until
+    starts[i + 1]. Transitions are found by sampling the offset daily and
+    bisecting to the second where it changes.
+    """
+
+    def __init__(self, zone, first_year, last_year):
+        self.zone = zone
+        begin = _epoch_seconds(datetime(first_year, 1, 1))
+        end = _epoch_seconds(datetime(last_year + 1, 1, 1))
+        self.starts = [begin]
+        self.offsets = [_offset(zone, begin)]
+        previous = begin
+        for t in range(begin + DAY, end + DAY, DAY):
+            offset = _offset(zone, t)
+            if offset != self.offsets[-1]:
+                low, high = previous, t
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if _offset(zone, middle) == self.offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                self.starts.append(high)
+                self.offsets.append(offset)
+            previous = t
+        self.start_datetimes = [EPOCH + timedelta(seconds=start)
+                                for start in self.starts]
+
+    def folded_until(self, i):
+        """Return the epoch second until which wall times of segment i are
+        the second occurrence of an ambiguous hour (DST end), or None."""
+        if i == 0 or self.offsets[i] >= self.offsets[i - 1]:
+            return None
+        return self.starts[i] + self.offsets[i - 1] - self.offsets[i]
+
+
+def get_transition_table(zone_name, begin, end):
+    """Return (cached) TransitionTable of zone_name covering the naive UTC
+    datetimes begin to end."""
+    key = (zone_name, begin.year, end.year)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = TransitionTable(get_tz(zone_name), begin.year, end.year)
+            _tables[key] = table
+        return table
+
+
+def localize(datetimes, zone_name='local'):
+    """Convert naive UTC datetimes to aware datetimes in zone_name.
+    Same result as helper.utc_to_local() on every datetime.
+
+    >>> localize([datetime(2015, 8, 24, 8, 48, 10)], 'Europe/Berlin')[0].isoformat()
+    '2015-08-24T10:48:10+02:00'
+    """
+    if not datetimes:
+        return []
+    zone = get_tz(zone_name)
+    if not use_tables:
+        utc = get_tz('UTC')
+        return [dt.replace(tzinfo=utc).astimezone(zone) for dt in datetimes]
+    table = get_transition_table(zone_name, min(datetimes), max(datetimes))
+    start_datetimes = table.start_datetimes
+    # Results are usually sorted, so remember the current segment
+    segment_begin = segment_end = None
+    local_datetimes = []
+    for dt in datetimes:
+        if segment_begin is None or not segment_begin <= dt < segment_end:
+            i = bisect_right(start_datetimes, dt) - 1
+            segment_begin = start_datetimes[i]
+            segment_end = (start_datetimes[i + 1]
+                           if i + 1 < len(start_datetimes) else datetime.max)
+            offset = timedelta(seconds=table.offsets[i])
+            folded_until = table.folded_until(i)
+            if folded_until is not None:
+                folded_until = EPOCH + timedelta(seconds=folded_until)
+        local = (dt + offset).replace(tzinfo=zone)
+        if folded_until is not None and dt < folded_until:
+            local = tz.enfold(local, fold=1)
+        local_datetimes.append(local)
+    return local_datetimes
+
+
+def utc_offsets_ms(epoch_ms, zone_name='local'):
+    """Return the UTC offsets (ms) of zone_name at UTC epoch ms (array)."""
+    import numpy as np
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    if not len(epoch_ms):
+        return np.zeros(0, dtype=np.int64)
+    if not use_tables:
+        zone = get_tz(zone_name)
+        return np.array([_offset(zone, ms // 1000) * 1000 for ms in epoch_ms],
+                        dtype=np.int64)
+    table = get_transition_table(
+        zone_name, EPOCH + timedelta(milliseconds=int(epoch_ms.min())),
+        EPOCH + timedelta(milliseconds=int(epoch_ms.max())))
+    starts = np.array(table.starts, dtype=np.int64) * 1000
+    segments = np.searchsorted(starts, epoch_ms, side='right') - 1
+    return np.array(table.offsets, dtype=np.int64)[segments] * 1000
+
+
+def utc_ms_to_local_ms(epoch_ms, zone_name='local'):
+    """Shift UTC epoch ms (array) to local wall clock epoch ms.
+
+    >>> utc_ms_to_local_ms([1440406090483], 'Europe/Berlin')
+    array([1440413290483])
+    """
+    import numpy as np
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    return epoch_ms + utc_offsets_ms(epoch_ms, zone_name)
+
+
+def epoch_ms_to_datetimes(epoch_ms):
+    """Return list of naive datetimes of epoch ms (array) in one pass."""
+    import numpy as np
+    return np.asarray(epoch_ms, dtype=np.int64).astype(
+        'datetime64[ms]').astype(object).tolist()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -36,7 +36,7 @@ def get_daily_key_figures_avg(host_info, day):
     # tagids = [key_figures[key] for key in key_figures]
     tagids = [tagid for tagid in config["tags"]]
     do_tag_report(host_info, begin_day, end_day, tagids, 3600, 'avg',
-                  plot=True, plot_config=config)
+                  plot=True, plot_config=config, columnar=True)
     # num_cores = multiprocessing.cpu_count()
     # logging.debug("Found %s cores", num_cores)
     # Parallel(n_jobs=num_cores)(delayed(do_tag_report)
@@ -1,27 +1,38 @@
 from __future__ import print_function
-import adodbapi
 import logging
 import warnings
 import re
 import pickle
 import traceback
 import os
-import multiprocessing
-from joblib import Parallel, delayed
+import threading
+from bisect import bisect_left
+from time import time
 from datetime import timedelta
 # from collections import namedtuple
 
 from .mssql import mssql, MsSQLException
-from .helper import datetime_to_str, utc_to_local, tic, str_to_date,\
+from .helper import datetime_to_str, utc_to_local, str_to_date,\
     daterange, date_to_str, datetime_to_str_without_ms, get_next_month,\
-    str_to_datetime
-from .alarm import Alarm, AlarmRecord, alarm_query_builder
-from .tag import Tag, TagRecord, tag_query_builder, plot_tag_records, \
-    plot_tag_records2
+    str_to_datetime, local_time_to_utc
+from .alarm import Alarm, AlarmRecord, ColumnarAlarmRecord, \
+    alarm_query_builder
+from .tag import Tag, TagRecord, tag_query_builder, plot_tag_records2, \
+    normalize_timestep
 from .operator_messages import om_query_builder, OperatorMessageRecord,\
     OperatorMessage
-from .report import generate_alarms_report, operator_messages_report
-import monkey_patch
+from .report import generate_alarms_report, operator_messages_report, \
+    alarms_report_filename, alarms_template_name, template_version, \
+    report_config
+from .manifest import data_fingerprint, open_report_manifest
+from .database_cache import DatabaseNameCache
+from .result_cache import ResultCache
+from .instrumentation import phase
+from .chunking import ChunkPlanner, chunk_config, host_semaphore, \
+    merge_chunks
+from .batching import TagidQueue, batch_config, get_batch_planner
+from .tzconvert import localize
+from .driver import com_thread
 
 
 class WinCCException(Exception):
@@ -38,25 +49,39 @@ class wincc(mssql):
     conn_str_test = "Provider=%(provider)s;Catalog=%(database)s;\
     Data Source=%(host)s;Uid=VASAdmin;Pwd=udu3zsm3"
     provider = 'WinCCOLEDBProvider.1'
+    # TAG and ALARMVIEW queries need adodbapi (or the simulator)
+    driver_name = 'adodbapi'
 
-    def __init__(self, host, database=None):
+    # Resolved database names per host. Set to None to disable caching.
+    name_cache = DatabaseNameCache()
+
+    # Cheap query for checking pooled connections
+    health_check_query = ("ALARMVIEW:SELECT * FROM ALGVIEWDEU WHERE "
+                          "DateTime > '2000-01-01 00:00:00' AND "
+                          "DateTime < '2000-01-01 00:00:01'")
+
+    def __init__(self, host, database=None, pooled=False, driver=None):
         """Class constructor. If database is not given it tries to determine \
         wincc database name by connecting with
         Microsoft OLEDB Provider first. You can save some time by passing \
         database name here.
+        Pass pooled=True to reuse warm connections (see pool.py).
+        driver is a driver name (see driver.py).
         """
         if host.find(r'\WINCC') == -1:
             host += r'\WINCC'
             logging.info(r"Missing instance name at hostname. Appending\
              \WINCC.")
 
-        self.host = host
-        self.database = database
-        self.conn = None
-        self.cursor = None
+        mssql.__init__(self, host, database, pooled, driver)
 
     def connect(self):
         """Connect to wincc mssql database using WinCCOLEDBProvider.1"""
+        from_cache = False
+        if not self.database and self.name_cache:
+            self.database = self.name_cache.get(self.host, 'runtime')
+            from_cache = bool(self.database)
+
         if not self.database:
             warnings.warn("Initial Database not given. Will try to fetch it's\
              name. But this will take some time.")
@@ -67,29 +92,49 @@ class wincc(mssql):
             raise WinCCException("Could not fetch WinCC runtime database. \
             Please check databases at host {host}.".format(host=self.host))
 
+        try:
+            mssql.connect(self)
+        except WinCCException:
+            if not from_cache:
+                raise
+            # Cached names may be stale e.g. after a database rollover, which
+            # renames the config database too
+            logging.info("Connect with cached database %s failed. Resolving "
+                         "database name again.", self.database)
+            self.name_cache.invalidate(self.host)
+            self.database = self.fetch_wincc_database_name()
+            mssql.connect(self)
+
+    def open_connection(self):
+        """Open and return a new connection using WinCCOLEDBProvider.1"""
         try:
             logging.info("Trying to connect to %s database %s", self.host,
                          self.database)
-            # Python looses it's current working dir in the next instruction
-            # Reset after connect
-            curr_dir  = os.getcwd()
-
-            self.conn = adodbapi.connect(self.conn_str,
-                                         provider=self.provider,
-                                         host=self.host,
-                                         database=self.database)
-
+            conn = self.driver.connect(self.conn_str, self.provider,
+                                       self.host, self.database)
             logging.info("Connected.")
+            return conn
 
-            os.chdir(curr_dir)
-            self.cursor = self.conn.cursor()
-
-        except (adodbapi.DatabaseError, adodbapi.InterfaceError) as e:
+        except self.driver.errors as e:
             print(e)
             print(traceback.format_exc())
             raise WinCCException(message='Connection to host {host} failed.'
                                  .format(host=self.host))
 
+    def check_connection(self, conn):
+        """Health check for pooled connections.
+        The WinCC provider only understands TAG and ALARMVIEW queries, so
+        an alarm query over one second without alarms is run. It raises on
+        a dead server connection.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.health_check_query)
+            cursor.fetchall()
+            return True
+        finally:
+            cursor.close()
+
     def filter_wincc_runtime_database(self, databases):
         """Extract wincc runtime databases out of given databases
 
@@ -154,9 +199,11 @@ class wincc(mssql):
         """
         Connect to MsSQL server with Microsoft SQLOLEDB.1 provider.
         Get database list and filter wincc runtime databases.
+        The result and the config database of the same list are stored in
+        the database name cache.
         """
         try:
-            m = mssql(self.host, '')
+            m = mssql(self.host, '', driver=self.driver.plain_sql_driver)
             m.connect()
             databases = m.fetch_database_names()
             m.close()
@@ -165,22 +212,36 @@ class wincc(mssql):
                 raise WinCCException("Could not fetch wincc runtime database. "
                                      "Please make sure WinCC runtime is active"
                                      " on host {host}".format(host=self.host))
+            if self.name_cache:
+                self.name_cache.set(self.host, 'runtime', self.database)
+                config_database = self.filter_wincc_config_database(databases)
+                if config_database:
+                    self.name_cache.set(self.host, 'config', config_database)
             return self.database
         except MsSQLException:
             raise WinCCException("Could not connect to host {host} with \
             Microsoft SQLOLEDB.1 provider".format(host=self.host))
 
-    def fetch_wincc_config_database_name(self):
+    def fetch_wincc_config_database_name(self, use_cache=True):
         """
         Connect to MsSQL server with Microsoft SQLOLEDB.1 provider.
         Get database list and filter wincc runtime database.
+        Cached names are used unless use_cache is False.
         """
+        if use_cache and self.name_cache:
+            database = self.name_cache.get(self.host, 'config')
+            if database:
+                return database
         try:
-            mssql_ = mssql(self.host, '')
+            mssql_ = mssql(self.host, '',
+                           driver=self.driver.plain_sql_driver)
             mssql_.connect()
             databases = mssql_.fetch_database_names()
             mssql_.close()
-            return self.filter_wincc_config_database(databases)
+            database = self.filter_wincc_config_database(databases)
+            if database and self.name_cache:
+                self.name_cache.set(self.host, 'config', database)
+            return database
         except MsSQLException:
             raise WinCCException("Could not connect to host {host} with \
             Microsoft SQLOLEDB.1 provider".format(host=self.host))
@@ -192,8 +253,10 @@ class wincc(mssql):
         """
         try:
             logging.debug("Executing query %s.", query)
-            self.cursor.execute(query)
-        except (adodbapi.DatabaseError, adodbapi.InterfaceError) as e:
+            self.last_query = query
+            with phase('execute', query):
+                self.cursor.execute(query)
+        except self.driver.errors as e:
             errormsg = "Query: %s failed. Reason: %s.", query, str(e)
             logging.error(errormsg)
             raise WinCCException(errormsg)
@@ -203,7 +266,7 @@ class wincc(mssql):
         logging.debug("wincc.print_alarms()")
         logging.debug("Rowcount: {rowcount}".format(rowcount=self.rowcount()))
         if self.rowcount():
-            for rec in self.fetchall():
+            for rec in self.iter_rows():
                 datetime_local = utc_to_local(rec['DateTime'])
                 datetime_str = datetime_to_str_without_ms(datetime_local)
                 print(u"{rec[MsgNr]} {rec[State]:2} {datetime} {rec[Classname]}"
@@ -211,93 +274,122 @@ class wincc(mssql):
                       .format(rec=rec, datetime=datetime_str))
             print("Rows: {rows}".format(rows=self.rowcount()))
 
-    def create_alarm_record(self):
-        """Fetches alarms from cursor and returns an AlarmRecord object"""
-        alarms = AlarmRecord()
-        if self.rowcount():
-            for rec in self.fetchall():
-                datetime = datetime_to_str(utc_to_local(rec['DateTime']))
-                alarms.push(Alarm(rec['MsgNr'], rec['State'], datetime,
-                                  rec['Classname'], rec['Typename'],
-                                  rec['Text2'], rec['Text1']))
+    def iter_alarms(self, batch_size=None, utc=False):
+        """Yield Alarm tuples read from cursor in batches of batch_size.
+        Alarm times are converted to local time unless utc is True.
+        """
+        for rows in self.iter_batches(batch_size):
+            if utc:
+                datetimes = [rec['DateTime'] for rec in rows]
+            else:
+                with phase('timezone', self.last_query, len(rows)):
+                    datetimes = localize([rec['DateTime'] for rec in rows])
+            with phase('convert', self.last_query, len(rows)):
+                alarms = [Alarm(rec['MsgNr'], rec['State'],
+                                datetime_to_str(datetime), rec['Classname'],
+                                rec['Typename'], rec['Text2'], rec['Text1'])
+                          for rec, datetime in zip(rows, datetimes)]
+            for alarm in alarms:
+                yield alarm
+
+    def iter_operator_messages(self, batch_size=None):
+        """Yield OperatorMessage tuples read from cursor in batches."""
+        for rows in self.iter_batches(batch_size):
+            with phase('timezone', self.last_query, len(rows)):
+                datetimes = localize([rec['DateTime'] for rec in rows])
+            with phase('convert', self.last_query, len(rows)):
+                operator_messages = [
+                    OperatorMessage(datetime_to_str(datetime), rec['PText1'],
+                                    rec['PText4'], rec['PText2'],
+                                    rec['PText3'], rec['Username'],
+                                    rec['PValue6'], rec['PValue5'],
+                                    rec['PValue7'])
+                    for rec, datetime in zip(rows, datetimes)]
+            for op in operator_messages:
+                yield op
+
+    def iter_tags(self, utc=False, batch_size=None):
+        """Yield (valueid, Tag) tuples read from cursor in batches.
+        Tag times are converted to local time unless utc is True.
+        """
+        for rows in self.iter_batches(batch_size):
+            if utc:
+                datetimes = [rec['timestamp'] for rec in rows]
+            else:
+                with phase('timezone', self.last_query, len(rows)):
+                    datetimes = localize([rec['timestamp'] for rec in rows])
+            with phase('convert', self.last_query, len(rows)):
+                tags = [(rec['valueid'], Tag(datetime, rec['realvalue']))
+                        for rec, datetime in zip(rows, datetimes)]
+            for tag in tags:
+                yield tag
+
+    def create_alarm_record(self, batch_size=None, columnar=False,
+                            utc=False):
+        """Fetches alarms from cursor and returns an AlarmRecord object.
+        columnar=True returns a ColumnarAlarmRecord (less memory).
+        utc=True keeps the UTC alarm times (e.g. for episodes.py)."""
+        alarms = ColumnarAlarmRecord() if columnar else AlarmRecord()
+        for alarm in self.iter_alarms(batch_size, utc):
+            alarms.push(alarm)
         return alarms
 
-    def create_operator_messages_record(self):
+    def create_operator_messages_record(self, batch_size=None):
         """
         Fetches operator messages from cursor.
         Return them as OperatorMessageRecord object"""
         operator_messages = OperatorMessageRecord()
-        if self.rowcount():
-            for rec in self.fetchall():
-                datetime = datetime_to_str(utc_to_local(rec['DateTime']))
-                op = OperatorMessage(datetime, rec['PText1'], rec['PText4'],
-                                     rec['PText2'], rec['PText3'],
-                                     rec['Username'], rec['PValue6'],
-                                     rec['PValue5'], rec['PValue7'])
-                operator_messages.push(op)
+        for op in self.iter_operator_messages(batch_size):
+            operator_messages.push(op)
         return operator_messages
 
-#    def create_tag_record(self):
-#        """Fetch tags from cursor and return a TagRecord object"""
-#        if self.rowcount():
-#            #tags = TagRecord(tagid=rec['valueid'])
-#            for rec in self.fetchall():
-#                datetime = utc_to_local(rec['timestamp'])
-#                tags.push(Tag(datetime, rec['realvalue']))
-#            return tags
-#        return None
-
-    def create_tag_record(self):
+    def create_tag_record(self, utc=False, batch_size=None):
         """Fetch tag from cursor and return a TagRecord objects.
         Use this if you queried for a single tagid.
         """
         tag_record = TagRecord()
-        if self.rowcount():
-            # Fetch first record and write tagrecord.tagid property
-            rec = self.fetchone()
-            tag_record.tagid = rec['valueid']
-            datetime = utc_to_local(rec['timestamp'])
-            tag_record.push(Tag(datetime, rec['realvalue']))
-            # Fetch rest from cursor
-            for rec in self.fetchall():
-                datetime = utc_to_local(rec['timestamp'])
-                tag_record.push(Tag(datetime, rec['realvalue']))
+        for valueid, tag in self.iter_tags(utc, batch_size):
+            tag_record.tagid = valueid
+            tag_record.push(tag)
         return tag_record
 
-    def create_tag_records(self, utc=False):
+    def create_tag_records(self, utc=False, batch_size=None):
         """Fetch tags from cursor and return a list of TagRecord objects.
         Only use this if you queried for multiple tagids.
         """
         tag_records = []
-        p_rec = -1
-        if self.rowcount():
-            # Create first recordset
-            tag_records.append(TagRecord())
-            p_rec += 1
-            rec = self.fetchone()
-            tag_records[p_rec].tagid = rec['valueid']
-            if utc:
-                datetime = rec['timestamp']
-            else:
-                datetime = utc_to_local(rec['timestamp'])
-            tag_records[p_rec].push(Tag(datetime, rec['realvalue']))
-
-            for rec in self.fetchall():
-                if rec['valueid'] != tag_records[p_rec].tagid:
-                    tag_records.append(TagRecord())
-                    p_rec += 1
-                    tag_records[p_rec].tagid = rec['valueid']
-                if utc:
-                    datetime = rec['timestamp']
-                else:
-                    datetime = utc_to_local(rec['timestamp'])
-                tag_records[p_rec].push(Tag(datetime, rec['realvalue']))
+        for valueid, tag in self.iter_tags(utc, batch_size):
+            if not tag_records or valueid != tag_records[-1].tagid:
+                tag_records.append(TagRecord(tagid=valueid))
+            tag_records[-1].push(tag)
+        if tag_records:
             return tag_records
         return None
 
+    def create_tag_arrays(self, utc=False, batch_size=None):
+        """Fetch tags from cursor and return a list of TagArrayRecord objects
+        (one per tagid) holding NumPy arrays of epoch ms and values.
+        Each fetched batch is converted in bulk. Requires numpy.
+        """
+        from .tag_array import datetimes_to_epoch_ms, split_by_tagid
+        import numpy as np
+        valueids, times, values = [], [], []
+        for rows in self.iter_batches(batch_size):
+            with phase('convert', self.last_query, len(rows)):
+                valueids.append(np.array([rec['valueid'] for rec in rows]))
+                times.append(datetimes_to_epoch_ms([rec['timestamp']
+                                                    for rec in rows]))
+                values.append(np.array([rec['realvalue'] for rec in rows],
+                                       dtype=np.float64))
+        if not valueids:
+            return []
+        return split_by_tagid(np.concatenate(valueids),
+                              np.concatenate(times),
+                              np.concatenate(values), utc)
+
     def print_operator_messages(self):
         if self.rowcount():
-            for rec in self.fetchall():
+            for rec in self.iter_rows():
                 print("PText1", rec['PText1'])
                 print("PText2", rec['PText2'])
                 print("PText3", rec['PText3'])
@@ -317,81 +409,250 @@ class wincc(mssql):
                       rec['PText1'], rec['PText2'], rec['PText3'],
                       rec['PText4'], rec['Username'])
 
-    def close(self):
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
+
+def sync_alarm_archive(host, database, archive, begin_time='', utc=False):
+    """Copy alarms and operator messages newer than what archive (an
+    AlarmArchive) holds from host. begin_time is where to start if host was
+    never synced, or an earlier time to fill in. Return number of rows read.
+    """
+    begin = None
+    if begin_time:
+        begin = str_to_datetime(begin_time)
+        if not utc:
+            begin = local_time_to_utc(begin).replace(tzinfo=None)
+    w = wincc(host, database, pooled=True)
+    try:
+        w.connect()
+        num_rows = archive.sync(w, host, begin)
+    except Exception:
+        # A broken connection must not go back to the pool
+        w.close(discard=True)
+        raise
+    w.close()
+    return num_rows
+
+
+def query_record(host, database, kind, query, begin_time, end_time,
+                 result_cache=None, cache=False, use_cached=False):
+    """Execute an alarm or operator message query (kind 'alarms' or
+    'operator_messages') on a pooled connection and return the
+    AlarmRecord or OperatorMessageRecord.
+
+    With use_cached a result found in result_cache (a ResultCache) is
+    returned instead of querying the server, with cache the result is
+    stored there.
+    """
+    key = None
+    if result_cache is not None and (cache or use_cached):
+        key = result_cache.key(kind, host, database, query, begin_time,
+                               end_time)
+    rows = result_cache.get(key) if key and use_cached else None
+    if rows is not None:
+        logging.debug("Using cached %s of %s - %s.", kind, begin_time,
+                      end_time)
+        if kind == 'alarms':
+            return AlarmRecord(rows)
+        record = OperatorMessageRecord()
+        for om in rows:
+            record.push(om)
+        return record
+    w = wincc(host, database, pooled=True)
+    try:
+        w.connect()
+        w.execute(query)
+        if kind == 'alarms':
+            record = w.create_alarm_record()
+        else:
+            record = w.create_operator_messages_record()
+    except Exception:
+        w.close(discard=True)
+        raise
+    w.close()
+    if key and cache:
+        result_cache.put(key, record)
+    return record
 
 
 def do_alarm_report(begin_time, end_time, host, database='',
                     cache=False, use_cached=False, host_desc='',
-                    with_operator_messages=False):
+                    with_operator_messages=False, archive=None,
+                    result_cache=None):
+    """Generate alarm report. With an AlarmArchive as archive, the archive
+    is synced first and the report is generated from it.
+
+    With cache query results are stored in result_cache (a ResultCache,
+    by default in ./result_cache), with use_cached results found there are
+    used instead of querying the server.
+    """
     logging.debug("Doing alarm report for %s - %s", begin_time, end_time)
-    if not use_cached:
-        query = alarm_query_builder(begin_time, end_time, '', False, '')
+    operator_messages = None
+    if archive is not None:
+        sync_alarm_archive(host, database, archive, begin_time)
+        alarms = archive.alarm_record(host, begin_time, end_time)
+        if with_operator_messages:
+            operator_messages = archive.operator_messages_record(
+                host, begin_time, end_time)
+    else:
+        if (cache or use_cached) and result_cache is None:
+            result_cache = ResultCache()
         alarms = None
-        toc = tic()
         try:
-            w = wincc(host, database)
-            w.connect()
-            w.execute(query)
-            # w.print_operator_messages()
-            alarms = w.create_alarm_record()
-            # print("Fetched data in {time}.".format(time=round(toc(),3)))
-            if cache:
-                print("Caching!")
-                logging.debug("Writing alarms to %s", "alarms.pkl")
-                pkl_file = open('alarms.pkl', 'wb')
-                pickle.dump(alarms, pkl_file)
-                pkl_file.close()
-
+            alarms = query_record(
+                host, database, 'alarms',
+                alarm_query_builder(begin_time, end_time, '', False, ''),
+                begin_time, end_time, result_cache, cache, use_cached)
             if with_operator_messages:
-                query = om_query_builder(begin_time, end_time)
-                w.execute(query)
-                operator_messages = w.create_operator_messages_record()
-            else:
-                operator_messages = None
+                operator_messages = query_record(
+                    host, database, 'operator_messages',
+                    om_query_builder(begin_time, end_time), begin_time,
+                    end_time, result_cache, cache, use_cached)
         except WinCCException as e:
             print(e)
             print(traceback.format_exc())
-        finally:
-            w.close()
-            exec_time_alarms = toc()
-            print(exec_time_alarms)
-    else:
-        logging.debug("Current dir: %s", os.getcwd())
-        logging.debug("Loading alarms from file 'alarms.pkl'.")
-        pkl_file = open('alarms.pkl', 'rb')
-        alarms = pickle.load(pkl_file)
-        pkl_file.close()
     generate_alarms_report(alarms, begin_time, end_time, host_desc, '',
                            operator_messages=operator_messages)
 
 
+def fetch_alarms_and_operator_messages(host, database, begin_time, end_time,
+                                       chunk_days=31, archive=None,
+                                       sync=True, result_cache=None):
+    """Return (alarms, operator_messages) as lists sorted by time with
+    begin_time <= datetime < end_time (local time).
+
+    The range is fetched in chunks of at most chunk_days days over one
+    pooled connection, or read from archive (an AlarmArchive) after
+    syncing it (unless sync is False). With a ResultCache as result_cache
+    chunks found there are not queried and queried chunks are stored.
+    """
+    dt_begin = str_to_datetime(begin_time)
+    dt_end = str_to_datetime(end_time)
+    alarms, operator_messages = [], []
+    if archive is not None:
+        if sync:
+            sync_alarm_archive(host, database, archive, dt_begin)
+        alarms = list(archive.alarm_record(host, dt_begin, dt_end))
+        operator_messages = list(archive.operator_messages_record(
+            host, dt_begin, dt_end))
+    else:
+        w = None
+        try:
+            chunk_begin = dt_begin
+            while chunk_begin < dt_end:
+                chunk_end = min(dt_end, chunk_begin + timedelta(chunk_days))
+                # The queries compare whole seconds and exclude both ends
+                query_begin = chunk_begin - timedelta(seconds=1)
+                query_end = chunk_end + timedelta(seconds=1)
+                first = datetime_to_str(chunk_begin)
+                last = datetime_to_str(chunk_end)
+                for kind, rows, query, iter_rows in (
+                        ('alarms', alarms,
+                         alarm_query_builder(query_begin, query_end),
+                         'iter_alarms'),
+                        ('operator_messages', operator_messages,
+                         om_query_builder(query_begin, query_end),
+                         'iter_operator_messages')):
+                    key = None
+                    if result_cache is not None:
+                        key = result_cache.key(kind, host, database, query,
+                                               first, last)
+                        cached = result_cache.get(key)
+                        if cached is not None:
+                            rows.extend(cached)
+                            continue
+                    if w is None:
+                        w = wincc(host, database, pooled=True)
+                        w.connect()
+                    w.execute(query)
+                    chunk_rows = [row for row in getattr(w, iter_rows)()
+                                  if first <= row.datetime < last]
+                    if key is not None:
+                        result_cache.put(key, chunk_rows)
+                    rows.extend(chunk_rows)
+                chunk_begin = chunk_end
+        except Exception:
+            if w is not None:
+                w.close(discard=True)
+            raise
+        if w is not None:
+            w.close()
+    logging.info("Fetched %s alarms and %s operator messages for %s - %s.",
+                 len(alarms), len(operator_messages), begin_time, end_time)
+    return alarms, operator_messages
+
+
+def split_by_time(items, windows):
+    """Return one list per (begin, end) window with the items whose
+    datetime string lies in [begin, end). items must be sorted by datetime.
+
+    >>> from collections import namedtuple
+    >>> Item = namedtuple('Item', 'datetime')
+    >>> items = [Item('2015-08-24 23:59:59.999'), Item('2015-08-25 00:00:00.000')]
+    >>> split_by_time(items, [('2015-08-24', '2015-08-25'), ('2015-08-25', '2015-08-26')])
+    [[Item(datetime='2015-08-24 23:59:59.999')], [Item(datetime='2015-08-25 00:00:00.000')]]
+    """
+    datetimes = [item.datetime for item in items]
+    return [items[bisect_left(datetimes, begin):bisect_left(datetimes, end)]
+            for begin, end in windows]
+
+
 def do_batch_alarm_report(begin_day, end_day, host_address, database,
-                          host_desc='', timestep=1, parallel=False):
+                          host_desc='', timestep=1, parallel=False,
+                          archive=None, force=False, result_cache=None,
+                          **pipeline_options):
+    """Generate one alarm report per day from begin_day to end_day
+    (excluded), each covering timestep days.
+
+    Alarms and operator messages of the whole range are fetched once (see
+    fetch_alarms_and_operator_messages) and split into local days in
+    memory. With parallel=True buckets of days are fetched by threads and
+    rendered by a process pool (see pipeline.run_batch_report, which
+    takes the pipeline_options) and the PipelineMetrics are returned.
+
+    Reports whose data and template did not change since they were last
+    generated are skipped (see manifest), unless force is True. Query
+    results are shared through result_cache (a ResultCache) if given.
+    """
     dt_begin_day = str_to_date(begin_day)
     dt_end_day = str_to_date(end_day)
+    days = list(daterange(dt_begin_day, dt_end_day))
+    if not days:
+        return
+    windows = [(date_to_str(day), date_to_str(day + timedelta(timestep)))
+               for day in days]
     if parallel:
-        # Based on the example from here: http://sebastianraschka.com/\
-        # Articles/2014_multiprocessing_intro.html
-        num_cores = multiprocessing.cpu_count()
-        Parallel(n_jobs=num_cores)(delayed(do_alarm_report)
-                                   (date_to_str(day),
-                                    date_to_str(day + timedelta(timestep)),
-                                    host_address, database,
-                                    host_desc=host_desc,
-                                    with_operator_messages=True)
-                                   for day in daterange(dt_begin_day, dt_end_day))
-    else:
-        for day in daterange(dt_begin_day, dt_end_day):
-            logging.info('Trying to generate report for %s - %s.',
-                         begin_day, end_day)
-            do_alarm_report(date_to_str(day),
-                            date_to_str(day + timedelta(timestep)),
-                            host_address, database, host_desc=host_desc,
-                            with_operator_messages=True)
+        from .pipeline import run_batch_report
+        return run_batch_report(host_address, database, host_desc, windows,
+                                archive, force=force,
+                                result_cache=result_cache,
+                                **pipeline_options)
+    alarms, operator_messages = fetch_alarms_and_operator_messages(
+        host_address, database, windows[0][0], windows[-1][1],
+        archive=archive, result_cache=result_cache)
+    manifest = open_report_manifest()
+    virtual = report_config['virtual']
+    version = template_version(alarms_template_name(virtual))
+    try:
+        for (begin, end), day_alarms, day_oms in zip(
+                windows, split_by_time(alarms, windows),
+                split_by_time(operator_messages, windows)):
+            filename = alarms_report_filename(begin, end, host_desc)
+            fingerprint = data_fingerprint(day_alarms, day_oms)
+            if not force and manifest.is_current(filename, fingerprint,
+                                                 version, virtual):
+                logging.info('Report for %s - %s is up to date.', begin, end)
+                continue
+            day_operator_messages = OperatorMessageRecord()
+            for om in day_oms:
+                day_operator_messages.push(om)
+            logging.info('Trying to generate report for %s - %s.', begin,
+                         end)
+            generate_alarms_report(AlarmRecord(day_alarms), begin, end,
+                                   host_desc, '',
+                                   operator_messages=day_operator_messages,
+                                   virtual=virtual)
+            manifest.record(filename, fingerprint, version)
+    finally:
+        manifest.save()
 
 
 def do_alarm_report_monthly(begin_day, host_address, database,
@@ -403,108 +664,405 @@ def do_alarm_report_monthly(begin_day, host_address, database,
 
 
 def do_operator_messages_report(begin_time, end_time, host, database='',
-                                cache=False, use_cached=False, host_desc=''):
-    if not use_cached:
-        query = om_query_builder(begin_time, end_time)
+                                cache=False, use_cached=False, host_desc='',
+                                archive=None, result_cache=None):
+    """Generate operator messages report, see do_alarm_report for archive,
+    cache, use_cached and result_cache."""
+    if archive is not None:
+        sync_alarm_archive(host, database, archive, begin_time)
+        operator_messages = archive.operator_messages_record(host, begin_time,
+                                                             end_time)
+    else:
+        if (cache or use_cached) and result_cache is None:
+            result_cache = ResultCache()
         operator_messages = None
-        toc = tic()
         try:
-            w = wincc(host, database)
-            w.connect()
-            w.execute(query)
-            operator_messages = w.create_operator_messages_record()
-            if cache:
-                print("Caching!")
-                logging.debug("Writing operator_messages to %s",
-                              "operator_messages.pkl")
-                pkl_file = open('operator_messages.pkl', 'wb')
-                pickle.dump(operator_messages, pkl_file)
-                pkl_file.close()
+            operator_messages = query_record(
+                host, database, 'operator_messages',
+                om_query_builder(begin_time, end_time), begin_time,
+                end_time, result_cache, cache, use_cached)
         except WinCCException as e:
             print(e)
             print(traceback.format_exc())
-        finally:
-            w.close()
-            exec_time_operator_messages = toc()
-            print(exec_time_operator_messages)
-    else:
-        logging.debug("Current dir: %s", os.getcwd())
-        logging.debug("Loading operator_messages from file "
-                      "'operator_messages.pkl'.")
-        pkl_file = open('operator_messages.pkl', 'rb')
-        operator_messages = pickle.load(pkl_file)
-        pkl_file.close()
 
     print("Generating HTML output...")
     operator_messages_report(operator_messages, begin_time, end_time,
                              host_desc)
 
 
+def utc_time_range(begin_time, end_time, utc=False):
+    """Return (begin, end) as naive UTC datetimes or None if the range is
+    open or relative."""
+    if not end_time or begin_time[0:4] == '0000' or end_time[0:4] == '0000':
+        return None
+    begin = str_to_datetime(begin_time)
+    end = str_to_datetime(end_time)
+    if not utc:
+        begin = local_time_to_utc(begin).replace(tzinfo=None)
+        end = local_time_to_utc(end).replace(tzinfo=None)
+    return begin, end
+
+
+def build_tag_records(tagids, rows_by_tag, columnar=False, utc=False):
+    """Return TagRecords or TagArrayRecords for tagids from a dict
+    tagid -> list of (UTC time, value). Times are presented in local time
+    unless utc is True, like create_tag_records and create_tag_arrays."""
+    tag_records = []
+    for tagid in tagids:
+        rows = rows_by_tag.get(int(tagid), [])
+        if columnar:
+            from .tag_array import TagArrayRecord, datetimes_to_epoch_ms
+            tag_records.append(TagArrayRecord(
+                int(tagid), datetimes_to_epoch_ms([row[0] for row in rows]),
+                [row[1] for row in rows], utc=utc))
+        else:
+            tag_record = TagRecord(tagid=int(tagid))
+            datetimes = [row[0] for row in rows]
+            if not utc:
+                datetimes = localize(datetimes)
+            for datetime, (_, value) in zip(datetimes, rows):
+                tag_record.push(Tag(datetime, value))
+            tag_records.append(tag_record)
+    return tag_records
+
+
+def get_cached_tag_records(host_info, begin_time, end_time, tagids, timestep,
+                           mode, cache, utc=False, columnar=False):
+    """Return tag records like get_multiple_tag_records, but serve what is
+    already held in cache (a TagCache) locally and only query the missing
+    time ranges. Fetched ranges older than the cache horizon are stored.
+
+    Returns None if the query can not be cached (relative times or times
+    not aligned to timestep). Times are in local time unless utc is True,
+    like the uncached results. Raw values (timestep 0) at end_time are
+    included, like the server includes them.
+    """
+    if not isinstance(tagids, list):
+        tagids = [tagids]
+    time_range = utc_time_range(begin_time, end_time, utc)
+    if time_range is None:
+        logging.debug("Relative time range, not using tag cache.")
+        return None
+    begin, end = time_range
+    if not cache.is_cacheable(timestep, begin, end):
+        logging.debug("Time range not aligned to timestep %s, not using tag "
+                      "cache.", timestep)
+        return None
+    if not normalize_timestep(timestep):
+        # The cache holds [begin, end), the server also returns raw values
+        # at end
+        end += timedelta(milliseconds=1)
+
+    host = host_info.address
+    horizon = cache.horizon()
+    fresh = {}
+    missing = [(tagid, cache.missing_ranges(host, tagid, timestep, mode,
+                                            begin, end))
+               for tagid in tagids]
+    if any(ranges for tagid, ranges in missing):
+        w = wincc(host_info.address, host_info.database, pooled=True)
+        try:
+            w.connect()
+            for tagid, ranges in missing:
+                for r_begin, r_end in ranges:
+                    logging.info("Tag cache miss for %s: %s - %s", tagid,
+                                 r_begin, r_end)
+                    # The server includes the end time, the cache does not
+                    w.execute(tag_query_builder(
+                        [tagid], datetime_to_str(r_begin),
+                        datetime_to_str(r_end - timedelta(milliseconds=1)),
+                        timestep, mode, True))
+                    rows = [tuple(tag) for valueid, tag
+                            in w.iter_tags(utc=True)]
+                    stored_end = cache.store(host, tagid, timestep, mode,
+                                             r_begin, r_end, rows, horizon)
+                    # Values not stored yet are only served from this fetch
+                    fresh.setdefault(tagid, []).extend(
+                        row for row in rows
+                        if stored_end is None or row[0] >= stored_end)
+        except Exception:
+            w.close(discard=True)
+            raise
+        w.close()
+
+    rows_by_tag = dict((int(tagid),
+                        cache.load(host, tagid, timestep, mode, begin, end) +
+                        fresh.get(tagid, []))
+                       for tagid in tagids)
+    return build_tag_records(tagids, rows_by_tag, columnar, utc)
+
+
+def fetch_tag_chunk(host_info, tagids, chunk, timestep, mode, last=False):
+    """Fetch tagids for chunk (index, begin, end) over a pooled connection.
+    The end of the last chunk is included, like in a single query.
+    Return dict tagid -> list of (UTC time, value)."""
+    index, begin, end = chunk
+    if not last:
+        # The server includes the end time, the next chunk starts there
+        end -= timedelta(milliseconds=1)
+    rows_by_tag = {}
+    w = wincc(host_info.address, host_info.database, pooled=True)
+    try:
+        w.connect()
+        w.execute(tag_query_builder(
+            tagids, datetime_to_str(begin), datetime_to_str(end), timestep,
+            mode, True))
+        for valueid, tag in w.iter_tags(utc=True):
+            rows_by_tag.setdefault(int(valueid), []).append(tuple(tag))
+    except Exception:
+        w.close(discard=True)
+        raise
+    w.close()
+    return rows_by_tag
+
+
+def get_chunked_tag_records(host_info, begin_time, end_time, tagids, timestep,
+                            mode, utc=False, columnar=False, connections=None):
+    """Return tag records like get_multiple_tag_records. The time range is
+    split into chunks fetched concurrently over up to connections
+    connections (default chunking.chunk_config['connections']). Concurrent
+    queries per host are bounded by chunking.host_semaphore().
+
+    Returns None for ranges shorter than chunk_config['min_range'] and for
+    open or relative ranges. Times are in local time unless utc is True.
+    """
+    if not isinstance(tagids, list):
+        tagids = [tagids]
+    time_range = utc_time_range(begin_time, end_time, utc)
+    if time_range is None:
+        return None
+    begin, end = time_range
+    if (end - begin).total_seconds() < chunk_config['min_range']:
+        return None
+
+    planner = ChunkPlanner(begin, end, timestep)
+    semaphore = host_semaphore(host_info.address)
+    results = {}
+    errors = []
+
+    def worker():
+        with com_thread():
+            while True:
+                chunk = planner.next_chunk()
+                if chunk is None:
+                    return
+                try:
+                    with semaphore:
+                        started = time()
+                        rows_by_tag = fetch_tag_chunk(
+                            host_info, tagids, chunk, timestep, mode,
+                            chunk[2] >= end)
+                        duration = time() - started
+                except Exception as e:
+                    errors.append(e)
+                    planner.stop()
+                    return
+                results[chunk[0]] = rows_by_tag
+                planner.observe(chunk, sum(len(rows) for rows
+                                           in rows_by_tag.values()), duration)
+
+    threads = [threading.Thread(target=worker) for _
+               in range(connections or chunk_config['connections'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    logging.info("Fetched %s - %s in %s chunks.", begin, end, len(results))
+    return build_tag_records(tagids, merge_chunks(
+        [results[index] for index in sorted(results)]), columnar, utc)
+
+
+def get_batched_tag_records(host_info, begin_time, end_time, tagids, timestep,
+                            mode, utc=False, columnar=False, workers=None):
+    """Return one tag record per tagid (in order of tagids). Tagids are
+    packed into multi-tag queries whose size is chosen by the host's
+    BatchPlanner, and the batches are fetched concurrently by up to workers
+    threads (default batching.batch_config['workers']) over pooled
+    connections.
+    """
+    planner = get_batch_planner(host_info.address)
+    queue = TagidQueue(tagids)
+    semaphore = host_semaphore(host_info.address)
+    records_by_tag = {}
+    errors = []
+
+    def worker():
+        with com_thread():
+            while True:
+                batch = queue.next_batch(planner.batch_size())
+                if not batch:
+                    return
+                w = wincc(host_info.address, host_info.database, pooled=True)
+                try:
+                    with semaphore:
+                        started = time()
+                        w.connect()
+                        w.execute(tag_query_builder(batch, begin_time,
+                                                    end_time, timestep, mode,
+                                                    utc))
+                        if columnar:
+                            records = w.create_tag_arrays(utc)
+                        else:
+                            records = w.create_tag_records(utc) or []
+                        duration = time() - started
+                except Exception as e:
+                    w.close(discard=True)
+                    errors.append(e)
+                    queue.stop()
+                    return
+                w.close()
+                for record in records:
+                    records_by_tag[int(record.tagid)] = record
+                # The last batch may hold fewer tagids than requested
+                planner.observe(len(batch), sum(len(record) if columnar
+                                                else len(record.tags)
+                                                for record in records),
+                                duration)
+
+    threads = [threading.Thread(target=worker) for _
+               in range(min(workers or batch_config['workers'],
+                            len(tagids)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    if columnar:
+        from .tag_array import TagArrayRecord as empty_record
+    else:
+        empty_record = TagRecord
+    tag_records = []
+    for tagid in tagids:
+        if int(tagid) in records_by_tag:
+            tag_records.append(records_by_tag[int(tagid)])
+        else:
+            tag_records.append(empty_record(int(tagid)))
+    return tag_records
+
+
 def get_tag_record(host_info, begin_time, end_time, tagid, timestep,
-                   mode, utc=False):
-    """Query the DB for a single tag record and return a TagRecord object"""
-    toc = tic()
-    query = tag_query_builder(tagid, begin_time, end_time, timestep, mode, utc)
+                   mode, utc=False, columnar=False, cache=None):
+    """Query the DB for a single tag record and return a TagRecord object.
+    With columnar=True a TagArrayRecord (NumPy arrays) is returned instead.
+    With a TagCache as cache only ranges not held locally are queried.
+    Long time ranges are fetched in concurrent chunks.
+    """
+    if cache is not None:
+        tag_records = get_cached_tag_records(host_info, begin_time, end_time,
+                                             tagid, timestep, mode, cache,
+                                             utc, columnar)
+        if tag_records is not None:
+            return tag_records[0]
     tag_record = None
+    w = None
     try:
-        w = wincc(host_info.address, host_info.database)
+        tag_records = get_chunked_tag_records(host_info, begin_time, end_time,
+                                              tagid, timestep, mode, utc,
+                                              columnar)
+        if tag_records is not None:
+            return tag_records[0]
+        query = tag_query_builder(tagid, begin_time, end_time, timestep, mode,
+                                  utc)
+        w = wincc(host_info.address, host_info.database, pooled=True)
         w.connect()
         w.execute(query)
-        tag_record = w.create_tag_record()
-        print("Fetched data in {time}.".format(time=round(toc(), 3)))
+        if columnar:
+            records = w.create_tag_arrays(utc)
+            tag_record = records[0] if records else None
+        else:
+            tag_record = w.create_tag_record()
     except Exception as e:
         print(e)
         print(traceback.format_exc())
+        if w is not None:
+            # A broken connection must not go back to the pool
+            w.close(discard=True)
     finally:
-        w.close()
+        if w is not None:
+            w.close()
     return tag_record
 
 
 def get_multiple_tag_records(host_info, begin_time, end_time, tagids, timestep,
-                             mode, utc=False, parallel=True):
-    """Query the DB for multiple tag records."""
+                             mode, utc=False, parallel=True, columnar=False,
+                             cache=None):
+    """Query the DB for multiple tag records.
+    With columnar=True TagArrayRecords (NumPy arrays) are returned.
+    With a TagCache as cache only ranges not held locally are queried.
+    Long time ranges are fetched in concurrent chunks (see
+    get_chunked_tag_records).
+    """
     logging.info("get_tag_records: Trying to get tag records for %s",
                  ', '.join([str(tagid) for tagid in tagids]))
     tag_records = None
+    if cache is not None:
+        tag_records = get_cached_tag_records(host_info, begin_time, end_time,
+                                             tagids, timestep, mode, cache,
+                                             utc, columnar)
+        if tag_records is not None:
+            return tag_records
+    try:
+        tag_records = get_chunked_tag_records(host_info, begin_time, end_time,
+                                              tagids, timestep, mode, utc,
+                                              columnar)
+    except Exception as e:
+        print(e)
+        print(traceback.format_exc())
+        return None
+    if tag_records is not None:
+        return tag_records
     if parallel:
         logging.debug("get_tag_records: Parallel mode is ON")
-        num_cores = multiprocessing.cpu_count()
-        logging.debug("Operating on %s cores", num_cores)
-        tag_records = Parallel(n_jobs=num_cores)(delayed(get_tag_record)
-                              (host_info, begin_time, end_time, [tagid], 3600, 'avg')
-                              for tagid in tagids)
+        try:
+            tag_records = get_batched_tag_records(host_info, begin_time,
+                                                  end_time, tagids, timestep,
+                                                  mode, utc, columnar)
+        except Exception as e:
+            print(e)
+            print(traceback.format_exc())
     else:
         logging.debug("get_tag_records: Parallel mode is OFF")
-        toc = tic()
         query = tag_query_builder(tagids, begin_time, end_time, timestep, mode,
                                   utc)
+        w = None
         try:
-            w = wincc(host_info.address, host_info.database)
+            w = wincc(host_info.address, host_info.database,
+                      pooled=True)
             w.connect()
             w.execute(query)
-            tag_records = w.create_tag_records()
-            print("Fetched data in {time}.".format(time=round(toc(), 3)))
+            if columnar:
+                tag_records = w.create_tag_arrays(utc)
+            else:
+                tag_records = w.create_tag_records(utc)
         except Exception as e:
             print(e)
             print(traceback.format_exc())
+            if w is not None:
+                w.close(discard=True)
         finally:
-            w.close()
+            if w is not None:
+                w.close()
     return tag_records
 
 
 def do_tag_report(host_info, begin_time, end_time, tagids, timestep, mode,
-                  utc=False, plot=False, plot_config=None):
+                  utc=False, plot=False, plot_config=None, columnar=False,
+                  cache=None):
     logging.info("Trying to generate tag report.")
 
     if isinstance(tagids, list):
         records = get_multiple_tag_records(host_info, begin_time, end_time,
                                            tagids, timestep, mode,
-                                           utc, parallel=True)
+                                           utc, parallel=True,
+                                           columnar=columnar, cache=cache)
     else:
         # Assume it's a string
         records = []
         records.append(get_tag_record(host_info, begin_time, end_time, tagids,
-                                      timestep, mode, utc))
+                                      timestep, mode, utc, columnar, cache))
     for record in records:
         print(record)
     if plot:
@@ -526,6 +1084,11 @@ class WinCCHost():
         self.descriptive_name = descriptive_name
         self.key_figures = key_figures
 
+    @property
+    def address(self):
+        """Same as host_address. Lets a WinCCHost be passed as host_info."""
+        return self.host_address
+
     def __unicode__(self):
         return u"{0}, {1}, {2}, {3}, {4}".format(self.hostname,
                                                  self.host_address,
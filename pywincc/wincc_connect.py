@@ -4,17 +4,28 @@ import logging
 
 from wincc import wincc, WinCCException, do_alarm_report,\
     do_batch_alarm_report, do_operator_messages_report, WinCCHosts,\
-    get_host_by_name, do_alarm_report_monthly
+    get_host_by_name, do_alarm_report_monthly, get_cached_tag_records,\
+    sync_alarm_archive
 from alarm import alarm_query_builder
 from tag import tag_query_builder, print_tag_logging, plot_tag_records
 from interactive import InteractiveModeWinCC, InteractiveMode
 from operator_messages import om_query_builder
-from helper import tic, datetime_to_str_without_ms, eval_datetime,\
+from helper import datetime_to_str_without_ms, eval_datetime,\
     str_to_datetime
 from report import generate_alarms_report
+import report
+from export import export_tag_records
 from datetime import datetime, timedelta
 from mssql import mssql
 from vas import get_daily_key_figures_avg
+from tag_cache import TagCache
+from alarm_archive import AlarmArchive
+from result_cache import ResultCache
+from fleet import fan_out, select_hosts, query_alarms,\
+    query_operator_messages, query_tags
+import pool
+import chunking
+from instrumentation import instrumentation, phase
 
 
 class StringCP1252ParamType(click.ParamType):
@@ -74,10 +85,44 @@ host_info = HostInfo()
 @click.option('--hostname', '-n', default='',
               help="Hostname e.g. 'agro'. Hostname will be looked up in "
               "hosts.sav file.")
-def cli(debug, host_address, database, hostname):
+@click.option('--pool-size', default=4,
+              help='Max. number of pooled connections per host.')
+@click.option('--pool-idle-timeout', default=300,
+              help='Close pooled connections idle for longer than this '
+              '(seconds).')
+@click.option('--fetch-batch-size', default=1000,
+              help='Number of rows read from the server per fetch.')
+@click.option('--chunk-connections', default=4,
+              help='Max. number of concurrent queries per host when long '
+              'tag queries are split into time chunks.')
+@click.option('--driver', default='adodbapi',
+              type=click.Choice(['adodbapi', 'simulator']),
+              help='Driver for WinCC (TAG/ALARMVIEW) queries.')
+@click.option('--sql-driver', default='adodbapi',
+              type=click.Choice(['adodbapi', 'odbc', 'simulator']),
+              help='Driver for plain SQL queries e.g. parameters, '
+              'alarmconfig.')
+@click.option('--stats', default='',
+              help="Write a JSON summary of query and report timings to "
+              "this file ('-' for stdout).")
+@click.option('--timing', default=False, is_flag=True,
+              help='Print time spent per phase (connect, execute, fetch, '
+              '...) when done.')
+@click.pass_context
+def cli(ctx, debug, host_address, database, hostname, pool_size,
+        pool_idle_timeout, fetch_batch_size, chunk_connections, driver,
+        sql_driver, stats, timing):
     if debug:
         logging.basicConfig(level=logging.DEBUG)
-    host_info.add_hostinfo(host_address, database, hostname)
+    instrumentation.reset()
+    ctx.call_on_close(lambda: report_timings(stats, timing))
+    pool.configure(size=pool_size, idle_timeout=pool_idle_timeout)
+    chunking.configure(connections=chunk_connections)
+    mssql.fetch_batch_size = fetch_batch_size
+    wincc.driver_name = driver
+    mssql.driver_name = sql_driver
+    if ctx.invoked_subcommand != 'fleet':
+        host_info.add_hostinfo(host_address, database, hostname)
 
 
 @cli.command()
@@ -108,19 +153,16 @@ def tag(tagid, begin_time, end_time, timestep, mode, utc, show):
         print(query)
         return
 
-    toc = tic()
     try:
         w = wincc(host_info.address, host_info.database)
         w.connect()
         w.execute(query)
 
         if w.rowcount():
-            print_tag_logging(w.fetchall())
+            print_tag_logging(w.iter_rows())
             # for rec in w.fetchall():
             #    print rec
 
-        print("Fetched data in {time}.".format(time=round(toc(), 3)))
-
     except Exception as e:
         print(e)
         print(traceback.format_exc())
@@ -146,13 +188,21 @@ def tag(tagid, begin_time, end_time, timestep, mode, utc, show):
               help="Don't actually query the db. Just show what you would do.")
 @click.option('--plot', '-p', default=False, is_flag=True,
               help="Open a window with the plotted data.")
-@click.option('--outfile', '-o', default='', help='Output as given filename (csv)')
+@click.option('--outfile', '-o', default='',
+              help='Output as given filename. Format by extension: .csv, '
+              '.parquet or .arrow/.feather (need pyarrow).')
 @click.option('--outfile-col-name', '-c', default='', help='Column name when \
                                                             writing to file.')
 @click.option('--outfile-time-zone', '-z', default='',
               help='Timezone when writing to file. e.g. +1 for UTC+1')
+@click.option('--columnar', default=False, is_flag=True,
+              help='Fetch into NumPy arrays. Faster and smaller for large '
+              'results.')
+@click.option('--tag-cache', default='', metavar='FILE',
+              help='Keep fetched values in local cache FILE and only query '
+              'time ranges missing there. Times are printed in local time.')
 def tag2(tagid, begin_time, end_time, timestep, mode, utc, show, plot, outfile,
-         outfile_col_name, outfile_time_zone):
+         outfile_col_name, outfile_time_zone, columnar, tag_cache):
     """Parse user friendly tag query input and assemble wincc tag query"""
     if timestep and not end_time:
         end_time = datetime_to_str_without_ms(datetime.now())
@@ -162,22 +212,30 @@ def tag2(tagid, begin_time, end_time, timestep, mode, utc, show, plot, outfile,
         print(query)
         return
 
-    toc = tic()
+    w = None
     try:
-        w = wincc(host_info.address, host_info.database)
-        w.connect()
-        w.execute(query)
-
-        records = w.create_tag_records(utc)
-        print("Fetched data in {time}.".format(time=round(toc(), 3)))
+        records = None
+        if tag_cache:
+            records = get_cached_tag_records(host_info, begin_time, end_time,
+                                             list(tagid), timestep, mode,
+                                             TagCache(tag_cache), utc,
+                                             columnar)
+        if records is None:
+            w = wincc(host_info.address, host_info.database)
+            w.connect()
+            w.execute(query)
+
+            if columnar:
+                records = w.create_tag_arrays(utc)
+            else:
+                records = w.create_tag_records(utc)
 
         if records:
             if (outfile != ''):
-                with open(outfile, "w") as f:
-                    # print(records.to_csv().encode("UTF-8"))
-                    for rec in records:
-                        f.write(rec.to_csv(name=outfile_col_name.encode("UTF-8"),
-                                           tz=outfile_time_zone))
+                with phase('write'):
+                    export_tag_records(records, outfile,
+                                       name=outfile_col_name,
+                                       tz=outfile_time_zone)
             else:
                 for record in records:
                     print(record)
@@ -190,7 +248,8 @@ def tag2(tagid, begin_time, end_time, timestep, mode, utc, show, plot, outfile,
         print(e)
         print(traceback.format_exc())
     finally:
-        w.close()
+        if w is not None:
+            w.close()
 
 
 @cli.command()
@@ -226,7 +285,6 @@ def alarms(begin_time, end_time, text, utc, show, state, priority, priority2,
         return
 
     try:
-        toc = tic()
         w = wincc(host_info.address, host_info.database)
         w.connect()
         w.execute(query)
@@ -245,7 +303,6 @@ def alarms(begin_time, end_time, text, utc, show, state, priority, priority2,
         else:
             w.print_alarms()
 
-        print("Fetched data in {time}.".format(time=round(toc(), 3)))
     except WinCCException as e:
         print(e)
         print(traceback.format_exc())
@@ -273,12 +330,10 @@ def operator_messages(begin_time, end_time, text, utc, show):
         return
 
     try:
-        toc = tic()
         w = wincc(host_info.address, host_info.database)
         w.connect()
         w.execute(query)
         w.print_operator_messages()
-        print("Fetched data in {time}.".format(time=round(toc(), 3)))
     except WinCCException as e:
         print(e)
         print(traceback.format_exc())
@@ -293,7 +348,6 @@ def tagid_by_name(tagname):
     Return tagid.
     """
     try:
-        toc = tic()
         mssql_conn = mssql(host_info.address,
                            strip_R_from_db_name(host_info.database))
         mssql_conn.connect()
@@ -302,7 +356,6 @@ def tagid_by_name(tagname):
         if mssql_conn.rowcount():
             for rec in mssql_conn.fetchall():
                 print rec
-        print("Fetched data in {time}.".format(time=round(toc(), 3)))
     except Exception as e:
         print(e)
     finally:
@@ -313,29 +366,59 @@ def tagid_by_name(tagname):
 @click.argument('begin_time')
 @click.argument('end_time')
 @click.option('--cache', is_flag=True, default=False,
-              help='Cache alarms (pickle).')
+              help='Store query results in the local result cache.')
 @click.option('--use-cached', is_flag=True, default=False,
-              help='Use cached alarms')
-def alarm_report(begin_time, end_time, cache, use_cached):
+              help='Use query results from the local result cache if '
+              'present.')
+@click.option('--archive', default='', metavar='FILE',
+              help='Sync local alarm archive FILE and report from it.')
+@click.option('--virtual', is_flag=True, default=False,
+              help='Write alarms as chunked data files shown in a virtual '
+              'scrolling table (for large reports).')
+def alarm_report(begin_time, end_time, cache, use_cached, archive, virtual):
     """Print report of alarms for given host in given time."""
+    if virtual:
+        report.configure(virtual=True)
     do_alarm_report(eval_datetime(begin_time), eval_datetime(end_time),
                     host_info.address, host_info.database,
-                    cache, use_cached)
+                    cache, use_cached,
+                    archive=AlarmArchive(archive) if archive else None)
 
 
 @cli.command()
 @click.argument('begin_time')
 @click.argument('end_time')
 @click.option('--cache', is_flag=True, default=False,
-              help='Cache alarms (pickle).')
+              help='Store query results in the local result cache.')
 @click.option('--use-cached', is_flag=True, default=False,
-              help='Use cached alarms')
-def operator_messages_report(begin_time, end_time, cache, use_cached):
+              help='Use query results from the local result cache if '
+              'present.')
+@click.option('--archive', default='', metavar='FILE',
+              help='Sync local alarm archive FILE and report from it.')
+def operator_messages_report(begin_time, end_time, cache, use_cached,
+                             archive):
     """Print report of operator messages for given host in given time."""
     do_operator_messages_report(eval_datetime(begin_time),
                                 eval_datetime(end_time),
                                 host_info.address, host_info.database,
-                                cache, use_cached)
+                                cache, use_cached,
+                                archive=AlarmArchive(archive) if archive
+                                else None)
+
+
+@cli.command()
+@click.option('--begin-time', '-b', default='',
+              help='Where to start if the host was never synced, or an '
+              'earlier time to fill in.')
+@click.option('--archive', default=AlarmArchive.filename, metavar='FILE',
+              help='Local alarm archive.')
+def alarm_sync(begin_time, archive):
+    """Copy new alarms and operator messages into a local archive."""
+    num_rows = sync_alarm_archive(host_info.address, host_info.database,
+                                  AlarmArchive(archive),
+                                  eval_datetime(begin_time) if begin_time
+                                  else '')
+    print("Read {0} rows.".format(num_rows))
 
 
 @cli.command()
@@ -343,11 +426,35 @@ def operator_messages_report(begin_time, end_time, cache, use_cached):
 @click.argument('end_day')
 @click.option('--non-parallel', '-np', is_flag=True, default=False,
               help='Use multithreading for parallel queries.')
-def batch_report(begin_day, end_day, non_parallel):
+@click.option('--archive', default='', metavar='FILE',
+              help='Sync local alarm archive FILE and report from it.')
+@click.option('--fetch-workers', default=0, type=int,
+              help='Threads fetching alarms (parallel mode).')
+@click.option('--render-workers', default=0, type=int,
+              help='Processes rendering reports (parallel mode).')
+@click.option('--queue-size', default=0, type=int,
+              help='Reports waiting to be rendered at most.')
+@click.option('--force', is_flag=True, default=False,
+              help='Regenerate reports even if their data did not change.')
+@click.option('--virtual', is_flag=True, default=False,
+              help='Write alarms as chunked data files shown in a virtual '
+              'scrolling table (for large reports).')
+@click.option('--result-cache', default='', metavar='DIR',
+              help='Share query results through the result cache in DIR.')
+def batch_report(begin_day, end_day, non_parallel, archive, fetch_workers,
+                 render_workers, queue_size, force, virtual, result_cache):
     """Print a report for each day starting from begin_day to end_day."""
-    do_batch_alarm_report(eval_datetime(begin_day), eval_datetime(end_day),
-                          host_info.address, host_info.database,
-                          host_info.description, parallel=not non_parallel)
+    if virtual:
+        report.configure(virtual=True)
+    metrics = do_batch_alarm_report(
+        eval_datetime(begin_day), eval_datetime(end_day), host_info.address,
+        host_info.database, host_info.description, parallel=not non_parallel,
+        archive=AlarmArchive(archive) if archive else None,
+        fetch_workers=fetch_workers, render_workers=render_workers,
+        queue_size=queue_size, force=force,
+        result_cache=ResultCache(result_cache) if result_cache else None)
+    if metrics is not None:
+        print(metrics.summary())
 
 
 @cli.command()
@@ -361,11 +468,13 @@ def alarm_report_monthly(begin_day):
 @click.argument('begin_day')
 @click.argument('end_day')
 @click.option('--timestep', '-t', help='Time interval [day|week|month].')
-def alarm_report2(begin_day, end_day, timestep):
+@click.option('--force', is_flag=True, default=False,
+              help='Regenerate reports even if their data did not change.')
+def alarm_report2(begin_day, end_day, timestep, force):
     """Generate report(s) for known host."""
     do_batch_alarm_report(eval_datetime(begin_day), eval_datetime(end_day),
                           host_info.address, host_info.database,
-                          host_info.description, timestep)
+                          host_info.description, timestep, force=force)
 
 
 @cli.command()
@@ -411,6 +520,69 @@ def daily_perf_report(day):
     get_daily_key_figures_avg(host_info, report_day)
 
 
+@cli.command()
+@click.argument('kind', type=click.Choice(['alarms', 'operator_messages',
+                                           'tags']))
+@click.argument('begin_time')
+@click.argument('end_time')
+@click.option('--hosts', default='',
+              help='Comma separated hostnames. Default: all hosts in '
+              'hosts.sav.')
+@click.option('--match', default='',
+              help="Only hosts whose name or description matches this "
+              "pattern e.g. 'AGRO*'.")
+@click.option('--tagid', '-i', multiple=True,
+              help='Tagid to query (kind tags). Can be repeated.')
+@click.option('--timestep', '-t', default='',
+              help='Timestep in seconds (kind tags).')
+@click.option('--mode', '-m', default='first', help='Mode (kind tags).')
+@click.option('--timeout', default=300,
+              help='Give up on a host after this many seconds.')
+@click.option('--workers', default=16,
+              help='Max. number of hosts queried at the same time.')
+def fleet(kind, begin_time, end_time, hosts, match, tagid, timestep, mode,
+          timeout, workers):
+    """Run the same query against all registered hosts. Results are
+    printed per host as soon as the host is done."""
+    selected = select_hosts(WinCCHosts(),
+                            hosts.split(',') if hosts else None, match)
+    if not selected:
+        print("No hosts selected.")
+        return
+    begin_time = eval_datetime(begin_time)
+    end_time = eval_datetime(end_time)
+    if kind == 'alarms':
+        func, args = query_alarms, (begin_time, end_time)
+    elif kind == 'operator_messages':
+        func, args = query_operator_messages, (begin_time, end_time)
+    else:
+        func, args = query_tags, (begin_time, end_time, list(tagid),
+                                  timestep, mode)
+    for res in fan_out(selected, func, args, timeout=timeout,
+                       workers=workers):
+        print(u"== {0} ({1}) {2:.1f} s ==".format(
+            res.host.hostname, res.host.descriptive_name,
+            res.duration).encode('utf-8'))
+        if res.error is not None:
+            print("Error: {0}".format(res.error))
+        elif kind == 'tags':
+            for record in res.result or []:
+                print(record)
+        else:
+            print(res.result)
+
+
+def report_timings(stats, timing):
+    """Output instrumentation summary of this invocation."""
+    if timing:
+        print(instrumentation.format_summary())
+    if stats == '-':
+        print(instrumentation.to_json())
+    elif stats:
+        with open(stats, 'w') as fh:
+            fh.write(instrumentation.to_json())
+
+
 def strip_R_from_db_name(database):
     """Strip the 'R' from db name if present. Else do nothing.
     Examples:
@@ -49,3 +49,155 @@ document.onkeydown = function(evt) {
             break;
     }
 };
+
+// Virtual alarm table of alarms_virtual.html. The alarms are in script
+// files next to the report: index.js calls alarm_index() with the
+// dictionaries and per chunk row counts, chunk_NNNN.js calls alarm_chunk()
+// with the rows. Chunks are loaded when scrolled into view and only the
+// visible rows are in the document.
+var virtual_alarms = {
+    index: null,
+    chunks: {},
+    loading: {},
+    row_height: 24,
+    // Rows per chunk passing the filter
+    visible_counts: [],
+    total: 0
+};
+
+var PRIORITY_CHECKS = {WARNING: 'check_warning', ERROR_DAY: 'check_error_day',
+                       ERROR_NOW: 'check_error_now', STOP_ALL: 'check_stop_all'};
+var STATE_CHECKS = {1: 'check_come', 2: 'check_go', 3: 'check_ack_gack',
+                    16: 'check_ack_gack'};
+var STATE_TEXTS = {1: 'COME', 2: 'GO', 3: 'ACK', 16: 'GACK'};
+
+function alarm_index(index) {
+    virtual_alarms.index = index;
+}
+
+function alarm_chunk(number, rows) {
+    virtual_alarms.chunks[number] = rows;
+    delete virtual_alarms.loading[number];
+    render_alarm_rows();
+}
+
+function load_alarm_chunk(number) {
+    if (virtual_alarms.chunks[number] || virtual_alarms.loading[number]) {
+        return;
+    }
+    virtual_alarms.loading[number] = true;
+    var script = document.createElement('script');
+    script.src = virtual_alarms.index.directory + '/' +
+        virtual_alarms.index.chunks[number].file;
+    document.getElementsByTagName('head')[0].appendChild(script);
+}
+
+function alarm_visible(priority, state) {
+    var check = PRIORITY_CHECKS[priority];
+    if (check && !document.getElementById(check).checked) {
+        return false;
+    }
+    check = STATE_CHECKS[state];
+    return !(check && !document.getElementById(check).checked);
+}
+
+function virtual_alarm_filter() {
+    var index = virtual_alarms.index;
+    if (!index) {
+        return;
+    }
+    virtual_alarms.visible_counts = [];
+    virtual_alarms.total = 0;
+    for (var i = 0; i < index.chunks.length; i++) {
+        var counts = index.chunks[i].counts, visible = 0;
+        for (var key in counts) {
+            var parts = key.split(',');
+            if (alarm_visible(index.priorities[parts[0]], parseInt(parts[1], 10))) {
+                visible += counts[key];
+            }
+        }
+        virtual_alarms.visible_counts.push(visible);
+        virtual_alarms.total += visible;
+    }
+    document.getElementById('alarms_spacer').style.height =
+        (virtual_alarms.total * virtual_alarms.row_height) + 'px';
+    document.getElementById('alarms_count').innerHTML =
+        virtual_alarms.total + ' of ' + index.count + ' alarms';
+    render_alarm_rows();
+}
+
+function pad(number, width) {
+    number = String(number);
+    while (number.length < width) {
+        number = '0' + number;
+    }
+    return number;
+}
+
+function format_alarm_time(base, offset) {
+    // Times are ms of the wall clock time, so format them as UTC
+    if (typeof offset !== 'number') {
+        return offset === null ? '' : escape_html(offset);
+    }
+    var d = new Date(base + offset);
+    return d.getUTCFullYear() + '-' + pad(d.getUTCMonth() + 1, 2) + '-' +
+        pad(d.getUTCDate(), 2) + ' ' + pad(d.getUTCHours(), 2) + ':' +
+        pad(d.getUTCMinutes(), 2) + ':' + pad(d.getUTCSeconds(), 2) + '.' +
+        pad(d.getUTCMilliseconds(), 3);
+}
+
+function escape_html(text) {
+    return String(text).replace(/&/g, '&amp;').replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;');
+}
+
+function render_alarm_rows() {
+    var index = virtual_alarms.index;
+    if (!index) {
+        return;
+    }
+    var viewport = document.getElementById('alarms_viewport');
+    var first = Math.floor(viewport.scrollTop / virtual_alarms.row_height);
+    var wanted = Math.ceil(viewport.clientHeight / virtual_alarms.row_height) + 1;
+    // Find the chunk holding the first visible row
+    var chunk = 0, skip = first;
+    while (chunk < index.chunks.length &&
+           skip >= virtual_alarms.visible_counts[chunk]) {
+        skip -= virtual_alarms.visible_counts[chunk];
+        chunk++;
+    }
+    var html = [];
+    for (; chunk < index.chunks.length && html.length < wanted; chunk++, skip = 0) {
+        var rows = virtual_alarms.chunks[chunk];
+        if (!rows) {
+            load_alarm_chunk(chunk);
+            var missing = Math.min(wanted - html.length,
+                                   virtual_alarms.visible_counts[chunk] - skip);
+            for (var m = 0; m < missing; m++) {
+                html.push('<tr><td colspan="6">&hellip;</td></tr>');
+            }
+            continue;
+        }
+        var base = index.chunks[chunk].base;
+        for (var r = 0; r < rows.length && html.length < wanted; r++) {
+            var row = rows[r], priority = index.priorities[row[3]];
+            if (!alarm_visible(priority, row[2])) {
+                continue;
+            }
+            if (skip > 0) {
+                skip--;
+                continue;
+            }
+            var state = STATE_TEXTS[row[2]] || row[2];
+            html.push('<tr class="al' + escape_html(priority) + ' al' + state +
+                      '"><td>' + row[0] + '</td><td>' +
+                      format_alarm_time(base, row[1]) + '</td><td>' + state +
+                      '</td><td>' + escape_html(priority) + '</td><td>' +
+                      escape_html(index.locations[row[4]]) + '</td><td>' +
+                      escape_html(index.texts[row[5]]) + '</td></tr>');
+        }
+    }
+    document.getElementById('alarms_rows').innerHTML = html.join('');
+    document.getElementById('alarms_table').style.top =
+        (first * virtual_alarms.row_height) + 'px';
+}
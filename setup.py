@@ -7,7 +7,8 @@ install_requires = [
         'pypiwin32',
         'py-dateutil',
         'jinja2',
-        'joblib'
+        'joblib',
+        'numpy'
     ]
 
 setup(
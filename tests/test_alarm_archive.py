@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pywincc import simulator
+from pywincc.alarm_archive import AlarmArchive, AlarmArchiveException
+from pywincc.alarm import alarm_query_builder
+from pywincc.wincc import wincc
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class TestAlarmArchive(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_alarm_archive(HOST, DATABASE,
+                                         '2015-08-24 00:00:00',
+                                         '2015-08-25 00:00:00')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.archive = AlarmArchive(os.path.join(self.tmp_dir,
+                                                 'alarms.sqlite'))
+        self.w = wincc(HOST, DATABASE, driver='simulator')
+        self.w.connect()
+
+    def tearDown(self):
+        self.w.close()
+        shutil.rmtree(self.tmp_dir)
+        simulator.reset()
+
+    def query_alarms(self, begin, end):
+        self.w.execute(alarm_query_builder(begin, end, '', True, ''))
+        return list(self.w.create_alarm_record())
+
+    def test_first_sync_needs_begin(self):
+        self.assertRaises(AlarmArchiveException, self.archive.sync, self.w,
+                          HOST)
+
+    def test_sync_is_incremental(self):
+        self.archive.sync(self.w, HOST, datetime(2015, 8, 24, 12))
+        simulator.insert_alarm(HOST, DATABASE, 1001, 1,
+                               datetime(2015, 8, 25, 1))
+        # Only rows within the overlap before the watermark are read again
+        self.assertLess(self.archive.sync(self.w, HOST), 10)
+        alarms = self.archive.alarm_record(HOST, '2015-08-24 12:00:00',
+                                           '2015-08-26 00:00:00', utc=True)
+        self.assertEqual(list(alarms),
+                         self.query_alarms('2015-08-24 12:00:00',
+                                           '2015-08-26 00:00:00'))
+
+    def test_backfill_earlier_begin(self):
+        self.archive.sync(self.w, HOST, datetime(2015, 8, 24, 12))
+        self.archive.sync(self.w, HOST, datetime(2015, 8, 24, 0))
+        alarms = self.archive.alarm_record(HOST, '2015-08-24 00:00:00',
+                                           '2015-08-25 00:00:00', utc=True)
+        self.assertEqual(list(alarms),
+                         self.query_alarms('2015-08-24 00:00:00',
+                                           '2015-08-25 00:00:00'))
+        operator_messages = self.archive.operator_messages_record(
+            HOST, '2015-08-24 00:00:00', '2015-08-25 00:00:00', utc=True)
+        self.assertEqual(operator_messages.count(), 24)
+
+    def test_range_includes_begin_excludes_end(self):
+        simulator.insert_alarm(HOST, DATABASE, 9001, 1,
+                               datetime(2015, 8, 24, 12))
+        simulator.insert_alarm(HOST, DATABASE, 9002, 1,
+                               datetime(2015, 8, 24, 13))
+        self.archive.sync(self.w, HOST, datetime(2015, 8, 24, 11))
+        alarms = self.archive.alarm_record(HOST, '2015-08-24 12:00:00',
+                                           '2015-08-24 13:00:00', utc=True)
+        msgnrs = [alarm.id for alarm in alarms]
+        self.assertIn(9001, msgnrs)
+        self.assertNotIn(9002, msgnrs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,10 @@
+import pickle
+import random
 import unittest
-from alarm import alarm_query_builder
+from alarm import Alarm, AlarmRecord, ColumnarAlarmRecord, \
+    alarm_query_builder
+
+PRIORITIES = [u'WARNING', u'ERROR_DAY', u'ERROR_NOW', u'STOP_ALL']
 
 
 class TestAlarmModule(unittest.TestCase):
@@ -9,5 +14,88 @@ class TestAlarmModule(unittest.TestCase):
                          u"ALARMVIEW:SELECT * FROM ALGVIEWDEU WHERE MsgNr < 12508141 AND DateTime > '2015-08-24 08:07:48' AND DateTime < '2015-08-24 08:08:12'")
 
 
+class TestAlarmRecordIndex(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(7)
+        self.alarms = [Alarm(rand.randint(1, 20), rand.choice([1, 2, 3, 16, 5]),
+                             u'2015-08-24 10:00:00.000', u'',
+                             rand.choice(PRIORITIES),
+                             rand.choice([u'PUMP', u'MILL', u'BELT']), u'')
+                       for _ in range(500)]
+        self.record = AlarmRecord()
+        for alarm in self.alarms[:400]:
+            self.record.push(alarm)
+        # Appended without push
+        self.record.alarms.extend(self.alarms[400:])
+
+    def test_counts(self):
+        self.assertEqual(self.record.get_count_grouped(), {
+            'warning': self.count(1, u'WARNING'),
+            'error_day': self.count(1, u'ERROR_DAY'),
+            'error_now': self.count(1, u'ERROR_NOW'),
+            'stop_all': self.count(1, u'STOP_ALL'),
+            'sum': len([a for a in self.alarms if a.state == 1])})
+        self.assertEqual(self.record.count_by_location(2)[u'MILL'],
+                         len([a for a in self.alarms
+                              if a.state == 2 and a.location == u'MILL']))
+
+    def test_filters(self):
+        self.assertEqual(self.record.filter_by_priorities([u'STOP_ALL',
+                                                           u'WARNING']),
+                         [a for prio in (u'STOP_ALL', u'WARNING')
+                          for a in self.alarms if a.priority == prio])
+        self.assertEqual(self.record.filter_by_states(['GO  ', 5, 'COME']),
+                         [a for state in (2, 5, 1)
+                          for a in self.alarms if a.state == state])
+        self.assertEqual(self.record.filter_by_state('5'),
+                         [a for a in self.alarms if a.state == 5])
+        self.assertEqual(self.record.filter_by_state('BAD'), [])
+        self.assertEqual(self.record.filter_by_id(3),
+                         [a for a in self.alarms if a.id == 3])
+
+    def test_pickle(self):
+        record = pickle.loads(pickle.dumps(self.record))
+        record.push(self.alarms[0])
+        self.assertEqual(record.count_all(), 501)
+        self.assertEqual(len(record.filter_by_location(u'PUMP')),
+                         len(self.record.filter_by_location(u'PUMP')) +
+                         (self.alarms[0].location == u'PUMP'))
+
+    def count(self, state, priority):
+        return len([a for a in self.alarms
+                    if a.state == state and a.priority == priority])
+
+
+class TestColumnarAlarmRecord(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(3)
+        self.alarms = [Alarm(rand.randint(1, 20), rand.choice([1, 2, 3, 16]),
+                             '2015-08-24 10:{0:02}:{1:02}.{2:03}'.format(
+                                 i // 60, i % 60, rand.randint(0, 999)),
+                             u'Alarm', rand.choice(PRIORITIES),
+                             rand.choice([u'PUMP', u'MILL', None]),
+                             u'Text {0}'.format(rand.randint(1, 5)))
+                       for i in range(300)]
+        self.alarms.append(Alarm(1, 1, '', u'', u'WARNING', u'', u''))
+        self.record = AlarmRecord(list(self.alarms))
+        self.columnar = ColumnarAlarmRecord(self.alarms)
+
+    def test_same_as_alarm_record(self):
+        self.assertEqual(list(self.columnar), self.alarms)
+        self.assertEqual(self.columnar.alarms[-2:], self.alarms[-2:])
+        self.assertEqual(unicode(self.columnar), unicode(self.record))
+        self.assertEqual(self.columnar.get_count_grouped(),
+                         self.record.get_count_grouped())
+        self.assertEqual(self.columnar.filter_by_states(['GACK', 'COME']),
+                         self.record.filter_by_states(['GACK', 'COME']))
+        self.assertEqual(len(self.columnar.alarms.pools['text'].values), 6)
+
+    def test_pickle(self):
+        columnar = pickle.loads(pickle.dumps(self.columnar, 2))
+        self.assertEqual(list(columnar), self.alarms)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pywincc import pipeline, report, simulator
+from pywincc.pool import close_all
+from pywincc.manifest import ReportManifest
+from pywincc.alarm import alarm_query_builder
+from pywincc.operator_messages import om_query_builder
+from pywincc.wincc import wincc, fetch_alarms_and_operator_messages, \
+    split_by_time, do_batch_alarm_report
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class TestBatchReport(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_alarm_archive(HOST, DATABASE,
+                                         '2015-08-23 00:00:00',
+                                         '2015-08-28 00:00:00')
+        self.driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+
+    def tearDown(self):
+        wincc.driver_name = self.driver_name
+        close_all()
+        simulator.reset()
+
+    def test_days_split_from_one_fetch(self):
+        windows = [('2015-08-24', '2015-08-25'), ('2015-08-25', '2015-08-26'),
+                   ('2015-08-26', '2015-08-27')]
+        alarms, operator_messages = fetch_alarms_and_operator_messages(
+            HOST, DATABASE, '2015-08-24', '2015-08-27', chunk_days=2)
+        w = wincc(HOST, DATABASE, driver='simulator')
+        w.connect()
+        try:
+            for (begin, end), day_alarms, day_oms in zip(
+                    windows, split_by_time(alarms, windows),
+                    split_by_time(operator_messages, windows)):
+                w.execute(alarm_query_builder(begin, end))
+                self.assertEqual(day_alarms, list(w.create_alarm_record()))
+                w.execute(om_query_builder(begin, end))
+                self.assertEqual(day_oms,
+                                 list(w.create_operator_messages_record()))
+        finally:
+            w.close()
+
+    def test_pipeline_same_as_sequential(self):
+        out_dirs = []
+        config = dict(report.report_config)
+        try:
+            for options in ({'parallel': False},
+                            {'parallel': True, 'fetch_workers': 2,
+                             'render_workers': 1, 'bucket_days': 2,
+                             'queue_size': 1},
+                            {'parallel': True, 'render_workers': 2}):
+                out_dirs.append(tempfile.mkdtemp())
+                report.configure(out_dir=out_dirs[-1])
+                metrics = do_batch_alarm_report('2015-08-24', '2015-08-28',
+                                                HOST, DATABASE, 'PLANT',
+                                                **options)
+                if options['parallel']:
+                    self.assertEqual(metrics.summary()['reports'], 4)
+            files = [sorted(name for name in os.listdir(out_dir)
+                            if name.endswith('.html'))
+                     for out_dir in out_dirs]
+            self.assertEqual(len(files[0]), 4)
+            for out_dir, names in zip(out_dirs[1:], files[1:]):
+                self.assertEqual(names, files[0])
+                for name in names:
+                    with open(os.path.join(out_dirs[0], name)) as fh:
+                        expected = fh.read()
+                    with open(os.path.join(out_dir, name)) as fh:
+                        self.assertEqual(fh.read(), expected)
+        finally:
+            report.report_config.update(config)
+            for out_dir in out_dirs:
+                shutil.rmtree(out_dir)
+
+    def test_unchanged_reports_skipped(self):
+        out_dir = tempfile.mkdtemp()
+        config = dict(report.report_config)
+        report.configure(out_dir=out_dir)
+        args = ('2015-08-24', '2015-08-27', HOST, DATABASE, 'PLANT')
+        try:
+            do_batch_alarm_report(*args)
+            filename = os.path.join(out_dir, 'alarms_PLANT_2015_08_25.html')
+            os.remove(filename)
+            # A changed day: alarms added to 2015-08-26
+            simulator.generate_alarm_archive(HOST, DATABASE,
+                                             '2015-08-26 10:00:00',
+                                             '2015-08-26 11:00:00')
+            metrics = do_batch_alarm_report(*args, parallel=True,
+                                            render_workers=1)
+            self.assertEqual(metrics.summary()['skipped'], 1)
+            self.assertEqual(metrics.summary()['reports'], 2)
+            self.assertTrue(os.path.exists(filename))
+            metrics = do_batch_alarm_report(*args, parallel=True,
+                                            render_workers=1, force=True)
+            self.assertEqual(metrics.summary()['reports'], 3)
+        finally:
+            report.report_config.update(config)
+            shutil.rmtree(out_dir)
+
+    def test_missing_data_dir_is_rendered_again(self):
+        out_dir = tempfile.mkdtemp()
+        config = dict(report.report_config)
+        report.configure(out_dir=out_dir, virtual=True)
+        args = ('2015-08-24', '2015-08-26', HOST, DATABASE, 'PLANT')
+        try:
+            do_batch_alarm_report(*args)
+            data_dir = os.path.join(out_dir, 'alarms_PLANT_2015_08_25_data')
+            shutil.rmtree(data_dir)
+            metrics = do_batch_alarm_report(*args, parallel=True,
+                                            render_workers=1)
+            self.assertEqual(metrics.summary()['skipped'], 1)
+            self.assertEqual(metrics.summary()['reports'], 1)
+            self.assertTrue(os.path.isdir(data_dir))
+        finally:
+            report.report_config.update(config)
+            shutil.rmtree(out_dir)
+
+    def test_manifest_save_waits_for_lock(self):
+        out_dir = tempfile.mkdtemp()
+        filename = os.path.join(out_dir, 'manifest.json')
+        try:
+            first = ReportManifest(filename)
+            second = ReportManifest(filename)
+            first.record('a.html', {'sha1': 'a'}, 'v1')
+            second.record('b.html', {'sha1': 'b'}, 'v1')
+            with open(filename + '.lock', 'w'):
+                pass
+            first.lock_timeout = 0.2
+            first.save()
+            self.assertFalse(os.path.exists(filename))
+            # Left over from a crashed run
+            os.utime(filename + '.lock', (0, 0))
+            first.save()
+            second.save()
+            self.assertEqual(sorted(ReportManifest(filename).entries),
+                             ['a.html', 'b.html'])
+            self.assertFalse(os.path.exists(filename + '.lock'))
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_render_config_has_absolute_dirs(self):
+        cwd = os.getcwd()
+        tmp_dir = tempfile.mkdtemp()
+        config = dict(report.report_config)
+        try:
+            os.chdir(tmp_dir)
+            os.mkdir('out')
+            report.configure(out_dir='out')
+            render_config = pipeline.render_config()
+            self.assertEqual(render_config['out_dir'],
+                             os.path.join(os.getcwd(), 'out'))
+            self.assertTrue(os.path.isabs(render_config['template_dir']))
+            self.assertEqual(report.report_config['out_dir'], 'out')
+        finally:
+            os.chdir(cwd)
+            report.report_config.update(config)
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from pywincc import simulator
+from pywincc.pool import close_all
+from pywincc.batching import BatchPlanner
+from pywincc.wincc import wincc, get_multiple_tag_records
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class HostInfo():
+    address = HOST
+    database = DATABASE
+
+
+class TestBatchPlanner(unittest.TestCase):
+
+    def test_climbs_to_best_size(self):
+        # Throughput peaks at 16 tags per query
+        rates = {1: 100, 2: 180, 4: 300, 8: 500, 16: 600, 32: 550, 64: 300}
+        planner = BatchPlanner(initial_size=4)
+        for _ in range(10):
+            size = planner.batch_size()
+            planner.observe(size, rates[size], 1.0)
+        self.assertEqual(planner.batch_size(), 16)
+        self.assertNotIn(64, planner.rates)
+
+    def test_partial_batch_counts_for_nearest_size(self):
+        planner = BatchPlanner(initial_size=8)
+        planner.observe(5, 300, 1.0)
+        self.assertEqual(planner.rates, {4: 300.0})
+        self.assertIn(planner.batch_size(), planner.sizes)
+
+
+class TestBatchedFetch(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_tag_archive(HOST, DATABASE, range(1, 11),
+                                       '2015-08-24 00:00:00',
+                                       '2015-08-24 02:00:00', interval=60)
+        self.driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+
+    def tearDown(self):
+        wincc.driver_name = self.driver_name
+        close_all()
+        simulator.reset()
+
+    def test_batched_honours_timestep_and_mode(self):
+        tagids = [str(tagid) for tagid in range(10, 0, -1)] + ['99']
+        args = (HostInfo(), '2015-08-24 00:00:00', '2015-08-24 02:00:00',
+                tagids, 600, 'max', True)
+        batched = get_multiple_tag_records(*args, parallel=True)
+        serial = get_multiple_tag_records(*args, parallel=False)
+        self.assertEqual([record.tagid for record in batched],
+                         [int(tagid) for tagid in tagids])
+        self.assertEqual([list(record) for record in batched[:-1]],
+                         [list(record) for record in serial])
+        self.assertEqual([len(list(record)) for record in batched],
+                         [12] * 10 + [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
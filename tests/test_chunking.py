@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime, timedelta
+from pywincc import simulator
+from pywincc.pool import close_all
+from pywincc.chunking import ChunkPlanner, chunk_config
+from pywincc.wincc import wincc, get_chunked_tag_records, \
+    get_multiple_tag_records
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class HostInfo():
+    address = HOST
+    database = DATABASE
+
+
+class TestChunkPlanner(unittest.TestCase):
+
+    def test_chunks_cover_range_aligned_to_timestep(self):
+        begin = datetime(2015, 8, 24, 0, 30)
+        end = begin + timedelta(days=2)
+        planner = ChunkPlanner(begin, end, 3600, span=5000, min_span=3600)
+        chunks = []
+        while True:
+            chunk = planner.next_chunk()
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        self.assertEqual(chunks[0], (0, begin, begin + timedelta(hours=1)))
+        self.assertEqual(chunks[-1][2], end)
+        for previous, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(previous[2], chunk[1])
+
+    def test_span_adapts_to_speed(self):
+        begin = datetime(2015, 8, 24)
+        planner = ChunkPlanner(begin, begin + timedelta(days=30), span=3600,
+                               min_span=60, target_duration=4.0)
+        chunk = planner.next_chunk()
+        planner.observe(chunk, 1000, 1.0)
+        self.assertEqual(planner.span, (3600 + 4 * 3600) // 2)
+        span = planner.span
+        planner.observe(planner.next_chunk(), 1000, 100.0)
+        self.assertLess(planner.span, span)
+
+
+class TestChunkedFetch(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_tag_archive(HOST, DATABASE, [1, 2],
+                                       '2015-08-24 00:00:00',
+                                       '2015-08-27 00:00:00', interval=300)
+        self.driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+        self.chunk_config = dict(chunk_config)
+
+    def tearDown(self):
+        wincc.driver_name = self.driver_name
+        close_all()
+        chunk_config.update(self.chunk_config)
+        simulator.reset()
+
+    def test_chunked_equals_single_query(self):
+        for timestep, mode in ((0, 'first'), (3600, 'avg')):
+            chunk_config.update(min_range=86400, initial_span=6 * 3600)
+            chunked = get_chunked_tag_records(
+                HostInfo(), '2015-08-24 00:00:00', '2015-08-26 12:00:00',
+                ['1', '2'], timestep, mode, utc=True, connections=3)
+            self.assertTrue(chunked)
+            chunk_config.update(min_range=7 * 86400)
+            single = get_multiple_tag_records(
+                HostInfo(), '2015-08-24 00:00:00', '2015-08-26 12:00:00',
+                ['1', '2'], timestep, mode, utc=True, parallel=False)
+            self.assertEqual([list(record) for record in chunked],
+                             [list(record) for record in single])
+
+
+if __name__ == "__main__":
+    unittest.main()
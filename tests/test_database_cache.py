@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pywincc.database_cache import DatabaseNameCache
+
+
+class TestDatabaseNameCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'database_names.json')
+        self.cache = DatabaseNameCache(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_set_and_get(self):
+        self.cache.set(r'10.1.57.50\WINCC', 'runtime', 'CC_OS_1__15_01R')
+        other = DatabaseNameCache(self.filename)
+        self.assertEqual(other.get(r'10.1.57.50\wincc', 'runtime'),
+                         'CC_OS_1__15_01R')
+        self.assertIsNone(other.get(r'10.1.57.50\WINCC', 'config'))
+
+    def test_expired_entry_is_ignored(self):
+        self.cache.set('host', 'runtime', 'CC_OS_1__15_01R')
+        self.cache.ttl = -1
+        self.assertIsNone(self.cache.get('host', 'runtime'))
+
+    def test_invalidate(self):
+        self.cache.set('host', 'runtime', 'CC_OS_1__15_01R')
+        self.cache.set('host', 'config', 'CC_OS_1__15_01')
+        self.cache.invalidate('host', 'runtime')
+        self.assertIsNone(self.cache.get('host', 'runtime'))
+        self.assertEqual(self.cache.get('host', 'config'), 'CC_OS_1__15_01')
+
+    def test_missing_file_is_empty(self):
+        self.assertIsNone(self.cache.get('host'))
+
+    def test_default_file_in_user_cache(self):
+        xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp_dir
+        try:
+            cache = DatabaseNameCache()
+            cache.set('host', 'runtime', 'CC_OS_1__15_01R')
+            self.assertTrue(os.path.exists(os.path.join(
+                self.tmp_dir, 'pywincc', 'database_names.json')))
+        finally:
+            if xdg_cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = xdg_cache_home
+
+
+if __name__ == "__main__":
+    unittest.main()
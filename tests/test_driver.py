@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pywincc import simulator
+from pywincc.database_cache import DatabaseNameCache
+from pywincc.driver import get_driver, DriverException
+from pywincc.mssql import mssql
+from pywincc.wincc import wincc
+
+HOST = r'plant\WINCC'
+
+
+class TestSimulatorDriver(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_database(HOST, 'CC_OS_1__15_01_08_16_40_41')
+        simulator.create_database(HOST, 'CC_OS_1__15_01_08_16_40_41R')
+        self.name_cache = wincc.name_cache
+        wincc.name_cache = None
+
+    def tearDown(self):
+        wincc.name_cache = self.name_cache
+        simulator.reset()
+
+    def test_fetch_database_names(self):
+        m = mssql(HOST, '', driver='simulator')
+        m.connect()
+        self.assertEqual(m.fetch_database_names(),
+                         ['CC_OS_1__15_01_08_16_40_41',
+                          'CC_OS_1__15_01_08_16_40_41R'])
+        m.close()
+
+    def test_wincc_resolves_runtime_database(self):
+        w = wincc(HOST, driver='simulator')
+        w.connect()
+        self.assertEqual(w.database, 'CC_OS_1__15_01_08_16_40_41R')
+        w.close()
+
+    def test_stale_cached_names_are_replaced(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            wincc.name_cache = DatabaseNameCache(
+                os.path.join(tmp_dir, 'database_names.json'))
+            # Names before a database rollover
+            old = 'CC_OS_1__14_01_01_00_00_00'
+            wincc.name_cache.set(HOST, 'runtime', old + 'R')
+            wincc.name_cache.set(HOST, 'config', old)
+            w = wincc(HOST, driver='simulator')
+            w.connect()
+            w.close()
+            self.assertEqual(w.database, 'CC_OS_1__15_01_08_16_40_41R')
+            self.assertEqual(w.fetch_wincc_config_database_name(),
+                             'CC_OS_1__15_01_08_16_40_41')
+            self.assertEqual(wincc.name_cache.get(HOST, 'config'),
+                             'CC_OS_1__15_01_08_16_40_41')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_rows_by_name_and_index(self):
+        m = mssql(HOST, 'CC_OS_1__15_01_08_16_40_41', driver='simulator')
+        m.connect()
+        m.execute("CREATE TABLE PDE#TAGs (TLGTAGID INTEGER, VARNAME TEXT)")
+        m.execute("INSERT INTO PDE#TAGs VALUES (729, 'ORC1_TURB_GEP')")
+        m.execute("SELECT TLGTAGID, VARNAME FROM PDE#TAGs")
+        rec = m.fetchone()
+        self.assertEqual((rec[0], rec['VARNAME']), (729, 'ORC1_TURB_GEP'))
+        m.close()
+
+    def test_unknown_driver(self):
+        self.assertRaises(DriverException, get_driver, 'oracle')
+
+
+if __name__ == "__main__":
+    unittest.main()
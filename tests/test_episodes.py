@@ -0,0 +1,63 @@
+import unittest
+from datetime import datetime
+from pywincc.alarm import Alarm, AlarmRecord
+from pywincc.episodes import iter_episodes, episode_statistics
+
+
+def alarm(msg_id, state, minute, day='2015-08-24', hour=10):
+    return Alarm(msg_id, state, '{0} {1:02}:{2:02}:00.000'.format(
+        day, hour, minute), u'Alarm', u'WARNING', u'PUMP', u'Overload')
+
+
+def at(minute):
+    return datetime(2015, 8, 24, 10, minute)
+
+
+class TestEpisodes(unittest.TestCase):
+
+    def test_pairing(self):
+        record = AlarmRecord([
+            alarm(7, 2, 1),              # came before the window
+            alarm(8, 1, 2), alarm(8, 3, 3), alarm(8, 2, 5),
+            alarm(7, 16, 4),
+            alarm(8, 1, 10), alarm(8, 2, 12), alarm(8, 16, 13),
+            alarm(8, 3, 14),             # second acknowledge is ignored
+            alarm(8, 1, 20),             # still active at window end
+            alarm(9, 5, 21)])            # unknown state
+        episodes = [(e.id, e.come, e.go, e.ack)
+                    for e in iter_episodes(reversed(list(record)),
+                                           utc=True)]
+        self.assertEqual(sorted(episodes), sorted([
+            (7, None, at(1), at(4)),
+            (8, at(2), at(5), at(3)),
+            (8, at(10), at(12), at(13)),
+            (8, at(20), None, None)]))
+
+    def test_statistics(self):
+        alarms = [alarm(8, 1, 0), alarm(8, 3, 1), alarm(8, 2, 5),
+                  alarm(8, 1, 30)]
+        stats = episode_statistics(iter_episodes(alarms, presorted=True,
+                                                 utc=True), end=at(40))
+        self.assertEqual(stats[8], (2, 900.0, 600.0, 1, 60.0))
+
+    def test_local_times_across_dst_end(self):
+        # 02:00 to 03:00 local time is repeated on 2015-10-25 in Berlin
+        alarms = [alarm(7, 1, 30, '2015-10-25', 1),
+                  alarm(8, 1, 50, '2015-10-25', 2),   # 00:50 UTC
+                  alarm(8, 2, 10, '2015-10-25', 2),   # 01:10 UTC
+                  alarm(8, 3, 20, '2015-10-25', 2),
+                  alarm(7, 2, 30, '2015-10-25', 3)]
+        episodes = list(iter_episodes(alarms, presorted=True,
+                                      zone_name='Europe/Berlin'))
+        self.assertEqual([(e.id, e.duration(), e.ack_delay())
+                          for e in episodes],
+                         [(7, 3 * 3600.0, None), (8, 1200.0, 1800.0)])
+        self.assertEqual(episodes[1].come, datetime(2015, 10, 25, 0, 50))
+        local = episodes[1].localize('Europe/Berlin')
+        self.assertEqual([t.strftime('%H:%M%z')
+                          for t in (local.come, local.go, local.ack)],
+                         ['02:50+0200', '02:10+0100', '02:20+0100'])
+
+
+if __name__ == "__main__":
+    unittest.main()
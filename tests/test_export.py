@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pywincc.export import export_tag_records, export_format
+from pywincc.tag import Tag, TagRecord
+from pywincc.tag_array import CompactTagRecord
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def make_records():
+    record = TagRecord(tagid=1776)
+    compact = CompactTagRecord(1777, utc=True)
+    for i in range(3):
+        tag = Tag(datetime(2015, 8, 24, 8, 48, i, 483000), 29.5 + i)
+        record.push(tag)
+        compact.push(tag)
+    return [record, compact]
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_csv_same_as_to_csv(self):
+        records = make_records()
+        filename = os.path.join(self.directory, 'tags.csv')
+        self.assertEqual(export_tag_records(records, filename, name=u'Flow'),
+                         'csv')
+        with open(filename, 'rb') as fh:
+            self.assertEqual(fh.read().decode('utf-8'), u"".join(
+                record.to_csv(name=u'Flow') for record in records))
+
+    def test_format_by_extension(self):
+        self.assertEqual(export_format('tags.PARQUET'), 'parquet')
+        self.assertEqual(export_format('tags.feather'), 'arrow')
+        self.assertEqual(export_format('tags'), 'csv')
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_parquet_and_arrow_typed_columns(self):
+        import pyarrow.parquet
+        records = make_records()
+        parquet_file = os.path.join(self.directory, 'tags.parquet')
+        arrow_file = os.path.join(self.directory, 'tags.arrow')
+        export_tag_records(records, parquet_file, name='flow')
+        export_tag_records(records, arrow_file, name='flow')
+        tables = [pyarrow.parquet.read_table(parquet_file),
+                  pyarrow.ipc.open_file(arrow_file).read_all()]
+        for table in tables:
+            self.assertEqual(table.column_names, ['tagid', 'time', 'flow'])
+            self.assertEqual(table.num_rows, 6)
+            self.assertEqual(str(table.schema.field('time').type),
+                             'timestamp[ms, tz=UTC]')
+            columns = table.to_pydict()
+            self.assertEqual(columns['tagid'], [1776] * 3 + [1777] * 3)
+            self.assertEqual(columns['flow'], [29.5, 30.5, 31.5] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import time
+import unittest
+from pywincc import simulator
+from pywincc.pool import close_all
+from pywincc.fleet import FleetTimeout, fan_out, query_alarms, select_hosts
+from pywincc.wincc import WinCCHost, wincc
+
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+def sleep_for(host, seconds):
+    time.sleep(seconds[host.hostname])
+    return host.hostname
+
+
+class TestFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.hosts = [WinCCHost(name, name + r'\WINCC', DATABASE, desc)
+                      for name, desc in (('agro', 'AGRO ENERGIE'),
+                                         ('slow', 'SLOW PLANT'),
+                                         ('fast', 'FAST PLANT'))]
+
+    def test_select_hosts(self):
+        self.assertEqual([host.hostname for host
+                          in select_hosts(self.hosts, pattern='*plant')],
+                         ['slow', 'fast'])
+        self.assertEqual([host.hostname for host
+                          in select_hosts(self.hosts, names=['AGRO'])],
+                         ['agro'])
+
+    def test_results_stream_in_completion_order(self):
+        seconds = {'agro': 0.2, 'slow': 5, 'fast': 0}
+        results = list(fan_out(self.hosts, sleep_for, (seconds,),
+                               timeout=0.5))
+        self.assertEqual([res.host.hostname for res in results],
+                         ['fast', 'agro', 'slow'])
+        self.assertEqual(results[0].result, 'fast')
+        self.assertIsInstance(results[2].error, FleetTimeout)
+
+    def test_alarm_query_per_host(self):
+        driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+        simulator.reset()
+        try:
+            for i, host in enumerate(self.hosts):
+                simulator.create_runtime_database(host.host_address,
+                                                  DATABASE)
+                simulator.generate_alarm_archive(
+                    host.host_address, DATABASE, '2015-08-24 00:00:00',
+                    '2015-08-24 06:00:00', alarms_per_hour=i + 1)
+            counts = dict((res.host.hostname, res.result.count_all())
+                          for res in fan_out(self.hosts, query_alarms,
+                                             ('2015-08-24 00:00:00',
+                                              '2015-08-24 06:00:00', True)))
+        finally:
+            wincc.driver_name = driver_name
+            close_all()
+            simulator.reset()
+        self.assertTrue(counts['agro'] < counts['slow'] < counts['fast'])
+
+
+if __name__ == "__main__":
+    unittest.main()
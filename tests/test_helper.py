@@ -0,0 +1,29 @@
+import unittest
+from datetime import datetime
+from pywincc.helper import str_to_datetime, strptime_datetime, DatetimeParser
+
+STRINGS = ['2015-08-21', '2015-08-26 07:47', '2015-08-21 10:23:25',
+           '2015-08-21 10:23:48.6', '2015-08-21 10:23:48.672',
+           '2015-08-21 10:23:48.672123', u'2015-08-21 10:23:25',
+           # Only strptime understands these
+           '2015-8-21', '2015-08-21 7:47']
+
+
+class TestStrToDatetime(unittest.TestCase):
+
+    def test_same_as_strptime(self):
+        expected = [strptime_datetime(s) for s in STRINGS]
+        self.assertEqual([str_to_datetime(s) for s in STRINGS], expected)
+        # Memoized
+        self.assertEqual([str_to_datetime(s) for s in STRINGS], expected)
+        self.assertEqual(map(DatetimeParser(), STRINGS), expected)
+
+    def test_invalid(self):
+        self.assertIsNone(str_to_datetime('2015-02-30'))
+        self.assertIsNone(str_to_datetime('2015-08-21T10:23:25'))
+        dt = datetime(2015, 8, 21)
+        self.assertIs(str_to_datetime(dt), dt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import unittest
+from pywincc import simulator
+from pywincc.instrumentation import Instrumentation, instrumentation, \
+    query_hash
+from pywincc.tag import tag_query_builder
+from pywincc.wincc import wincc
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_tag_archive(HOST, DATABASE, [1],
+                                       '2015-08-24 00:00:00',
+                                       '2015-08-24 01:00:00', interval=60)
+        instrumentation.reset()
+        self.events = []
+        instrumentation.add_callback(self.events.append)
+
+    def tearDown(self):
+        instrumentation.remove_callback(self.events.append)
+        simulator.reset()
+
+    def test_query_phases(self):
+        query = tag_query_builder(['1'], '2015-08-24 00:00:00',
+                                  '2015-08-24 01:00:00', 0, 'first', True)
+        w = wincc(HOST, DATABASE, driver='simulator')
+        w.connect()
+        w.execute(query)
+        w.create_tag_record()
+        w.close()
+        summary = json.loads(instrumentation.to_json())
+        for name in ('connect', 'execute', 'fetch', 'timezone', 'convert'):
+            self.assertIn(name, summary['phases'])
+        self.assertEqual(summary['phases']['fetch']['rows'], 60)
+        self.assertEqual(summary['queries'][0]['hash'], query_hash(query))
+        self.assertIn('execute', [event['phase'] for event in self.events])
+
+    def test_query_aggregates_are_bounded(self):
+        collector = Instrumentation()
+        collector.max_queries = 2
+        collector.max_query_length = 10
+        for i in range(5):
+            query = "TAG:R,{0},'2015-08-24 00:00:00'".format(i)
+            collector.record('execute', 0.1, query=query)
+            collector.record('fetch', 0.2, 10, query)
+        summary = collector.summary()
+        self.assertEqual(len(summary['queries']), 2)
+        self.assertEqual(summary['queries_dropped'], 3)
+        self.assertEqual(summary['phases']['fetch']['rows'], 50)
+        self.assertEqual(sorted(q['query'] for q in summary['queries']),
+                         ["TAG:R,0,'2...", "TAG:R,1,'2..."])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import threading
+import time
+import unittest
+from pywincc import simulator
+from pywincc.driver import com_thread
+from pywincc.pool import ConnectionPool, PoolException, close_all, get_pool
+from pywincc.wincc import wincc, query_record, WinCCException
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class FakeCursor():
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        if self.conn.broken:
+            raise IOError("connection lost")
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+    """Minimal DB-API connection."""
+
+    opened = 0
+
+    def __init__(self):
+        FakeConnection.opened += 1
+        self.closed = False
+        self.broken = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+def select_one(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1")
+    return True
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        FakeConnection.opened = 0
+
+    def test_reuses_released_connection(self):
+        pool = ConnectionPool(FakeConnection, size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(FakeConnection.opened, 1)
+
+    def test_size_limit_times_out(self):
+        pool = ConnectionPool(FakeConnection, size=1, timeout=0.05)
+        pool.acquire()
+        self.assertRaises(PoolException, pool.acquire)
+
+    def test_waiting_acquire_gets_released_connection(self):
+        pool = ConnectionPool(FakeConnection, size=1, timeout=5)
+        conn = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, [conn])
+        timer.start()
+        self.assertIs(pool.acquire(), conn)
+        timer.join()
+
+    def test_idle_timeout_closes_connection(self):
+        pool = ConnectionPool(FakeConnection, idle_timeout=0.01)
+        conn = pool.acquire()
+        pool.release(conn)
+        time.sleep(0.02)
+        self.assertIsNot(pool.acquire(), conn)
+        self.assertTrue(conn.closed)
+
+    def test_unhealthy_connection_is_replaced(self):
+        pool = ConnectionPool(FakeConnection, health_check=select_one,
+                              check_interval=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.broken = True
+        new_conn = pool.acquire()
+        self.assertIsNot(new_conn, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_connection_discarded_on_error(self):
+        pool = ConnectionPool(FakeConnection)
+        try:
+            with pool.connection() as conn:
+                raise IOError("query failed")
+        except IOError:
+            pass
+        self.assertTrue(conn.closed)
+        self.assertEqual(len(pool), 0)
+
+    def in_thread(self, function, *args):
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(function(*args)))
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def test_connection_not_shared_between_threads(self):
+        pool = ConnectionPool(FakeConnection, size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+
+        def acquire_release():
+            other = pool.acquire()
+            pool.release(other)
+            return other
+        self.assertIsNot(self.in_thread(acquire_release), conn)
+        self.assertEqual(FakeConnection.opened, 2)
+        self.assertIs(pool.acquire(), conn)
+
+    def test_connections_of_finished_thread_closed(self):
+        pool = ConnectionPool(FakeConnection, size=2)
+        other = self.in_thread(pool.acquire)
+        pool.release(other)
+        self.assertEqual(pool.idle_count(), 1)
+        self.assertIsNot(pool.acquire(), other)
+        self.assertTrue(other.closed)
+        self.assertEqual(pool.idle_count(), 0)
+        self.assertEqual(len(pool), 1)
+
+    def test_full_pool_drops_idle_connection_of_other_thread(self):
+        pool = ConnectionPool(FakeConnection, size=1, timeout=0.05)
+        conn = pool.acquire()
+        pool.release(conn)
+        # Keep the main thread alive, its connection is dropped anyway
+        other = self.in_thread(pool.acquire)
+        self.assertIsNot(other, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(len(pool), 1)
+
+    def test_com_thread_closes_thread_connections(self):
+        pool = get_pool(('fake', 'host', 'db'), FakeConnection)
+
+        def work():
+            with com_thread():
+                conn = pool.acquire()
+                pool.release(conn)
+            return conn
+        try:
+            self.assertTrue(self.in_thread(work).closed)
+            self.assertEqual(len(pool), 0)
+        finally:
+            close_all()
+
+
+class TestWinCCPooling(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+
+    def tearDown(self):
+        close_all()
+        simulator.reset()
+
+    def test_health_check_detects_dead_connection(self):
+        w = wincc(HOST, DATABASE, driver='simulator')
+        w.connect()
+        conn = w.conn
+        self.assertTrue(w.check_connection(conn))
+        w.close()
+        self.assertRaises(Exception, w.check_connection, conn)
+
+    def test_failed_query_discards_connection(self):
+        driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+        try:
+            self.assertRaises(WinCCException, query_record, HOST, DATABASE,
+                              'alarms', 'ALARMVIEW:broken', '2015-08-24',
+                              '2015-08-25')
+            w = wincc(HOST, DATABASE, pooled=True)
+            pool = get_pool(w.pool_key(), None)
+            self.assertEqual(len(pool), 0)
+        finally:
+            wincc.driver_name = driver_name
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pywincc import report
+from pywincc.alarm import Alarm, AlarmRecord
+from pywincc.report import generate_alarms_report, get_template
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.config = dict(report.report_config)
+        report.configure(out_dir=self.out_dir)
+
+    def tearDown(self):
+        report.report_config.update(self.config)
+        shutil.rmtree(self.out_dir)
+
+    def test_template_cached(self):
+        self.assertIs(get_template('alarms.html'), get_template('alarms.html'))
+
+    def test_alarms_report_streamed_to_out_dir(self):
+        cwd = os.getcwd()
+        alarms = AlarmRecord([Alarm(7, 1, '2015-08-24 10:48:10.483', u'Alarm',
+                                    u'WARNING', u'PUMP', u'\xdcberlast')])
+        filename = generate_alarms_report(alarms, '2015-08-24', '2015-08-25',
+                                          'AGRO ENERGIE')
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(filename, os.path.join(
+            self.out_dir, 'alarms_AGRO_ENERGIE_2015_08_24.html'))
+        with open(filename, 'rb') as fh:
+            html = fh.read().decode('utf-8')
+        self.assertIn(u'\xdcberlast', html)
+        self.assertIn(u'alarms_AGRO_ENERGIE_2015_08_25.html', html)
+
+    def test_virtual_alarms_report_writes_chunks(self):
+        alarms = AlarmRecord([
+            Alarm(7, 1, '2015-08-24 10:48:10.483', u'Alarm', u'WARNING',
+                  u'PUMP', u'\xdcberlast'),
+            Alarm(7, 2, '2015-08-24 10:49:10.000', u'Alarm', u'WARNING',
+                  u'PUMP', u'\xdcberlast'),
+            Alarm(8, 1, None, u'Alarm', u'STOP_ALL', u'FAN', u'</td>')])
+        report.configure(chunk_size=2)
+        filename = generate_alarms_report(alarms, '2015-08-24', '2015-08-25',
+                                          'AGRO ENERGIE', virtual=True)
+        with open(filename, 'rb') as fh:
+            html = fh.read().decode('utf-8')
+        self.assertNotIn(u'\xdcberlast', html)
+        self.assertIn(u'alarms_AGRO_ENERGIE_2015_08_24_data/index.js', html)
+        data_dir = os.path.join(self.out_dir,
+                                'alarms_AGRO_ENERGIE_2015_08_24_data')
+        self.assertEqual(sorted(os.listdir(data_dir)),
+                         ['chunk_0000.js', 'chunk_0001.js', 'index.js'])
+
+        def load(name, function):
+            with open(os.path.join(data_dir, name), 'rb') as fh:
+                script = fh.read()
+            self.assertTrue(script.startswith(function + '('))
+            return json.loads('[' + script.strip()[len(function) + 1:-2] +
+                              ']')
+
+        index = load('index.js', 'alarm_index')[0]
+        self.assertEqual(index['count'], 3)
+        self.assertEqual(index['priorities'], [u'WARNING', u'STOP_ALL'])
+        self.assertEqual(index['texts'], [u'\xdcberlast', u'</td>'])
+        self.assertEqual([chunk['counts'] for chunk in index['chunks']],
+                         [{'0,1': 1, '0,2': 1}, {'1,1': 1}])
+        self.assertEqual(load('chunk_0000.js', 'alarm_chunk'),
+                         [0, [[7, 0, 1, 0, 0, 0], [7, 59517, 2, 0, 0, 0]]])
+        self.assertEqual(load('chunk_0001.js', 'alarm_chunk'),
+                         [1, [[8, None, 1, 1, 1, 1]]])
+
+
+if __name__ == "__main__":
+    unittest.main()
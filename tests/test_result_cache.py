@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pywincc import simulator
+from pywincc.pool import close_all
+from pywincc.alarm import Alarm
+from pywincc.result_cache import ResultCache
+from pywincc.wincc import wincc, fetch_alarms_and_operator_messages
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+QUERY = u"ALARMVIEW:SELECT * FROM ALGVIEWDEU WHERE DateTime > '2015-08-24'"
+ALARMS = [Alarm(7, 1, '2015-08-24 10:48:10.483', u'Alarm', u'WARNING',
+                u'PUMP', u'\xdcberlast'),
+          Alarm(7, 2, '2015-08-24 10:49:10.000', u'Alarm', u'WARNING',
+                u'PUMP', u'\xdcberlast')]
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_by_normalized_key(self):
+        key = self.cache.key('alarms', HOST, DATABASE, QUERY, '2015-08-24',
+                             '2015-08-25')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, ALARMS)
+        key = self.cache.key('alarms', HOST.upper(), DATABASE,
+                             QUERY.replace(' ', '  '), '2015-08-24 00:00',
+                             '2015-08-25')
+        self.assertEqual(self.cache.get(key), ALARMS)
+        self.assertIsNone(self.cache.get(self.cache.key(
+            'alarms', HOST, DATABASE, QUERY, '2015-08-24', '2015-08-26')))
+
+    def test_only_recent_ranges_expire(self):
+        cache = ResultCache(self.cache.directory, ttl=-1)
+        historical = cache.key('alarms', HOST, DATABASE, QUERY, '2015-08-24',
+                               '2015-08-25')
+        recent = cache.key('alarms', HOST, DATABASE, QUERY, '2015-08-24',
+                           '2999-01-01')
+        cache.put(historical, ALARMS)
+        cache.put(recent, ALARMS)
+        self.assertEqual(cache.get(historical), ALARMS)
+        self.assertIsNone(cache.get(recent))
+
+    def test_least_recently_used_evicted(self):
+        keys = [self.cache.key('alarms', HOST, DATABASE, QUERY,
+                               '2015-08-2{0}'.format(day),
+                               '2015-08-2{0}'.format(day + 1))
+                for day in range(3)]
+        for i, key in enumerate(keys[:2]):
+            filename = self.cache.put(key, ALARMS)
+            os.utime(filename, (time.time() - 100 + i, time.time() - 100 + i))
+        self.cache.get(keys[0])
+        # Room for two entries, their sizes differ by a few bytes
+        self.cache.max_bytes = int(os.path.getsize(filename) * 2.5)
+        self.cache.put(keys[2], ALARMS)
+        self.assertEqual(self.cache.get(keys[0]), ALARMS)
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.get(keys[2]), ALARMS)
+
+    def test_broken_entry_is_a_miss(self):
+        key = self.cache.key('alarms', HOST, DATABASE, QUERY, '2015-08-24',
+                             '2015-08-25')
+        with open(self.cache.put(key, ALARMS), 'wb') as fh:
+            fh.write(b'PWRC1\ngarbage')
+        self.assertIsNone(self.cache.get(key))
+
+    def test_fetch_uses_cached_chunks(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_alarm_archive(HOST, DATABASE, '2015-08-23 00:00:00',
+                                         '2015-08-27 00:00:00')
+        driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+        try:
+            expected = fetch_alarms_and_operator_messages(
+                HOST, DATABASE, '2015-08-24', '2015-08-26', chunk_days=1)
+            fetched = fetch_alarms_and_operator_messages(
+                HOST, DATABASE, '2015-08-24', '2015-08-26', chunk_days=1,
+                result_cache=self.cache)
+            self.assertEqual(fetched, expected)
+            close_all()
+            # Without the server all chunks come from the cache
+            simulator.reset()
+            self.assertEqual(fetch_alarms_and_operator_messages(
+                HOST, DATABASE, '2015-08-24', '2015-08-26', chunk_days=1,
+                result_cache=self.cache), expected)
+        finally:
+            wincc.driver_name = driver_name
+            close_all()
+            simulator.reset()
+
+
+if __name__ == "__main__":
+    unittest.main()
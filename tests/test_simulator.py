@@ -0,0 +1,99 @@
+import unittest
+from pywincc import simulator
+from pywincc.alarm import alarm_query_builder
+from pywincc.operator_messages import om_query_builder
+from pywincc.tag import tag_query_builder
+from pywincc.wincc import wincc
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class TestSimulator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        # 2 tags, one value per minute for 2 hours
+        simulator.generate_tag_archive(HOST, DATABASE, [1, 2],
+                                       '2015-08-24 00:00:00',
+                                       '2015-08-24 02:00:00', interval=60)
+        simulator.generate_alarm_archive(HOST, DATABASE,
+                                         '2015-08-24 00:00:00',
+                                         '2015-08-25 00:00:00')
+
+    @classmethod
+    def tearDownClass(cls):
+        simulator.reset()
+
+    def setUp(self):
+        self.w = wincc(HOST, DATABASE, driver='simulator')
+        self.w.connect()
+
+    def tearDown(self):
+        self.w.close()
+
+    def test_raw_tag_query(self):
+        self.w.execute(tag_query_builder(['1'], '2015-08-24 00:00:00',
+                                         '2015-08-24 00:59:59', 0, 'first',
+                                         True))
+        records = self.w.create_tag_records(utc=True)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(len(list(records[0])), 60)
+
+    def test_timestep_modes(self):
+        results = {}
+        for mode in ('min', 'max', 'avg', 'count'):
+            self.w.execute(tag_query_builder(['1'], '2015-08-24 00:00:00',
+                                             '2015-08-24 02:00:00', 3600,
+                                             mode, True))
+            results[mode] = [tag.value for tag
+                             in self.w.create_tag_records(utc=True)[0]]
+        self.assertEqual(results['count'], [60.0, 60.0])
+        for i in range(2):
+            self.assertTrue(results['min'][i] <= results['avg'][i] <=
+                            results['max'][i])
+
+    def test_interpolated_mode_fills_gaps(self):
+        self.w.execute(tag_query_builder(['1'], '2015-08-24 01:00:00',
+                                         '2015-08-24 04:00:00', 3600,
+                                         'avg_interpolated', True))
+        self.assertEqual(len(list(self.w.create_tag_records(utc=True)[0])),
+                         3)
+
+    def test_multi_tag_query(self):
+        self.w.execute(tag_query_builder(['2', '1'], '2015-08-24 00:00:00',
+                                         '2015-08-24 02:00:00', 600, 'avg',
+                                         True))
+        records = self.w.create_tag_records(utc=True)
+        self.assertEqual([r.tagid for r in records], [2, 1])
+        self.assertEqual([len(list(r)) for r in records], [12, 12])
+
+    def test_alarm_query(self):
+        self.w.execute(alarm_query_builder('2015-08-24 06:00:00',
+                                           '2015-08-24 12:00:00', '', True,
+                                           '=1', 'WARNING'))
+        alarms = list(self.w.create_alarm_record())
+        self.assertTrue(alarms)
+        for alarm in alarms:
+            self.assertEqual((alarm.state, alarm.priority), (1, u'WARNING'))
+
+    def test_alarm_query_bounds_are_exclusive(self):
+        simulator.insert_alarm(HOST, DATABASE, 9001, 1, '2015-08-24 08:07:48')
+        simulator.insert_alarm(HOST, DATABASE, 9002, 1,
+                               '2015-08-24 08:07:48.500')
+        self.w.execute(alarm_query_builder('2015-08-24 08:07:48',
+                                           '2015-08-24 08:08:12', '', True))
+        self.assertEqual([alarm.id for alarm in self.w.create_alarm_record()
+                          if alarm.id > 9000], [9002])
+
+    def test_operator_message_query(self):
+        self.w.execute(om_query_builder('2015-08-24 00:00:00',
+                                        '2015-08-25 00:00:00', utc=True))
+        self.assertEqual(self.w.create_operator_messages_record().count(),
+                         24)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timedelta
+from pywincc.helper import utc_to_local
+from pywincc.tag import Tag, TagRecord
+from pywincc.tag_array import CompactTagRecord
+
+
+class TestCompactTagRecord(unittest.TestCase):
+
+    def setUp(self):
+        # Minutes across the DST end of 2015 in Europe/Berlin
+        begin = datetime(2015, 10, 25, 0, 0, 0, 250000)
+        self.tags = [Tag(utc_to_local(begin + timedelta(minutes=i)), i * 0.5)
+                     for i in range(0, 180, 7)]
+        self.record = TagRecord(1776, 'temperature')
+        self.compact = CompactTagRecord(1776, 'temperature')
+        for tag in self.tags:
+            self.record.push(tag)
+            self.compact.push(tag)
+
+    def test_same_as_tag_record(self):
+        self.assertEqual(len(self.compact), len(self.tags))
+        self.assertEqual([tuple(tag) for tag in self.compact],
+                         [tuple(tag) for tag in self.record])
+        self.assertEqual(self.compact.get_xs_ys(), self.record.get_xs_ys())
+        self.assertEqual(unicode(self.compact), unicode(self.record))
+        for kwargs in ({}, {'name': 'temperature', 'delimiter': ';'}):
+            self.assertEqual(self.compact.to_csv(**kwargs),
+                             self.record.to_csv(**kwargs))
+        lines = self.compact.to_csv(delimiter=u'{}').splitlines()
+        self.assertEqual(lines, self.record.to_csv(delimiter=u'{}')
+                         .splitlines())
+        self.assertEqual(lines[0], u"{0}{{}}{1}".format(*self.tags[0]))
+
+    def test_slicing(self):
+        part = self.compact[2:5]
+        self.assertIsInstance(part, CompactTagRecord)
+        self.assertEqual(list(part), self.tags[2:5])
+        self.assertEqual(self.compact[-1], self.tags[-1])
+
+    def test_push_after_growing_and_slicing(self):
+        part = self.compact[:3]
+        for tag in self.tags * 4:
+            part.push(tag)
+        self.assertEqual(list(part), self.tags[:3] + self.tags * 4)
+        self.assertEqual(list(self.compact), self.tags)
+
+    def test_push_keeps_utc(self):
+        compact = CompactTagRecord()
+        compact.push(Tag(datetime(2015, 8, 24, 8, 48, 10), 1.0))
+        self.assertFalse(compact.utc)
+        self.assertEqual(compact[0].time, utc_to_local(
+            datetime(2015, 8, 24, 8, 48, 10)))
+
+    def test_utc_and_quality(self):
+        compact = CompactTagRecord(utc=True, quality=True)
+        compact.push(Tag(datetime(2015, 8, 24, 8, 48, 10), 1.0), 0x80)
+        compact.extend([1440406091000], [2.0])
+        self.assertEqual(list(compact),
+                         [Tag(datetime(2015, 8, 24, 8, 48, 10), 1.0),
+                          Tag(datetime(2015, 8, 24, 8, 48, 11), 2.0)])
+        self.assertEqual(list(compact.qualities), [0x80, 0])
+        record = TagRecord()
+        for tag in compact:
+            record.push(tag)
+        self.assertEqual(compact.to_csv(tz=2), record.to_csv(tz=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pywincc import simulator, vas
+from pywincc.pool import close_all
+from pywincc.chunking import chunk_config
+from pywincc.tag import plot_tag_records2
+from pywincc.tag_array import TagArrayRecord
+from pywincc.tag_cache import TagCache
+from pywincc.wincc import wincc, get_multiple_tag_records
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+except ImportError:
+    matplotlib = None
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+# Across the DST end of 2015 in Europe/Berlin (01:00 UTC)
+BEGIN = '2015-10-24 22:00:00'
+END = '2015-10-25 04:00:00'
+PLOT_CONFIG = {'tags': {'1': {'figure_num': 0, 'axis_num': 0, 'name': 'a'},
+                        '2': {'figure_num': 0, 'axis_num': 1, 'name': 'b'}},
+               'figures': [{'num_axes': 2}],
+               'axes': [{'min': 0, 'max': 200}, {'min': 0, 'max': 200}]}
+
+
+def times(record):
+    return [tag.time for tag in record]
+
+
+class HostInfo():
+    address = HOST
+    database = DATABASE
+
+
+class TestTagArrayRecord(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_tag_archive(HOST, DATABASE, [1, 2, 3],
+                                       '2015-10-20 00:00:00',
+                                       '2015-10-28 00:00:00', interval=300)
+        self.driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+        self.chunk_config = dict(chunk_config)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        wincc.driver_name = self.driver_name
+        chunk_config.update(self.chunk_config)
+        close_all()
+        shutil.rmtree(self.tmp_dir)
+        simulator.reset()
+
+    def fetch(self, utc, columnar, timestep=0, mode='first', **kwargs):
+        return get_multiple_tag_records(HostInfo(), BEGIN, END, [1, 2, 3],
+                                        timestep, mode, utc,
+                                        columnar=columnar, **kwargs)
+
+    def test_same_as_tag_records(self):
+        for utc in (False, True):
+            arrays = self.fetch(utc, True, parallel=False)
+            records = self.fetch(utc, False, parallel=False)
+            self.assertTrue(all(isinstance(record, TagArrayRecord)
+                                for record in arrays))
+            self.assertEqual([record.tagid for record in arrays], [1, 2, 3])
+            self.assertEqual([list(record) for record in arrays],
+                             [list(record) for record in records])
+            for array, record in zip(arrays, records):
+                xs, ys = array.get_xs_ys()
+                self.assertEqual((xs, list(ys)), record.get_xs_ys())
+                self.assertEqual(array.to_csv(name='x'),
+                                 record.to_csv(name='x'))
+
+    def test_utc_same_on_every_path(self):
+        for utc in (False, True):
+            chunk_config.update(self.chunk_config)
+            expected = self.fetch(utc, False, 3600, 'avg', parallel=False)
+            expected = [times(record) for record in expected]
+            self.assertEqual(expected[0][0].tzinfo is None, utc)
+            batched = self.fetch(utc, True, 3600, 'avg')
+            self.assertEqual([times(record) for record in batched], expected)
+            cache = TagCache(os.path.join(self.tmp_dir, '%s.sqlite' % utc))
+            cached = self.fetch(utc, True, 3600, 'avg', parallel=False,
+                                cache=cache)
+            self.assertEqual([times(record) for record in cached], expected)
+            chunk_config.update(min_range=3600, initial_span=3600)
+            chunked = self.fetch(utc, True, 3600, 'avg', parallel=False)
+            self.assertEqual([times(record) for record in chunked], expected)
+
+    @unittest.skipIf(matplotlib is None, "matplotlib not installed")
+    def test_plot_and_vas_accept_arrays(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            plot_tag_records2(self.fetch(False, True)[:2], PLOT_CONFIG,
+                              show=False, save=True)
+            self.assertTrue(os.path.exists('1-2_0.png'))
+            config = dict(PLOT_CONFIG, tags=dict(PLOT_CONFIG['tags']))
+            with open('key_values_config.json', 'w') as fh:
+                json.dump(config, fh)
+            vas.get_daily_key_figures_avg(HostInfo(), datetime(2015, 10, 25))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from pywincc import simulator
+from pywincc.helper import str_to_datetime
+from pywincc.pool import close_all
+from pywincc.instrumentation import instrumentation
+from pywincc.tag_cache import TagCache
+from pywincc.wincc import wincc, get_cached_tag_records, \
+    get_multiple_tag_records
+
+HOST = r'plant\WINCC'
+DATABASE = 'CC_OS_1__15_01_08_16_40_41R'
+
+
+class HostInfo():
+    address = HOST
+    database = DATABASE
+
+
+class TestTagCache(unittest.TestCase):
+
+    def setUp(self):
+        simulator.reset()
+        simulator.create_runtime_database(HOST, DATABASE)
+        simulator.generate_tag_archive(HOST, DATABASE, [1, 2],
+                                       '2015-08-24 00:00:00',
+                                       '2015-08-24 04:00:00', interval=60)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = TagCache(os.path.join(self.tmp_dir, 'tags.sqlite'))
+        self.driver_name = wincc.driver_name
+        wincc.driver_name = 'simulator'
+        self.queries = []
+        instrumentation.add_callback(self.count_query)
+
+    def tearDown(self):
+        instrumentation.remove_callback(self.count_query)
+        wincc.driver_name = self.driver_name
+        close_all()
+        shutil.rmtree(self.tmp_dir)
+        simulator.reset()
+
+    def count_query(self, event):
+        if event['phase'] == 'execute':
+            self.queries.append(event)
+
+    def fetch(self, begin, end, cache, timestep=3600):
+        records = get_multiple_tag_records(HostInfo(), begin, end, [1, 2],
+                                           timestep, 'avg', utc=True,
+                                           parallel=False, cache=cache)
+        return [[tuple(tag) for tag in record] for record in records]
+
+    def test_only_missing_ranges_are_queried(self):
+        first = self.fetch('2015-08-24 00:00:00', '2015-08-24 02:00:00',
+                           self.cache)
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual([len(record) for record in first], [2, 2])
+
+        self.queries = []
+        second = self.fetch('2015-08-24 00:00:00', '2015-08-24 04:00:00',
+                            self.cache)
+        # Only 02:00 - 04:00 per tag
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(second, self.fetch('2015-08-24 00:00:00',
+                                            '2015-08-24 04:00:00', None))
+
+        self.queries = []
+        self.fetch('2015-08-24 01:00:00', '2015-08-24 03:00:00', self.cache)
+        self.assertEqual(self.queries, [])
+
+    def test_raw_values_include_end(self):
+        for begin, end in [('2015-08-24 00:00:00', '2015-08-24 02:00:00'),
+                           ('2015-08-24 01:00:00', '2015-08-24 03:00:00'),
+                           ('2015-08-24 00:30:00', '2015-08-24 02:00:00')]:
+            cached = self.fetch(begin, end, self.cache, 0)
+            self.assertEqual(cached, self.fetch(begin, end, None, 0))
+            self.assertEqual(cached[0][-1][0], str_to_datetime(end))
+        self.queries = []
+        self.fetch('2015-08-24 00:00:00', '2015-08-24 03:00:00', self.cache, 0)
+        self.assertEqual(self.queries, [])
+
+    def test_unaligned_range_is_not_cached(self):
+        self.assertIsNone(get_cached_tag_records(
+            HostInfo(), '2015-08-24 00:30:00', '2015-08-24 02:00:00', [1],
+            3600, 'avg', self.cache, utc=True))
+
+    def test_values_after_horizon_are_not_stored(self):
+        begin, end = datetime(2015, 8, 24, 0), datetime(2015, 8, 24, 3)
+        rows = [(datetime(2015, 8, 24, hour), float(hour))
+                for hour in range(3)]
+        stored_end = self.cache.store(HOST, 1, 3600, 'avg', begin, end, rows,
+                                      horizon=datetime(2015, 8, 24, 1, 30))
+        self.assertEqual(stored_end, datetime(2015, 8, 24, 1))
+        self.assertEqual(self.cache.load(HOST, 1, 3600, 'avg', begin, end),
+                         rows[:1])
+        self.assertEqual(self.cache.missing_ranges(HOST, 1, 3600, 'avg',
+                                                   begin, end),
+                         [(datetime(2015, 8, 24, 1), end)])
+
+    def test_values_with_equal_times_are_kept(self):
+        begin, end = datetime(2015, 8, 24, 0), datetime(2015, 8, 24, 1)
+        rows = [(datetime(2015, 8, 24, 0, 30), 1.0),
+                (datetime(2015, 8, 24, 0, 30), 2.0),
+                (datetime(2015, 8, 24, 0, 45), 3.0)]
+        self.cache.store(HOST, 1, 0, 'first', begin, end, rows,
+                         horizon=end)
+        # Stored again by a concurrent fetch
+        self.cache.store(HOST, 1, 0, 'first', begin, end, rows,
+                         horizon=end)
+        self.assertEqual(self.cache.load(HOST, 1, 0, 'first', begin, end),
+                         rows)
+
+    def test_old_schema_is_replaced(self):
+        filename = os.path.join(self.tmp_dir, 'old.sqlite')
+        conn = sqlite3.connect(filename)
+        conn.execute("CREATE TABLE samples (host TEXT, tagid INTEGER, "
+                     "timestep INTEGER, mode TEXT, time INTEGER, value REAL, "
+                     "PRIMARY KEY (host, tagid, timestep, mode, time))")
+        conn.close()
+        cache = TagCache(filename)
+        self.assertEqual(cache.intervals(HOST, 1, 0, 'first'), [])
+        begin, end = datetime(2015, 8, 24, 0), datetime(2015, 8, 24, 1)
+        rows = [(begin, 1.0), (begin, 2.0)]
+        cache.store(HOST, 1, 0, 'first', begin, end, rows, horizon=end)
+        self.assertEqual(cache.load(HOST, 1, 0, 'first', begin, end), rows)
+
+    def test_default_file_in_user_cache(self):
+        xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp_dir
+        try:
+            self.assertEqual(TagCache().filename,
+                             os.path.join(self.tmp_dir, 'pywincc',
+                                          'tag_cache.sqlite'))
+        finally:
+            if xdg_cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = xdg_cache_home
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timedelta
+from pywincc import tzconvert
+from pywincc.helper import utc_to_local
+from pywincc.tzconvert import localize, utc_ms_to_local_ms, \
+    get_transition_table
+
+ZONE = 'Europe/Berlin'
+
+
+class TestLocalize(unittest.TestCase):
+
+    def setUp(self):
+        # Minutes around both DST transitions of 2015 (UTC)
+        self.utc_times = []
+        for begin in (datetime(2015, 3, 29, 0, 0), datetime(2015, 10, 25, 0, 0)):
+            self.utc_times += [begin + timedelta(minutes=i, milliseconds=250)
+                               for i in range(0, 180, 7)]
+
+    def test_transitions(self):
+        table = get_transition_table(ZONE, datetime(2015, 1, 1),
+                                     datetime(2015, 12, 31))
+        self.assertEqual(table.start_datetimes[1:],
+                         [datetime(2015, 3, 29, 1), datetime(2015, 10, 25, 1)])
+        self.assertEqual(table.offsets, [3600, 7200, 3600])
+
+    def test_same_as_per_row(self):
+        expected = [utc_to_local(dt) for dt in self.utc_times]
+        local_times = localize(self.utc_times)
+        self.assertEqual([dt.isoformat() for dt in local_times],
+                         [dt.isoformat() for dt in expected])
+        # The repeated hour after the DST end keeps its UTC time
+        self.assertEqual([dt.utcoffset() for dt in local_times],
+                         [dt.utcoffset() for dt in expected])
+
+    def test_fallback(self):
+        tzconvert.use_tables = False
+        try:
+            local_times = localize(self.utc_times, ZONE)
+        finally:
+            tzconvert.use_tables = True
+        self.assertEqual(local_times, localize(self.utc_times, ZONE))
+
+    def test_epoch_ms(self):
+        epoch = datetime(1970, 1, 1)
+        epoch_ms = [int((dt - epoch).total_seconds() * 1000)
+                    for dt in self.utc_times]
+        expected = [int((dt.replace(tzinfo=None) - epoch).total_seconds()
+                        * 1000) for dt in localize(self.utc_times, ZONE)]
+        self.assertEqual(list(utc_ms_to_local_ms(epoch_ms, ZONE)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()